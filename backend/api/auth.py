@@ -2,18 +2,60 @@
 Authentication routes: signup, login, profile.
 """
 
+import os
 from fastapi import APIRouter, HTTPException, Depends, Header
-from bson.objectid import ObjectId
 from pydantic import BaseModel, EmailStr
-from services.database import client
-from utils.auth import hash_password, verify_password, create_access_token, decode_token
+from api.limits import rate_limit
+from services.cache import TTLCache
+from services.rate_limit import RateLimiter
+from services.repositories import UserRepository, get_user_repository
+from utils.auth import (
+    PasswordHasherBusy,
+    create_access_token,
+    decode_token,
+    hash_password_async,
+    verify_and_update_password_async,
+)
 from typing import Optional
 
 router = APIRouter()
 
-# Database collections
-db = client["dressly"]
-users_collection = db["users"]
+# Verified principals keyed by user id (PRINCIPAL_CACHE_TTL=0 disables the cache).
+# The JWT is still verified on every request; only the DB lookup is cached.
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+
+principal_cache = TTLCache(
+    "principals",
+    ttl=PRINCIPAL_CACHE_TTL,
+    max_entries=PRINCIPAL_CACHE_MAX_ENTRIES,
+)
+
+# Login and signup attempts per client IP: LOGIN_RATE_PER_MINUTE with bursts of
+# LOGIN_RATE_BURST (0 disables). Also caps password hashing work per client.
+LOGIN_RATE_PER_MINUTE = float(os.getenv("LOGIN_RATE_PER_MINUTE", "10"))
+LOGIN_RATE_BURST = float(os.getenv("LOGIN_RATE_BURST", "5"))
+
+login_limiter = RateLimiter("login", LOGIN_RATE_PER_MINUTE / 60, LOGIN_RATE_BURST)
+
+
+def hasher_busy() -> HTTPException:
+    """503 returned when the password hashing queue is full."""
+    return HTTPException(
+        status_code=503,
+        detail="Too many sign-in attempts right now, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+
+def invalidate_principal(user_id: str) -> None:
+    """
+    Drop a cached principal.
+
+    Call after every write to a user document; otherwise ``get_current_user``
+    may serve the old one for up to PRINCIPAL_CACHE_TTL seconds.
+    """
+    principal_cache.invalidate(user_id)
 
 
 class SignupRequest(BaseModel):
@@ -36,7 +78,10 @@ class UserResponse(BaseModel):
     email: str
 
 
-async def get_current_user(authorization: Optional[str] = Header(None)):
+async def get_current_user(
+    authorization: Optional[str] = Header(None),
+    users: UserRepository = Depends(get_user_repository),
+):
     """Dependency to get current user from JWT token."""
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Not authenticated")
@@ -48,39 +93,51 @@ async def get_current_user(authorization: Optional[str] = Header(None)):
         raise HTTPException(status_code=401, detail="Invalid token")
     
     user_id = payload.get("sub")
-
-    # Try to find by stored id. Some flows store as ObjectId, others as string.
-    user = users_collection.find_one({"_id": user_id})
-
-    if not user and user_id and ObjectId.is_valid(user_id):
-        try:
-            user = users_collection.find_one({"_id": ObjectId(user_id)})
-        except Exception:
-            user = None
+    user = await principal_cache.get_or_load(user_id, lambda: users.find_principal(user_id))
 
     if not user:
+        # Don't keep negative lookups around; the user may be created later
+        principal_cache.invalidate(user_id)
         raise HTTPException(status_code=401, detail="User not found")
 
     return user
 
 
-@router.post("/signup")
-async def signup(request: SignupRequest):
+def get_optional_user_id(authorization: Optional[str] = Header(None)) -> Optional[str]:
+    """
+    Dependency returning the user id from a valid bearer token, or None.
+
+    For routes open to anonymous users; the user isn't loaded, and a missing
+    or invalid token just means an anonymous request.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+    payload = decode_token(authorization.split(" ")[1])
+    return payload.get("sub") if payload else None
+
+
+@router.post("/signup", dependencies=[Depends(rate_limit(login_limiter))])
+async def signup(request: SignupRequest, users: UserRepository = Depends(get_user_repository)):
     """Register a new user."""
-    # Check if user already exists
-    existing_user = users_collection.find_one({"email": request.email})
-    if existing_user:
+    # Don't spend a hash on an address that is already taken
+    if await users.find_by_email(request.email):
         raise HTTPException(status_code=400, detail="Email already registered")
-    
-    # Create new user
+
+    try:
+        password_hash = await hash_password_async(request.password)
+    except PasswordHasherBusy:
+        raise hasher_busy()
+
+    # Create new user; the unique email index still rejects concurrent duplicates
     user_data = {
         "name": request.name,
         "email": request.email,
-        "password_hash": hash_password(request.password),
+        "password_hash": password_hash,
     }
     
-    result = users_collection.insert_one(user_data)
-    user_id = str(result.inserted_id)
+    user_id = await users.create(user_data)
+    if user_id is None:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create access token
     token = create_access_token({"sub": user_id})
@@ -95,20 +152,29 @@ async def signup(request: SignupRequest):
     }
 
 
-@router.post("/login")
-async def login(request: LoginRequest):
+@router.post("/login", dependencies=[Depends(rate_limit(login_limiter))])
+async def login(request: LoginRequest, users: UserRepository = Depends(get_user_repository)):
     """Authenticate a user."""
     # Find user
-    user = users_collection.find_one({"email": request.email})
+    user = await users.find_by_email(request.email)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Verify password
-    if not verify_password(request.password, user["password_hash"]):
+    try:
+        valid, new_hash = await verify_and_update_password_async(request.password, user["password_hash"])
+    except PasswordHasherBusy:
+        raise hasher_busy()
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     user_id = str(user["_id"])
-    
+
+    # Transparently upgrade hashes made with a different cost setting
+    if new_hash:
+        await users.update_password_hash(user["_id"], new_hash)
+        invalidate_principal(user_id)
+
     # Create access token
     token = create_access_token({"sub": user_id})
     
@@ -0,0 +1,51 @@
+"""
+Liveness and readiness probes.
+
+``/health/live`` only shows the process is serving requests. ``/health/ready``
+checks the upstreams: it returns 503 while MongoDB is unreachable (auth and
+wishlist can't work), and reports ``degraded`` when Gemini or H&M are not
+configured, since quizzes still work from fallbacks and the catalog mirror.
+"""
+
+import os
+from fastapi import APIRouter, Response
+from dotenv import load_dotenv
+from services import ai_model, database, hm_client
+
+load_dotenv()
+
+# Readiness pings must answer well inside the orchestrator's probe timeout
+READINESS_PING_TIMEOUT = float(os.getenv("READINESS_PING_TIMEOUT", "1"))
+
+router = APIRouter()
+
+
+@router.get("/live")
+async def liveness():
+    """The process is up and the event loop is responsive (async, so it runs on the loop, not the threadpool)."""
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def readiness(response: Response):
+    """Upstream status; 503 when the app can't serve its core routes."""
+    if database.client is None:
+        mongodb = "not configured"
+    elif await database.ping(READINESS_PING_TIMEOUT):
+        mongodb = "ok"
+    else:
+        mongodb = "unreachable"
+
+    checks = {
+        "mongodb": mongodb,
+        "gemini": ai_model.model_status(),
+        "hm": hm_client.status(),
+    }
+    if mongodb != "ok":
+        status = "unavailable"
+        response.status_code = 503
+    elif all(check == "ok" for check in checks.values()):
+        status = "ready"
+    else:
+        status = "degraded"
+    return {"status": status, "checks": checks}
@@ -0,0 +1,61 @@
+"""
+Per-client admission control for expensive routes.
+
+``rate_limit`` turns a ``RateLimiter`` into a route dependency that answers
+429 with ``Retry-After`` when the client is over its budget. Clients are
+identified by user id (from a valid bearer token) or by IP address.
+"""
+
+import math
+import os
+from typing import Callable, Optional
+from fastapi import HTTPException, Request
+from dotenv import load_dotenv
+from services.rate_limit import RateLimitExceeded, RateLimiter
+from utils.auth import decode_token
+
+load_dotenv()
+
+# Use the first X-Forwarded-For address as the client IP (only behind a trusted proxy)
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def client_key(request: Request, per_user: bool = False) -> str:
+    """``user:<id>`` for requests with a valid token (when ``per_user``), otherwise ``ip:<address>``."""
+    if per_user:
+        authorization = request.headers.get("authorization") or ""
+        if authorization.startswith("Bearer "):
+            payload: Optional[dict] = decode_token(authorization[7:])
+            if payload and payload.get("sub"):
+                return f"user:{payload['sub']}"
+    return f"ip:{client_ip(request)}"
+
+
+def rate_limit(limiter: RateLimiter, per_user: bool = False) -> Callable:
+    """
+    Build a dependency admitting a request only if ``limiter`` has a token for its client.
+
+    Args:
+        limiter: Limiter whose rate and burst apply to each client separately
+        per_user: Key signed-in users by user id instead of IP address
+    """
+
+    async def dependency(request: Request) -> None:
+        try:
+            await limiter.acquire(client_key(request, per_user), max_wait=0)
+        except RateLimitExceeded as e:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, please try again later",
+                headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+            )
+
+    return dependency
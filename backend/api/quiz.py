@@ -1,180 +1,342 @@
-from fastapi import APIRouter
-from models.quiz import QuizInput
-from services.ai_model import generate_style
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Awaitable, List, Optional, Sequence, Tuple
+import orjson
+from bson.objectid import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from api.auth import get_current_user, get_optional_user_id
+from api.limits import rate_limit
+from models.quiz import QuizInput, QuizResponse
+from services import quiz_history
+from services.ai_model import generate_style, stream_style
+from services.catalog import get_catalog
 from services.hm_client import hm_list_products
+from services.products import (
+    DEFAULT_PRODUCT_FIELDS,
+    extract_product_list,
+    normalize_products,
+    product_fields,
+    project_products,
+)
+from services.rate_limit import RateLimitExceeded, RateLimiter
+from services.repositories import QuizResultRepository, get_quiz_result_repository
+from services.resilience import CircuitOpenError
+from utils.log import log_payload
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
 
-@router.post("/submit")
-async def submit_quiz(data: QuizInput):
-    """Submit quiz answers and get AI-generated style recommendations with products."""
-    print("\n📋 QUIZ RECEIVED:")
-    print(data, "\n")
-
-    # Generate AI recommendations and product categories
-    ai_result = await generate_style(data.model_dump())
-    print("\n🔎 AI result dump:", ai_result)
-    
-    # Fetch products from H&M using generic "ladies/shop-by-product/view-all" category
-    # This ensures we always get products regardless of AI-generated category names
-    all_products = []
-    
-    # Try multiple category formats to find one that works
-    categories_to_try = [
-        "ladies_all",  # Simplified format
-        "ladies/shop-by-product/view-all",  # Full path format
-        "ladies",  # Minimal format
-    ]
-    
-    category = categories_to_try[0]  # Start with first one
-    print(f"Fetching products from category: {category}")
-    
+# Maximum number of products returned to the frontend
+MAX_PRODUCTS = 12
+
+# Seconds each product branch (base listing or one AI category) may take
+QUIZ_BRANCH_TIMEOUT = float(os.getenv("QUIZ_BRANCH_TIMEOUT", "8"))
+
+# Per-client quiz budget (signed-in users by id, others by IP): QUIZ_RATE_PER_MINUTE
+# with bursts of QUIZ_RATE_BURST; 0 disables the limit
+QUIZ_RATE_PER_MINUTE = float(os.getenv("QUIZ_RATE_PER_MINUTE", "20"))
+QUIZ_RATE_BURST = float(os.getenv("QUIZ_RATE_BURST", "5"))
+
+quiz_limiter = RateLimiter("quiz_submit", QUIZ_RATE_PER_MINUTE / 60, QUIZ_RATE_BURST)
+
+# History page size used when only a cursor is given, and the largest page allowed
+QUIZ_HISTORY_PAGE_SIZE = int(os.getenv("QUIZ_HISTORY_PAGE_SIZE", "10"))
+QUIZ_HISTORY_MAX_PAGE_SIZE = int(os.getenv("QUIZ_HISTORY_MAX_PAGE_SIZE", "50"))
+
+# Generic listing fetched for every quiz, regardless of AI-generated category names
+BASE_CATEGORY = "ladies_all"
+
+
+def _query_catalog(data: QuizInput, categories: Optional[List[str]] = None) -> Optional[list]:
+    catalog = get_catalog()
+    if catalog is None or catalog.is_empty():
+        return None
+    if categories and not any(catalog.has_category(c) for c in categories):
+        return None
+
+    filters = {
+        "categories": categories,
+        "min_price": data.budget.min,
+        "max_price": data.budget.max,
+        "colors": data.colors_like or None,
+        "sizes": [data.sizes.tops, data.sizes.bottoms],
+    }
+
+    for relaxed in (None, "colors", "sizes"):
+        if relaxed:
+            filters[relaxed] = None
+        products = catalog.query(**filters, limit=MAX_PRODUCTS)
+        if products:
+            return products
+    return []
+
+
+async def query_catalog(data: QuizInput, categories: Optional[List[str]] = None) -> Optional[list]:
+    """
+    Look up products in the local catalog mirror using the quiz filters.
+
+    Budget is always applied. If colors and sizes leave nothing, they are
+    relaxed in that order so the user still sees products in their budget.
+    The SQLite lookups run in a worker thread to keep them off the event loop.
+
+    Returns:
+        Matching products, or None when the mirror is empty or has not
+        synced any of ``categories``
+    """
+    return await asyncio.to_thread(_query_catalog, data, categories)
+
+
+async def fetch_live_products(category: str) -> list:
+    """Fetch products for ``category`` straight from H&M."""
+    logger.debug("Fetching products from category: %s", category)
+
+    products_data = await hm_list_products(category, page=1, size=30)
+    # Check for error response
+    if isinstance(products_data, dict) and 'error' in products_data:
+        logger.warning("H&M API error for category=%s: %s", category, products_data.get('message', 'Unknown error'))
+        log_payload(logger, "H&M error response", products_data, sample_rate=1.0)
+    return normalize_products(extract_product_list(products_data))
+
+
+async def fetch_base_products(data: QuizInput) -> list:
+    """Products from the whole catalog mirror, or the generic H&M listing if it's empty."""
+    products = await query_catalog(data)
+    if products:
+        return products
+    return await fetch_live_products(BASE_CATEGORY)
+
+
+async def fetch_category_products(data: QuizInput, category: str) -> list:
+    """Products for one AI-suggested category, from the mirror when it has been synced."""
+    products = await query_catalog(data, categories=[category])
+    if products is not None:
+        return products
     try:
-        products_data = await hm_list_products(category, page=1, size=30)
-        print(f"Products API response: keys={list(products_data.keys()) if isinstance(products_data, dict) else type(products_data)}")        
-        # Check for error response
-        if isinstance(products_data, dict) and 'error' in products_data:
-            print(f"❌ API Error: {products_data.get('message', 'Unknown error')}")
-            print(f"Full error response: {products_data}")
-        # H&M RapidAPI returns products nested in plpList.productList structure
-        raw_list = []
-        if isinstance(products_data, dict):
-            # The API returns: { plpList: { productList: [...products...], sortOptions: {...}, ... } }
-            if 'plpList' in products_data:
-                plp_data = products_data['plpList']
-                print(f"plpList type: {type(plp_data)}")
-                
-                # plpList is an object containing productList array
-                if isinstance(plp_data, dict):
-                    print(f"plpList keys: {list(plp_data.keys())}")
-                    if 'productList' in plp_data:
-                        raw_list = plp_data['productList']
-                        print(f"Extracted {len(raw_list)} products from plpList.productList")
-                        
-                        # Check numberOfHits to see if API has products available
-                        if 'numberOfHits' in plp_data:
-                            print(f"numberOfHits: {plp_data['numberOfHits']}")
-                    else:
-                        print(f"Warning: plpList doesn't contain productList key")
-                else:
-                    print(f"Warning: plpList is not a dict")
-            
-            # Fallback: check for productList at root level
-            elif 'productList' in products_data:
-                raw_list = products_data['productList']
-                print(f"Extracted {len(raw_list)} products from root productList")
-            
-            # Fallback: check for results array
-            elif 'results' in products_data:
-                raw_list = products_data['results']
-                print(f"Extracted {len(raw_list)} products from results")
-        
-        # Normalize items to the shape expected by the frontend
-        normalized = []
-        skipped_count = 0
-        for item in (raw_list or []):
-            try:
-                # Check if item is a string (likely product ID/code) instead of a dict
-                if isinstance(item, str):
-                    print(f"Item is a string: {item}")
-                    # Treat the string as the product code
-                    code = item
-                    # We'll need to construct a minimal product object
-                    normalized.append({
-                        'code': code,
-                        'name': f'Product {code}',
-                        'price': {'formattedValue': 'See H&M', 'currencyIso': 'USD'},
-                        'images': [{'url': f'https://image.hm.com/assets/hm/productpage/{code}.jpg'}],
-                    })
-                    continue
-                
-                # Common H&M fields: 'articleCode' or 'productCode'
-                code = str(item.get('articleCode') or item.get('productCode') or item.get('code') or item.get('id') or '')
-
-                # Name fields may vary
-                name = item.get('productName') or item.get('name') or item.get('articleName') or ''
-
-                # Price may be in 'prices' array, 'price' object, or 'articlePrice'
-                price_obj = {}
-                if isinstance(item.get('prices'), list) and item.get('prices'):
-                    # H&M API returns prices as array - use first price
-                    first_price = item['prices'][0]
-                    price_obj = {
-                        'formattedValue': first_price.get('formattedPrice', ''),
-                        'currencyIso': 'USD'
-                    }
-                elif isinstance(item.get('price'), dict):
-                    price_obj = {
-                        'formattedValue': item['price'].get('formattedValue') or item['price'].get('formatted') or '',
-                        'currencyIso': item['price'].get('currency') or item['price'].get('currencyIso') or ''
-                    }
-                elif isinstance(item.get('articlePrice'), dict):
-                    price_obj = {
-                        'formattedValue': item['articlePrice'].get('formatted') or '',
-                        'currencyIso': item['articlePrice'].get('currency') or ''
-                    }
-                else:
-                    # Fallbacks
-                    price_obj = {'formattedValue': item.get('price', '') or item.get('formattedPrice', ''), 'currencyIso': ''}
-
-                # Images: try several possible keys
-                images = []
-                # H&M API has productImage as main image
-                if item.get('productImage'):
-                    images.append({'url': item['productImage']})
-                
-                # Also check images array
-                if isinstance(item.get('images'), list) and item.get('images'):
-                    for img in item['images']:
-                        if isinstance(img, dict):
-                            url = img.get('url') or img.get('imageUrl') or img.get('src')
-                            if url and not any(i['url'] == url for i in images):
-                                images.append({'url': url})
-                
-                # Fallbacks for other structures
-                if not images:
-                    if item.get('image'):
-                        images = [{'url': item['image']}]
-                    elif item.get('mainImage'):
-                        images = [{'url': item['mainImage']}]
-                    elif isinstance(item.get('plpImage'), dict):
-                        url = item['plpImage'].get('url') or item['plpImage'].get('src')
-                        if url:
-                            images.append({'url': url})
-
-                if not code:
-                    skipped_count += 1
-                    print(f"Skipping item (no code): {list(item.keys())[:5] if isinstance(item, dict) else type(item)}")
-                    continue
-
-                normalized.append({
-                    'code': code,
-                    'name': name,
-                    'price': price_obj,
-                    'images': images or [{'url': ''}],
-                    'raw': item,
-                })
-            except Exception as e:
-                skipped_count += 1
-                print(f"Exception normalizing item: {e}")
-                continue
+        return await fetch_live_products(category)
+    except (RateLimitExceeded, CircuitOpenError) as e:
+        # H&M over budget or down: products from any mirrored category beat none
+        logger.warning("%s; using the catalog mirror for '%s'", e, category)
+        return await query_catalog(data) or []
+
 
-        print(f"Normalized {len(normalized)} products, skipped {skipped_count}")
-        all_products.extend(normalized)
+async def run_branch(label: str, branch: Awaitable[list]) -> list:
+    """Await one product branch under QUIZ_BRANCH_TIMEOUT. Failures yield no products."""
+    try:
+        return await asyncio.wait_for(branch, timeout=QUIZ_BRANCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Product branch '%s' timed out after %ss", label, QUIZ_BRANCH_TIMEOUT)
     except Exception as e:
-        print(f"⚠️ Failed to fetch products: {e}")
+        logger.warning("Failed to fetch products for '%s': %s", label, e)
+    return []
 
-    print(f"Total products found: {len(all_products)}")
-    
-    # Limit to 12 total products
-    all_products = all_products[:12]
 
-    return {
+def merge_products(groups: List[list], limit: int = MAX_PRODUCTS) -> list:
+    """Concatenate product groups in order, dropping duplicate codes, up to ``limit``."""
+    merged = []
+    seen = set()
+    for group in groups:
+        for product in group:
+            code = product.get('code')
+            if code in seen:
+                continue
+            seen.add(code)
+            merged.append(product)
+            if len(merged) >= limit:
+                return merged
+    return merged
+
+
+@router.post(
+    "/submit",
+    response_model=QuizResponse,
+    response_model_exclude_unset=True,
+    dependencies=[Depends(rate_limit(quiz_limiter, per_user=True))],
+)
+async def submit_quiz(
+    data: QuizInput,
+    fields: Tuple[str, ...] = Depends(product_fields),
+    include_input: bool = Query(False, description="Echo the submitted quiz back in the response"),
+    user_id: Optional[str] = Depends(get_optional_user_id),
+):
+    """
+    Submit quiz answers and get AI-generated style recommendations with products.
+
+    The outcome is saved in the background; signed-in users find it in ``/quiz/history``.
+    """
+    log_payload(logger, "Quiz received", data.model_dump())
+
+    # The base product fetch doesn't depend on the AI result, so run both at once
+    base_task = asyncio.create_task(run_branch(BASE_CATEGORY, fetch_base_products(data)))
+    try:
+        ai_result = await generate_style(data.model_dump())
+    except BaseException:
+        base_task.cancel()
+        raise
+    log_payload(logger, "AI result", ai_result)
+
+    # Fan out to the categories Gemini suggested while the base fetch finishes
+    ai_categories = [c for c in dict.fromkeys(ai_result['categories']) if c and c != BASE_CATEGORY]
+    category_groups = await asyncio.gather(
+        *(run_branch(category, fetch_category_products(data, category)) for category in ai_categories)
+    )
+
+    # AI-suggested categories first, then the generic listing to fill up
+    all_products = merge_products([*category_groups, await base_task])
+    logger.debug("Total products found: %d", len(all_products))
+
+    response = {
         "status": "success",
-        "input": data,
         "recommendation": ai_result['text'],
-        "products": all_products,
+        "products": project_products(all_products, fields),
         "categories_searched": ai_result['categories']
     }
+    if include_input:
+        response["input"] = data
+    quiz_history.record(user_id, data.model_dump(), ai_result, all_products)
+    return response
+
+
+def sse_event(event: str, payload: dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {orjson.dumps(payload).decode()}\n\n"
+
+
+async def stream_quiz_events(
+    data: QuizInput,
+    fields: Sequence[str] = DEFAULT_PRODUCT_FIELDS,
+    user_id: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Produce the SSE stream for ``/quiz/submit/stream``.
+
+    A completed stream is saved to the quiz history like ``/submit``.
+
+    Events, in the order they become available:
+      - ``products``: ``{"products": [...]}``, sent as each product branch returns
+      - ``token``: ``{"text": "..."}``, recommendation text as Gemini generates it
+      - ``error``: ``{"detail": "..."}``, if the AI call fails
+      - ``done``: ``{"categories_searched": [...]}``, always last
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    seen_codes = set()
+    sent_products = []
+
+    def take_new(products: list) -> list:
+        """Products not sent yet, within the overall MAX_PRODUCTS cap."""
+        room = MAX_PRODUCTS - len(seen_codes)
+        fresh = merge_products([[p for p in products if p.get('code') not in seen_codes]], limit=max(room, 0))
+        seen_codes.update(p.get('code') for p in fresh)
+        sent_products.extend(fresh)
+        return project_products(fresh, fields)
+
+    async def produce_base():
+        await queue.put(("base", await run_branch(BASE_CATEGORY, fetch_base_products(data))))
+
+    async def produce_ai():
+        try:
+            async for kind, value in stream_style(data.model_dump()):
+                await queue.put((kind, value))
+        except Exception as e:
+            logger.exception("AI streaming error")
+            await queue.put(("error", str(e)))
+
+    tasks = [asyncio.create_task(produce_base()), asyncio.create_task(produce_ai())]
+    try:
+        ai_result = None
+        pending = len(tasks)
+        while pending:
+            kind, value = await queue.get()
+            if kind == "token":
+                yield sse_event("token", {"text": value})
+                continue
+
+            pending -= 1
+            if kind == "base":
+                products = take_new(value)
+                if products:
+                    yield sse_event("products", {"products": products})
+            elif kind == "result":
+                ai_result = value
+            elif kind == "error":
+                yield sse_event("error", {"detail": "Failed to generate recommendations"})
+
+        categories = ai_result['categories'] if ai_result else []
+        ai_categories = [c for c in dict.fromkeys(categories) if c and c != BASE_CATEGORY]
+        branches = [
+            asyncio.ensure_future(run_branch(category, fetch_category_products(data, category)))
+            for category in ai_categories
+        ]
+        tasks.extend(branches)
+        for branch in asyncio.as_completed(branches):
+            products = take_new(await branch)
+            if products:
+                yield sse_event("products", {"products": products})
+
+        yield sse_event("done", {"categories_searched": categories})
+        if ai_result:
+            quiz_history.record(user_id, data.model_dump(), ai_result, sent_products)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@router.post("/submit/stream", dependencies=[Depends(rate_limit(quiz_limiter, per_user=True))])
+async def submit_quiz_stream(
+    data: QuizInput,
+    fields: Tuple[str, ...] = Depends(product_fields),
+    user_id: Optional[str] = Depends(get_optional_user_id),
+):
+    """Streaming variant of ``/submit`` using Server-Sent Events."""
+    return StreamingResponse(
+        stream_quiz_events(data, fields, user_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            # The compression middleware buffers streamed bodies; an explicit
+            # encoding makes it pass events through as they are produced
+            "Content-Encoding": "identity",
+        },
+    )
+
+
+def history_item(result: dict, fields: Sequence[str]) -> dict:
+    """A stored quiz result as returned by ``/history``."""
+    return {
+        "id": str(result["_id"]),
+        "created_at": result.get("created_at"),
+        "quiz_answers": result.get("quiz_answers", {}),
+        "recommendation": result.get("recommendation", ""),
+        "categories_searched": result.get("categories_searched", []),
+        "products": project_products(result.get("products") or [], fields),
+    }
+
+
+@router.get("/history")
+async def quiz_history_page(
+    limit: Optional[int] = Query(None, ge=1, le=QUIZ_HISTORY_MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Tuple[str, ...] = Depends(product_fields),
+    user = Depends(get_current_user),
+    results: QuizResultRepository = Depends(get_quiz_result_repository),
+):
+    """
+    The signed-in user's past quiz results, newest first, without calling Gemini again.
 
+    Results are saved in the background and appear within about a second
+    (QUIZ_HISTORY_FLUSH_INTERVAL) of the submission.
+    """
+    before = None
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        before = ObjectId(cursor)
+
+    page, has_more = await results.list_page(str(user["_id"]), limit or QUIZ_HISTORY_PAGE_SIZE, before)
+    return {
+        "items": [history_item(result, fields) for result in page],
+        "next_cursor": str(page[-1]["_id"]) if has_more else None,
+    }
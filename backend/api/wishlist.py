@@ -2,17 +2,36 @@
 Wishlist routes: save, retrieve, remove items.
 """
 
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from services.database import client
+import base64
+import os
+import asyncio
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional, Tuple
+from bson.objectid import ObjectId
+from fastapi import APIRouter, HTTPException, Depends, Query
+from pydantic import BaseModel, Field
+from services.repositories import (
+    ProductRepository,
+    WishlistRepository,
+    get_product_repository,
+    get_wishlist_repository,
+)
+from services.products import normalize_record, product_fields, project_products
 from api.auth import get_current_user
-from typing import List
 
 router = APIRouter()
 
-# Database collections
-db = client["dressly"]
-wishlist_collection = db["wishlist"]
+# Page size used when only a cursor is given, and the largest page allowed
+WISHLIST_PAGE_SIZE = int(os.getenv("WISHLIST_PAGE_SIZE", "50"))
+WISHLIST_MAX_PAGE_SIZE = int(os.getenv("WISHLIST_MAX_PAGE_SIZE", "200"))
+# Most items accepted by one bulk add/remove request
+WISHLIST_BULK_MAX = int(os.getenv("WISHLIST_BULK_MAX", "100"))
+
+# Rows resolved per products lookup when returning the whole wishlist
+WISHLIST_RESOLVE_BATCH = 100
+
+# Cursors carry added_at as milliseconds since this (naive UTC, like PyMongo returns)
+CURSOR_EPOCH = datetime(1970, 1, 1)
 
 
 class WishlistItemRequest(BaseModel):
@@ -23,85 +42,170 @@ class WishlistItemRequest(BaseModel):
     images: List[dict]
 
 
+class WishlistBulkAddRequest(BaseModel):
+    """Request model for adding several products at once."""
+    items: List[WishlistItemRequest] = Field(..., min_length=1, max_length=WISHLIST_BULK_MAX)
+
+
+class WishlistBulkRemoveRequest(BaseModel):
+    """Request model for removing several products at once."""
+    codes: List[str] = Field(..., min_length=1, max_length=WISHLIST_BULK_MAX)
+
+
+def build_product(item: WishlistItemRequest) -> dict:
+    """Normalize a saved item into the shared product shape."""
+    product = normalize_record(item.model_dump())
+    if product is None:
+        raise HTTPException(status_code=400, detail="Product code is required")
+    return product.to_dict(include_raw=False)
+
+
+def build_wishlist_row(user_id: str, product_code: str) -> dict:
+    """Wishlist rows only reference the product; its data lives in ``products``."""
+    return {"user_id": user_id, "product_code": product_code, "added_at": datetime.utcnow()}
+
+
+async def resolve_rows(rows: List[dict], products: ProductRepository, fields: Tuple[str, ...]) -> List[dict]:
+    """Turn wishlist rows into products (keeping ``fields``) with one batched lookup."""
+    found = await products.get_many(row["product_code"] for row in rows)
+    return project_products(
+        [found.get(row["product_code"]) or {"code": row["product_code"]} for row in rows],
+        fields,
+    )
+
+
+def encode_cursor(item: dict) -> str:
+    """Opaque cursor pointing just after ``item``."""
+    millis = (item.get("added_at", CURSOR_EPOCH) - CURSOR_EPOCH) // timedelta(milliseconds=1)
+    raw = f"{millis}:{item['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Parse a cursor from ``encode_cursor``; raises 400 if it's malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        millis, item_id = raw.split(":", 1)
+        return CURSOR_EPOCH + timedelta(milliseconds=int(millis)), ObjectId(item_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def collect_wishlist(
+    rows: AsyncIterator[dict],
+    products: ProductRepository,
+    fields: Tuple[str, ...],
+) -> List[dict]:
+    """
+    Resolve every row from the DB cursor, WISHLIST_RESOLVE_BATCH rows per products lookup.
+
+    The list is built before anything is sent, so a DB error mid-cursor
+    becomes an error response instead of a 200 with truncated JSON.
+    """
+    items = []
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= WISHLIST_RESOLVE_BATCH:
+            items.extend(await resolve_rows(batch, products, fields))
+            batch = []
+    if batch:
+        items.extend(await resolve_rows(batch, products, fields))
+    return items
+
+
 @router.post("")
-async def add_to_wishlist(item: WishlistItemRequest, user = Depends(get_current_user)):
+async def add_to_wishlist(
+    item: WishlistItemRequest,
+    user = Depends(get_current_user),
+    wishlist: WishlistRepository = Depends(get_wishlist_repository),
+    products: ProductRepository = Depends(get_product_repository),
+):
     """Add a product to user's wishlist."""
-    user_id = str(user["_id"])
-    
-    # Check if already in wishlist
-    existing = wishlist_collection.find_one({
-        "user_id": user_id,
-        "product_code": item.code
-    })
-    
-    if existing:
-        return {"message": "Item already in wishlist"}
-    
-    # Normalize price: accept multiple keys used across responses
-    price_raw = item.price or {}
-    product_price = (
-        price_raw.get("formattedPrice") or
-        price_raw.get("formattedValue") or
-        price_raw.get("formatted") or
-        ""
+    product = build_product(item)
+
+    # Store the product if it's new and upsert the row (inserted only if the
+    # user hasn't saved this product yet) concurrently. The client's copy never
+    # replaces a stored product: that one is shared by every wishlist and only
+    # product_refresh updates it from H&M
+    _, added = await asyncio.gather(
+        products.save(product, overwrite=False),
+        wishlist.add(build_wishlist_row(str(user["_id"]), product["code"])),
     )
+    if not added:
+        return {"message": "Item already in wishlist"}
 
-    # Normalize image URL from common keys
-    image_url = ""
-    if item.images and len(item.images) > 0:
-        first = item.images[0]
-        image_url = first.get("url") or first.get("imageUrl") or first.get("src") or ""
-
-    # Build wishlist record and store full payload for frontend flexibility
-    wishlist_item = {
-        "user_id": user_id,
-        "product_code": item.code,
-        "product_name": item.name,
-        "product_price": product_price,
-        "product_image": image_url,
-        "product_payload": item.dict(),
-    }
+    return {"message": "Item added to wishlist"}
 
-    wishlist_collection.insert_one(wishlist_item)
 
-    return {"message": "Item added to wishlist"}
+@router.post("/bulk")
+async def add_many_to_wishlist(
+    request: WishlistBulkAddRequest,
+    user = Depends(get_current_user),
+    wishlist: WishlistRepository = Depends(get_wishlist_repository),
+    products: ProductRepository = Depends(get_product_repository),
+):
+    """Add several products to user's wishlist in one write per collection."""
+    user_id = str(user["_id"])
+    # Last occurrence wins if a code is repeated in the request
+    saved = {product["code"]: product for product in map(build_product, request.items)}
+
+    _, added = await asyncio.gather(
+        products.save_many(saved.values(), overwrite=False),
+        wishlist.add_many([build_wishlist_row(user_id, code) for code in saved]),
+    )
+    return {"added": added, "already_saved": len(saved) - added}
 
 
 @router.get("")
-async def get_wishlist(user = Depends(get_current_user)):
-    """Get user's wishlist."""
+async def get_wishlist(
+    limit: Optional[int] = Query(
+        None, ge=1, le=WISHLIST_MAX_PAGE_SIZE,
+        description="Page size. Without limit or cursor the whole wishlist is returned",
+    ),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Tuple[str, ...] = Depends(product_fields),
+    user = Depends(get_current_user),
+    wishlist: WishlistRepository = Depends(get_wishlist_repository),
+    products: ProductRepository = Depends(get_product_repository),
+):
+    """Get user's wishlist, oldest first."""
     user_id = str(user["_id"])
-    
-    items = list(wishlist_collection.find({"user_id": user_id}))
-    
-    # Convert to product format
-    products = []
-    for item in items:
-        payload = item.get("product_payload")
-        if payload:
-            products.append(payload)
-        else:
-            products.append({
-                "code": item["product_code"],
-                "name": item["product_name"],
-                "price": {"formattedValue": item["product_price"]},
-                "images": [{"url": item["product_image"]}]
-            })
-
-    return {"items": products}
+
+    if limit is None and cursor is None:
+        return {"items": await collect_wishlist(wishlist.iter_for_user(user_id), products, fields)}
+
+    after = decode_cursor(cursor) if cursor else None
+    rows, has_more = await wishlist.list_page(user_id, limit or WISHLIST_PAGE_SIZE, after)
+    return {
+        "items": await resolve_rows(rows, products, fields),
+        "next_cursor": encode_cursor(rows[-1]) if has_more else None,
+    }
 
 
 @router.delete("/{product_code}")
-async def remove_from_wishlist(product_code: str, user = Depends(get_current_user)):
+async def remove_from_wishlist(
+    product_code: str,
+    user = Depends(get_current_user),
+    wishlist: WishlistRepository = Depends(get_wishlist_repository),
+):
     """Remove a product from user's wishlist."""
     user_id = str(user["_id"])
     
-    result = wishlist_collection.delete_one({
-        "user_id": user_id,
-        "product_code": product_code
-    })
+    removed = await wishlist.remove(user_id, product_code)
     
-    if result.deleted_count == 0:
+    if not removed:
         raise HTTPException(status_code=404, detail="Item not found in wishlist")
     
     return {"message": "Item removed from wishlist"}
+
+
+@router.post("/bulk/remove")
+async def remove_many_from_wishlist(
+    request: WishlistBulkRemoveRequest,
+    user = Depends(get_current_user),
+    wishlist: WishlistRepository = Depends(get_wishlist_repository),
+):
+    """Remove several products from user's wishlist in one write."""
+    removed = await wishlist.remove_many(str(user["_id"]), list(dict.fromkeys(request.codes)))
+    return {"removed": removed}
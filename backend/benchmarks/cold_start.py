@@ -0,0 +1,130 @@
+"""
+Cold-start benchmark: how long a fresh worker takes to serve its first request.
+
+Each run starts a new interpreter that imports ``main``, runs the FastAPI
+lifespan startup and answers ``/health/live``. Reported per phase (median,
+min and max over the runs) as JSON:
+
+- ``import_ms``: importing ``main`` (all modules, no clients created)
+- ``startup_ms``: the lifespan startup (clients, pools, pings)
+- ``first_request_ms``: the first ``/health/live`` request
+- ``total_ms``: wall time from process spawn to the first response
+
+Run from the backend directory:
+
+    python -m benchmarks.cold_start [--runs 5] [--json]
+
+By default the children see no MONGODB_URI/GEMINI_API_KEY/RAPIDAPI_KEY, so
+this measures a degraded offline start; export the real settings (and
+``--inherit-env``) to include connecting to them.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+
+async def run():
+    import httpx
+    async with main.app.router.lifespan_context(main.app):
+        t2 = time.perf_counter()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://cold.start") as client:
+            (await client.get("/health/live")).raise_for_status()
+        t3 = time.perf_counter()
+    return t2, t3
+
+t2, t3 = asyncio.run(run())
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "startup_ms": (t2 - t1) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    "gemini_sdk_imported": "google.generativeai" in sys.modules,
+}))
+"""
+
+# Settings that would make children talk to real upstreams
+UPSTREAM_SETTINGS = ("MONGODB_URI", "GEMINI_API_KEY", "RAPIDAPI_KEY", "HM_BASE_URL")
+
+
+def child_env(inherit: bool) -> dict:
+    env = dict(os.environ)
+    env.update(
+        LOG_LEVEL="CRITICAL",
+        CATALOG_SYNC_INTERVAL="0",
+        PRODUCT_REFRESH_INTERVAL="0",
+        RECOMMENDATION_CACHE_PATH="",
+        RECOMMENDATION_PRECOMPUTED_PATH="",
+        CATALOG_DB_PATH=":memory:",
+        PYTHONDONTWRITEBYTECODE="1",
+    )
+    if not inherit:
+        for name in UPSTREAM_SETTINGS:
+            env[name] = ""
+    return env
+
+
+def measure(runs: int, inherit: bool) -> dict:
+    samples = []
+    env = child_env(inherit)
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD],
+            cwd=BACKEND_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        total = (time.perf_counter() - start) * 1000
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample["total_ms"] = total
+        samples.append(sample)
+
+    phases = {}
+    for phase in ("import_ms", "startup_ms", "first_request_ms", "total_ms"):
+        values = [sample[phase] for sample in samples]
+        phases[phase] = {
+            "median": round(statistics.median(values), 1),
+            "min": round(min(values), 1),
+            "max": round(max(values), 1),
+        }
+    return {
+        "runs": runs,
+        "upstreams": "inherited" if inherit else "none (degraded start)",
+        "gemini_sdk_imported": any(sample["gemini_sdk_imported"] for sample in samples),
+        "phases": phases,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--inherit-env", action="store_true", help="Pass upstream settings through to the children")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    result = measure(args.runs, args.inherit_env)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"Cold start over {result['runs']} runs, upstreams: {result['upstreams']}")
+    for phase, stats in result["phases"].items():
+        print(f"  {phase:<18} median {stats['median']:>8.1f}  min {stats['min']:>8.1f}  max {stats['max']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Local stand-in for the Gemini model used by ``services.ai_model``.
+
+Answers in the JSON format of ``ai_model.RESPONSE_SCHEMA`` when the call
+asks for JSON (the RECOMMENDATIONS/CATEGORIES text format otherwise), after a
+configurable delay, optionally failing a share of calls. Responses carry
+approximate ``usage_metadata``. Install it with
+``ai_model.init_model(FakeGeminiModel(...))``.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+from types import SimpleNamespace
+from typing import AsyncIterator, Optional
+from google.api_core import exceptions as gcloud_exceptions
+
+CATEGORIES = (
+    "men_trousers", "men_shirts", "men_jeans", "men_blazerssuits",
+    "women_dresses", "women_tops", "women_jeans", "women_blazerssuits",
+)
+
+RECOMMENDATION = """Outfit: tailored trousers, a crisp shirt and clean white sneakers.
+Tips: keep the palette tight, match belt and shoes, roll sleeves once.
+Palette: navy, white and camel.
+Avoid: loud logos and oversized fits."""
+
+ANSWER = """RECOMMENDATIONS:
+{recommendation}
+
+CATEGORIES:
+{categories}
+"""
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+class FakeResponse:
+    def __init__(self, text: str, usage_metadata: Optional[SimpleNamespace] = None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class FakeGeminiModel:
+    """
+    Mimics ``GenerativeModel.generate_content_async`` (plain and ``stream=True``).
+
+    Args:
+        latency_ms: Time until the full answer is available
+        error_rate: Share of calls raising ``ServiceUnavailable``
+        seed: Seed for the error injection, for reproducible runs
+    """
+
+    def __init__(self, latency_ms: float = 0, error_rate: float = 0, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    def answer(self, prompt: str, as_json: bool = False) -> str:
+        """A stable answer per prompt, naming three categories."""
+        digest = int(hashlib.sha256(prompt.encode()).hexdigest()[:8], 16)
+        picked = list(dict.fromkeys(CATEGORIES[(digest + i * 3) % len(CATEGORIES)] for i in range(3)))
+        if as_json:
+            return json.dumps({"recommendation": RECOMMENDATION, "categories": picked})
+        return ANSWER.format(recommendation=RECOMMENDATION, categories=", ".join(picked))
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, **kwargs):
+        self.calls += 1
+        if self.error_rate and self._rng.random() < self.error_rate:
+            await asyncio.sleep(self.latency_ms / 2000)
+            raise gcloud_exceptions.ServiceUnavailable("Injected Gemini error")
+
+        config = kwargs.get("generation_config") or {}
+        text = self.answer(prompt, as_json=config.get("response_mime_type") == "application/json")
+        usage = SimpleNamespace(prompt_token_count=count_tokens(prompt), candidates_token_count=count_tokens(text))
+        if stream:
+            return self._stream(text, usage)
+        await asyncio.sleep(self.latency_ms / 1000)
+        return FakeResponse(text, usage)
+
+    async def _stream(self, text: str, usage: SimpleNamespace, chunks: int = 8) -> AsyncIterator[FakeResponse]:
+        size = -(-len(text) // chunks)
+        for start in range(0, len(text), size):
+            await asyncio.sleep(self.latency_ms / 1000 / chunks)
+            last = start + size >= len(text)
+            yield FakeResponse(text[start:start + size], usage if last else None)
@@ -0,0 +1,152 @@
+"""
+Local fake of the RapidAPI H&M endpoints used by the backend.
+
+Serves ``/products/v2/list`` from the sample listing in
+``fixtures/hm_listing_sample.json`` and ``/products/detail`` for any code, so
+jobs such as the wishlist product refresh can run without network access:
+
+    python -m benchmarks.fake_hm --port 8099 [--latency-ms 50] [--price-shift 1.5] [--error-rate 0.05] [--tail-rate 0.05]
+    HM_BASE_URL=http://127.0.0.1:8099 python -m services.product_refresh
+
+``create_app`` builds the same app for in-process use with
+``httpx.ASGITransport``.
+"""
+
+import argparse
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import random
+from typing import Optional
+from fastapi import FastAPI, HTTPException
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "hm_listing_sample.json")
+
+
+def load_sample() -> list:
+    with open(FIXTURE) as f:
+        return json.load(f)["plpList"]["productList"]
+
+
+def base_price(code: str, sample_prices: dict) -> float:
+    """The listing price for sample codes, otherwise a stable price derived from the code."""
+    if code in sample_prices:
+        return sample_prices[code]
+    digest = int(hashlib.sha256(code.encode()).hexdigest()[:8], 16)
+    return round(5 + (digest % 9000) / 100, 2)
+
+
+def create_app(
+    latency_ms: float = 0,
+    price_shift: float = 0,
+    missing_prefix: Optional[str] = "missing",
+    error_rate: float = 0,
+    seed: Optional[int] = None,
+    tail_rate: float = 0,
+    tail_latency_ms: float = 2000,
+) -> FastAPI:
+    """
+    Build the fake H&M app.
+
+    Args:
+        latency_ms: Delay added to every response
+        price_shift: Amount added to every detail price, to simulate price changes
+        missing_prefix: Codes starting with this return 404 from the detail endpoint
+        error_rate: Share of requests answered with a 503, to simulate upstream failures
+        seed: Seed for the error and tail injection, for reproducible runs
+        tail_rate: Share of requests delayed by ``tail_latency_ms`` instead of ``latency_ms``
+        tail_latency_ms: Delay of the slow requests, to simulate a long latency tail
+    """
+    app = FastAPI(title="Fake H&M API")
+    sample = load_sample()
+    sample_prices = {item["id"]: item["prices"][0]["price"] for item in sample}
+    sample_names = {item["id"]: item["productName"] for item in sample}
+    stats = {"list": 0, "detail": 0, "errors": 0, "slow": 0}
+    app.state.stats = stats
+    rng = random.Random(seed)
+
+    async def delay() -> None:
+        wait_ms = latency_ms
+        if tail_rate and rng.random() < tail_rate:
+            stats["slow"] += 1
+            wait_ms = tail_latency_ms
+        if wait_ms:
+            await asyncio.sleep(wait_ms / 1000)
+        if error_rate and rng.random() < error_rate:
+            stats["errors"] += 1
+            raise HTTPException(status_code=503, detail="Injected upstream error")
+
+    @app.get("/products/v2/list")
+    async def list_products(categoryId: str, currentPage: int = 1, pageSize: int = 30):
+        stats["list"] += 1
+        await delay()
+        items = []
+        for i in range(pageSize):
+            item = copy.deepcopy(sample[i % len(sample)])
+            # Unique, stable codes per category and page
+            item["id"] = f"{item['id'][:7]}{(currentPage - 1) * pageSize + i:03d}"
+            item["mainCatCode"] = categoryId
+            items.append(item)
+        return {"plpList": {"numberOfHits": pageSize * 3, "productList": items}}
+
+    @app.get("/products/detail")
+    async def product_detail(productcode: str):
+        stats["detail"] += 1
+        await delay()
+        if missing_prefix and productcode.startswith(missing_prefix):
+            raise HTTPException(status_code=404, detail="Product not found")
+
+        price = round(base_price(productcode, sample_prices) + price_shift, 2)
+        name = sample_names.get(productcode, f"Product {productcode}")
+        return {
+            "responseStatusCode": "ok",
+            "product": {
+                "code": productcode[:7],
+                "name": name,
+                "articlesList": [
+                    {
+                        "code": productcode,
+                        "name": name,
+                        "whitePrice": {"price": price, "currency": "USD"},
+                        "galleryDetails": [
+                            {"baseUrl": f"https://image.hm.com/assets/hm/{productcode}.jpg"},
+                        ],
+                    }
+                ],
+            },
+        }
+
+    @app.get("/_stats")
+    async def request_stats():
+        return stats
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--price-shift", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--tail-rate", type=float, default=0)
+    parser.add_argument("--tail-latency-ms", type=float, default=2000)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = create_app(
+        args.latency_ms,
+        args.price_shift,
+        error_rate=args.error_rate,
+        tail_rate=args.tail_rate,
+        tail_latency_ms=args.tail_latency_ms,
+    )
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
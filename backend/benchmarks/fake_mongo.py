@@ -0,0 +1,105 @@
+"""
+In-memory MongoDB for benchmarks: ``mongomock`` behind the subset of the
+PyMongo async API the repositories use.
+
+Pass an ``AsyncMockClient`` to ``database.init_database``. Every operation
+can be given a fixed delay to approximate a networked server. For numbers
+closer to production, point the load harness at a real ``mongod`` instead.
+"""
+
+import asyncio
+from typing import Any, List, Optional
+
+try:
+    import mongomock
+except ImportError:  # pragma: no cover - benchmark-only dependency
+    mongomock = None
+
+
+class AsyncMockCursor:
+    def __init__(self, cursor, latency: float):
+        self._cursor = cursor
+        self._latency = latency
+
+    def sort(self, *args, **kwargs) -> "AsyncMockCursor":
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, limit: int) -> "AsyncMockCursor":
+        self._cursor = self._cursor.limit(limit)
+        return self
+
+    def skip(self, skip: int) -> "AsyncMockCursor":
+        self._cursor = self._cursor.skip(skip)
+        return self
+
+    def batch_size(self, size: int) -> "AsyncMockCursor":
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        docs = list(self._cursor)
+        return docs if length is None else docs[:length]
+
+    async def __aiter__(self):
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        for doc in self._cursor:
+            yield doc
+
+
+class AsyncMockCollection:
+    def __init__(self, collection, latency: float):
+        self._collection = collection
+        self._latency = latency
+
+    def find(self, *args, **kwargs) -> AsyncMockCursor:
+        return AsyncMockCursor(self._collection.find(*args, **kwargs), self._latency)
+
+    async def aggregate(self, *args, **kwargs) -> AsyncMockCursor:
+        return AsyncMockCursor(iter(list(self._collection.aggregate(*args, **kwargs))), self._latency)
+
+    def __getattr__(self, name: str) -> Any:
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            if self._latency:
+                await asyncio.sleep(self._latency)
+            return method(*args, **kwargs)
+
+        return call
+
+
+class AsyncMockDatabase:
+    def __init__(self, database, latency: float):
+        self._database = database
+        self._latency = latency
+
+    def __getitem__(self, name: str) -> AsyncMockCollection:
+        return AsyncMockCollection(self._database[name], self._latency)
+
+    async def command(self, *args, **kwargs) -> dict:
+        return {"ok": 1}
+
+
+class AsyncMockClient:
+    """
+    Stand-in for ``AsyncMongoClient``.
+
+    Args:
+        latency_ms: Delay added to every database operation
+    """
+
+    def __init__(self, latency_ms: float = 0):
+        if mongomock is None:
+            raise RuntimeError("The in-memory database needs mongomock: pip install -r benchmarks/requirements.txt")
+        self._client = mongomock.MongoClient()
+        self._latency = latency_ms / 1000
+        self.admin = AsyncMockDatabase(self._client.admin, self._latency)
+
+    def __getitem__(self, name: str) -> AsyncMockDatabase:
+        return AsyncMockDatabase(self._client[name], self._latency)
+
+    async def close(self) -> None:
+        self._client.close()
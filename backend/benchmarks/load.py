@@ -0,0 +1,336 @@
+"""
+Offline load test for the API.
+
+Boots the app in-process with local stand-ins for every upstream (Gemini,
+the RapidAPI H&M endpoints and MongoDB), drives ``/auth/login``,
+``/wishlist``, ``/quiz/submit`` and ``/quiz/history`` at a fixed concurrency and reports
+throughput and p50/p95/p99 latency per scenario as JSON. Run from the
+backend directory:
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.load [--requests 500] [--concurrency 32] [--output result.json]
+    python -m benchmarks.load --baseline result.json --max-regression 0.2
+
+With ``--baseline`` the run fails (exit code 1) when a scenario's p95
+latency grows or its throughput drops by more than ``--max-regression``
+compared with the baseline file, so it can gate CI. Upstream latency and
+failure rates are set with ``--gemini-latency-ms``, ``--hm-error-rate``,
+``--hm-tail-rate`` (a share of slow H&M answers) and similar flags; ``--mongo-uri`` uses a real (local) mongod instead of the
+in-memory fake.
+
+Requests go through ``httpx.ASGITransport``, so the numbers include the
+middleware stack and serialization but not sockets or uvicorn.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings the app reads at import time; nothing here is ever sent anywhere
+os.environ.setdefault("GEMINI_API_KEY", "offline")
+os.environ.setdefault("RAPIDAPI_KEY", "offline")
+os.environ.setdefault("MONGODB_URI", "mongodb://127.0.0.1:27017")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("CATALOG_SYNC_INTERVAL", "0")
+os.environ.setdefault("PRODUCT_REFRESH_INTERVAL", "0")
+os.environ.setdefault("RECOMMENDATION_CACHE_PATH", "")
+os.environ.setdefault("RECOMMENDATION_PRECOMPUTED_PATH", "")
+# Injected upstream errors would flood the output; set LOG_LEVEL to see them
+os.environ.setdefault("LOG_LEVEL", "CRITICAL")
+# Every simulated client shares one address; per-client limits would only measure 429s
+os.environ.setdefault("QUIZ_RATE_PER_MINUTE", "0")
+os.environ.setdefault("LOGIN_RATE_PER_MINUTE", "0")
+
+SCENARIOS = ("login", "wishlist_get", "wishlist_add", "quiz", "quiz_history")
+
+# The front-end quiz options, as enumerated by the precompute job, so the quiz
+# scenario hits the same profiles (and precomputed recommendations) users do.
+# Sizes are free-text fields in the front end.
+from services.precompute import COLORS, OCCASIONS, STYLE_VIBES  # noqa: E402  (needs the settings above)
+
+QUIZ_OPTIONS = {
+    "occasion": list(OCCASIONS),
+    "style_vibe": list(STYLE_VIBES),
+    "colors_like": list(COLORS),
+    "tops": ["XS", "S", "M", "L", "XL"],
+    "bottoms": ["26", "28", "30", "32", "34"],
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], statuses: Dict[int, int], errors: int, elapsed: float) -> dict:
+    """Throughput and latency percentiles (in ms) for one scenario."""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status_counts": {str(status): count for status, count in sorted(statuses.items())},
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+    }
+
+
+def random_quiz(rng: random.Random) -> dict:
+    options = QUIZ_OPTIONS
+    return {
+        "occasion": rng.sample(options["occasion"], rng.randint(1, 2)),
+        "style_vibe": rng.sample(options["style_vibe"], rng.randint(1, 2)),
+        "colors_like": rng.sample(options["colors_like"], rng.randint(0, 3)),
+        "height": {"ft": rng.randint(5, 6), "in_": rng.randint(0, 11)},
+        "sizes": {"tops": rng.choice(options["tops"]), "bottoms": rng.choice(options["bottoms"])},
+        "budget": {"min": 0, "max": rng.choice([50, 100, 200])},
+    }
+
+
+def wishlist_item(n: int) -> dict:
+    return {
+        "code": f"bench{n:07d}",
+        "name": f"Benchmark product {n}",
+        "price": {"formattedValue": f"${10 + n % 90}.99", "currencyIso": "USD"},
+        "images": [{"url": f"https://image.hm.com/assets/hm/bench{n:07d}.jpg"}],
+    }
+
+
+async def run_scenario(
+    name: str,
+    request: Callable[[int], Awaitable[int]],
+    total: int,
+    concurrency: int,
+) -> dict:
+    """Issue ``total`` requests with ``concurrency`` workers and summarize them."""
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker() -> None:
+        nonlocal errors
+        for n in counter:
+            start = time.perf_counter()
+            try:
+                status = await request(n)
+            except Exception:
+                status = 0
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if not 200 <= status < 300:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+    result = summarize(latencies, statuses, errors, time.perf_counter() - started)
+    print(f"{name}: {result['throughput_rps']} req/s, p95 {result['p95_ms']} ms, {errors} errors", file=sys.stderr)
+    return result
+
+
+async def run(args: argparse.Namespace) -> dict:
+    import httpx
+    import main
+    from benchmarks.fake_gemini import FakeGeminiModel
+    from benchmarks.fake_hm import create_app as create_fake_hm
+    from benchmarks.fake_mongo import AsyncMockClient
+    from services import ai_model, catalog, database, hm_client, quiz_history
+    from services.repositories import ensure_indexes
+    from utils.auth import shutdown_hash_pool, start_hash_pool
+    from utils.log import setup_logging, shutdown_logging
+
+    rng = random.Random(args.seed)
+
+    # The same startup as the app lifespan, with every upstream replaced
+    setup_logging()
+    fake_hm = create_fake_hm(
+        latency_ms=args.hm_latency_ms,
+        error_rate=args.hm_error_rate,
+        seed=args.seed,
+        tail_rate=args.hm_tail_rate,
+        tail_latency_ms=args.hm_tail_latency_ms,
+    )
+    hm_client.init_client(hm_client.create_client(transport=httpx.ASGITransport(app=fake_hm)))
+    ai_model.init_model(
+        FakeGeminiModel(latency_ms=args.gemini_latency_ms, error_rate=args.gemini_error_rate, seed=args.seed)
+    )
+    if args.mongo_uri:
+        await database.init_database()
+    else:
+        await database.init_database(AsyncMockClient(latency_ms=args.mongo_latency_ms))
+    await ensure_indexes(database.get_database())
+    start_hash_pool()
+    quiz_history.start()
+
+    catalog_dir = None
+    if args.catalog:
+        catalog_dir = tempfile.TemporaryDirectory()
+        await catalog.sync_catalog(catalog.open_catalog(os.path.join(catalog_dir.name, "catalog.db")))
+
+    client = httpx.AsyncClient(
+        # Unhandled errors become 500 responses, as behind uvicorn
+        transport=httpx.ASGITransport(app=main.app, raise_app_exceptions=False),
+        base_url="http://dressly.bench",
+        timeout=60,
+    )
+    results = {}
+    try:
+        # Accounts with a small wishlist each; fresh emails so a real mongod can be reused
+        run_id = os.urandom(4).hex()
+        users = []
+        for i in range(min(args.users, args.concurrency)):
+            credentials = {"email": f"bench-{run_id}-{i}@example.com", "password": "benchmark-password"}
+            r = await client.post("/auth/signup", json={"name": f"Bench {i}", **credentials})
+            r.raise_for_status()
+            headers = {"Authorization": f"Bearer {r.json()['token']}"}
+            items = [wishlist_item(i * 1000 + n) for n in range(args.wishlist_size)]
+            for start in range(0, len(items), 100):
+                batch = {"items": items[start:start + 100]}
+                (await client.post("/wishlist/bulk", json=batch, headers=headers)).raise_for_status()
+            users.append((credentials, headers))
+
+        async def login(n: int) -> int:
+            credentials, _ = users[n % len(users)]
+            return (await client.post("/auth/login", json=credentials)).status_code
+
+        async def wishlist_get(n: int) -> int:
+            _, headers = users[n % len(users)]
+            return (await client.get("/wishlist", headers=headers)).status_code
+
+        async def wishlist_add(n: int) -> int:
+            _, headers = users[n % len(users)]
+            item = wishlist_item(500_000 + n)
+            return (await client.post("/wishlist", json=item, headers=headers)).status_code
+
+        quizzes = [random_quiz(rng) for _ in range(args.quiz_variants)]
+
+        async def quiz(n: int) -> int:
+            _, headers = users[n % len(users)]
+            return (await client.post("/quiz/submit", json=quizzes[n % len(quizzes)], headers=headers)).status_code
+
+        async def history(n: int) -> int:
+            _, headers = users[n % len(users)]
+            return (await client.get("/quiz/history", headers=headers)).status_code
+
+        handlers = {
+            "login": login,
+            "wishlist_get": wishlist_get,
+            "wishlist_add": wishlist_add,
+            "quiz": quiz,
+            "quiz_history": history,
+        }
+        for name in args.scenarios:
+            results[name] = await run_scenario(name, handlers[name], args.requests, args.concurrency)
+    finally:
+        await client.aclose()
+        await quiz_history.stop()
+        await hm_client.close_client()
+        await database.close_database()
+        catalog.close_catalog()
+        if catalog_dir is not None:
+            catalog_dir.cleanup()
+        shutdown_hash_pool()
+        shutdown_logging()
+
+    return {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "gemini_latency_ms": args.gemini_latency_ms,
+            "gemini_error_rate": args.gemini_error_rate,
+            "hm_latency_ms": args.hm_latency_ms,
+            "hm_error_rate": args.hm_error_rate,
+            "hm_tail_rate": args.hm_tail_rate,
+            "hm_tail_latency_ms": args.hm_tail_latency_ms,
+            "mongo": "mongod" if args.mongo_uri else "in-memory",
+            "mongo_latency_ms": 0 if args.mongo_uri else args.mongo_latency_ms,
+            "catalog": args.catalog,
+            "quiz_variants": args.quiz_variants,
+        },
+        "scenarios": results,
+    }
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> List[str]:
+    """Scenarios whose p95 grew, or throughput fell, by more than ``max_regression``."""
+    failures = []
+    for name, current in result["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            failures.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - max_regression):
+            failures.append(f"{name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s")
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight")
+    parser.add_argument("--users", type=int, default=32, help="Accounts to spread requests over (at most --concurrency)")
+    parser.add_argument("--wishlist-size", type=int, default=20, help="Items saved per account before the run")
+    parser.add_argument("--quiz-variants", type=int, default=50, help="Distinct quizzes (fewer means more cache hits)")
+    parser.add_argument("--gemini-latency-ms", type=float, default=300)
+    parser.add_argument("--gemini-error-rate", type=float, default=0)
+    parser.add_argument("--hm-latency-ms", type=float, default=80)
+    parser.add_argument("--hm-error-rate", type=float, default=0)
+    parser.add_argument("--hm-tail-rate", type=float, default=0, help="Share of H&M requests answered slowly")
+    parser.add_argument("--hm-tail-latency-ms", type=float, default=2000)
+    parser.add_argument("--mongo-latency-ms", type=float, default=1, help="Delay per in-memory database operation")
+    parser.add_argument("--mongo-uri", help="Use this MongoDB server instead of the in-memory fake")
+    parser.add_argument("--catalog", action="store_true", help="Serve quiz products from a freshly synced catalog mirror")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON result to this file instead of stdout")
+    parser.add_argument("--baseline", help="Earlier JSON result to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    if args.mongo_uri:
+        os.environ["MONGODB_URI"] = args.mongo_uri
+        os.environ.setdefault("MONGODB_TLS", "false")
+
+    result = asyncio.run(run(args))
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(result, json.load(f), args.max_regression)
+        for failure in failures:
+            print(f"REGRESSION {failure}", file=sys.stderr)
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Micro-benchmark for the product normalizer.
+
+Normalizes the sample H&M listing in ``fixtures/hm_listing_sample.json``
+(the shape returned by ``products/v2/list``) scaled to several listing sizes.
+Run from the backend directory:
+
+    python -m benchmarks.normalizer [--sizes 30,1000,100000] [--repeat 5] [--json]
+"""
+
+import argparse
+import copy
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.products import extract_product_list, normalize_listing, normalize_products  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "hm_listing_sample.json")
+
+
+def load_listing(size: int) -> list:
+    """Repeat the sample items up to ``size``, giving each copy a unique code."""
+    with open(FIXTURE) as f:
+        sample = extract_product_list(json.load(f))
+
+    items = []
+    while len(items) < size:
+        for item in sample:
+            if len(items) >= size:
+                break
+            clone = copy.deepcopy(item)
+            clone["id"] = f"{item['id']}-{len(items)}"
+            items.append(clone)
+    return items
+
+
+def time_call(func, items, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(items)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {
+        "best_ms": round(best * 1000, 3),
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "items_per_s": round(len(items) / best) if best else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="30,1000,100000", help="Comma-separated listing sizes")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per size (best and median reported)")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        items = load_listing(size)
+        results.append({
+            "items": size,
+            "records": time_call(normalize_listing, items, args.repeat),
+            "dicts": time_call(normalize_products, items, args.repeat),
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'items':>8} {'records best ms':>16} {'records items/s':>16} {'dicts best ms':>14} {'dicts items/s':>14}")
+    for r in results:
+        print(
+            f"{r['items']:>8} {r['records']['best_ms']:>16} {r['records']['items_per_s']:>16} "
+            f"{r['dicts']['best_ms']:>14} {r['dicts']['items_per_s']:>14}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,23 +2,133 @@
 Dressly Backend API - FastAPI application for AI-powered personal styling.
 """
 
+import asyncio
+import logging
 import os
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from dotenv import load_dotenv
+from pymongo.errors import ConnectionFailure
 
+from api.health import router as health_router
 from api.quiz import router as quiz_router
-from api.auth import router as auth_router
+from api.auth import principal_cache, router as auth_router
 from api.wishlist import router as wishlist_router
+from services import ai_model, catalog, database, hm_client, product_refresh, quiz_history, rate_limit
+from services.repositories import ensure_indexes, migrate_wishlist_products, product_cache
+from utils.auth import shutdown_hash_pool, start_hash_pool
+from utils.log import RequestIdMiddleware, setup_logging, shutdown_logging
+from utils.metrics import MetricsMiddleware, render_metrics
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Response compression: "auto" (brotli when brotli-asgi is installed, else gzip), "br", "gzip" or "off".
+# Bodies smaller than RESPONSE_COMPRESSION_MIN_SIZE bytes are sent as-is.
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "auto").lower()
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+
+# Longest wait between attempts to reach MongoDB when the app started without it
+DATABASE_SETUP_MAX_DELAY = float(os.getenv("DATABASE_SETUP_MAX_DELAY", "60"))
+
+
+async def setup_database(wait: bool = False) -> bool:
+    """
+    Create indexes and run migrations once MongoDB answers a ping.
+
+    Args:
+        wait: Keep retrying (with backoff) until the server is reachable
+
+    Returns:
+        Whether the setup ran
+    """
+    delay = 1.0
+    while not await database.ping():
+        if not wait:
+            return False
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, DATABASE_SETUP_MAX_DELAY)
+
+    logger.info("Connected to MongoDB")
+    db = database.get_database()
+    await ensure_indexes(db)
+    await migrate_wishlist_products(db)
+    return True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create shared upstream clients on startup and close them on shutdown.
+
+    Everything that opens connections, threads or processes is built here,
+    after any worker fork, the log writer thread included. A missing or
+    unreachable upstream is logged and the app starts degraded (see
+    ``/health/ready``) instead of failing to boot.
+    """
+    setup_logging()
+    started = time.perf_counter()
+    await rate_limit.init_backend()
+    await database.init_database()
+    start_hash_pool()
+    hm_client.init_client()
+    ai_model.init_model()
+    ai_model.open_recommendation_store()
+    ai_model.load_precomputed_recommendations()
+    product_catalog = catalog.open_catalog()
+    quiz_history.start()
+
+    background_tasks = []
+    if database.client is not None and not await setup_database():
+        logger.error("MongoDB is unreachable; starting degraded and retrying in the background")
+        background_tasks.append(asyncio.create_task(setup_database(wait=True)))
+    if catalog.CATALOG_SYNC_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(catalog.run_sync_loop(product_catalog)))
+    if product_refresh.PRODUCT_REFRESH_INTERVAL > 0 and database.client is not None:
+        background_tasks.append(asyncio.create_task(product_refresh.run_refresh_loop(database.get_database())))
+    logger.info("Startup finished in %.0f ms", (time.perf_counter() - started) * 1000)
+
+    try:
+        yield
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        # A task that already died must not skip the cleanup below
+        for result in await asyncio.gather(*background_tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error("Background task failed", exc_info=result)
+        await quiz_history.stop()
+        catalog.close_catalog()
+        ai_model.close_recommendation_store()
+        await hm_client.close_client()
+        await database.close_database()
+        await rate_limit.close_backend()
+        shutdown_hash_pool()
+        # Last, so records logged during shutdown are written too
+        shutdown_logging()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Dressly API",
     description="AI-powered personal styling assistant",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Configure CORS
@@ -32,7 +142,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses (product listings); added last so it wraps CORS too
+if RESPONSE_COMPRESSION in ("auto", "br") and BrotliMiddleware is not None:
+    # Falls back to gzip for clients that don't accept br
+    app.add_middleware(
+        BrotliMiddleware,
+        quality=RESPONSE_BROTLI_QUALITY,
+        minimum_size=RESPONSE_COMPRESSION_MIN_SIZE,
+        gzip_fallback=True,
+    )
+elif RESPONSE_COMPRESSION in ("auto", "br", "gzip"):
+    if RESPONSE_COMPRESSION == "br":
+        logger.warning("brotli-asgi is not installed, using gzip compression")
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=RESPONSE_COMPRESSION_MIN_SIZE,
+        compresslevel=RESPONSE_GZIP_LEVEL,
+    )
+
+# Times whole requests, compression and streamed bodies included
+app.add_middleware(MetricsMiddleware)
+
+# Outermost, so every log record for a request carries its ID
+app.add_middleware(RequestIdMiddleware)
+
+@app.exception_handler(database.DatabaseUnavailable)
+@app.exception_handler(ConnectionFailure)
+async def database_unavailable(request: Request, exc: Exception):
+    """Answer 503 rather than 500 while MongoDB is missing or unreachable."""
+    logger.warning("Database unavailable: %s", exc)
+    return ORJSONResponse({"detail": "Database unavailable, try again later"}, status_code=503)
+
+
 # Include routers
+app.include_router(health_router, prefix="/health", tags=["Health"])
 app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 app.include_router(wishlist_router, prefix="/wishlist", tags=["Wishlist"])
 app.include_router(quiz_router, prefix="/quiz", tags=["Quiz"])
@@ -52,3 +195,21 @@ def health_check():
         "message": "Dressly API is running",
         "version": "1.0.0"
     }
+
+
+@app.get("/stats/cache", tags=["Health"])
+def cache_stats():
+    """Hit/miss/eviction counters for the in-process caches."""
+    return {
+        "hm_listings": hm_client.listing_cache.stats(),
+        "recommendations": ai_model.recommendation_cache.stats(),
+        "principals": principal_cache.stats(),
+        "products": product_cache.stats(),
+    }
+
+
+@app.get("/metrics", tags=["Health"], include_in_schema=False)
+def metrics():
+    """Request, upstream (Gemini, H&M, MongoDB) and pool metrics in the Prometheus text format."""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
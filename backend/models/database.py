@@ -45,6 +45,7 @@ class QuizResultModel(BaseModel):
     user_id: Optional[str] = None
     quiz_answers: dict
     recommendation: str
+    categories_searched: List[str] = []
     products: List[dict] = []
     created_at: datetime = Field(default_factory=datetime.utcnow)
     
@@ -0,0 +1,31 @@
+"""
+Pydantic models for products returned to the frontend.
+"""
+
+from pydantic import BaseModel
+from typing import List, Optional
+
+
+class Price(BaseModel):
+    """Display price of a product."""
+    formattedValue: str = ""
+    currencyIso: str = ""
+
+
+class ProductImage(BaseModel):
+    """One product image."""
+    url: str = ""
+
+
+class Product(BaseModel):
+    """
+    Normalized product.
+
+    Every field is optional because clients can project the fields they need
+    with ``?fields=``; fields that weren't requested are left out of the JSON.
+    """
+    code: Optional[str] = None
+    name: Optional[str] = None
+    price: Optional[Price] = None
+    images: Optional[List[ProductImage]] = None
+    raw: Optional[dict] = None
@@ -4,6 +4,7 @@ Pydantic models for quiz input validation.
 
 from pydantic import BaseModel, Field
 from typing import List, Optional
+from models.product import Product
 
 
 class Height(BaseModel):
@@ -32,3 +33,12 @@ class QuizInput(BaseModel):
     height: Optional[Height] = None
     sizes: Sizes
     budget: Budget
+
+
+class QuizResponse(BaseModel):
+    """Style recommendation and matching products for a submitted quiz."""
+    status: str
+    input: Optional[QuizInput] = Field(None, description="Echo of the submitted quiz, with include_input=true")
+    recommendation: str
+    products: List[Product]
+    categories_searched: List[str]
@@ -1,97 +1,530 @@
-import google.generativeai as genai
-from google.api_core import exceptions as gcloud_exceptions
+"""
+Style recommendations from Google's Gemini.
+
+The Gemini SDK is heavy to import and opens gRPC channels, so it is only
+imported and configured by ``init_model`` (called from the FastAPI lifespan,
+i.e. after any worker fork) or on first use. Without GEMINI_API_KEY the app
+still starts and serves ``fallback_style`` recommendations.
+
+Gemini answers in JSON following ``RESPONSE_SCHEMA``: the recommendation text
+and up to MAX_CATEGORIES listing categories from ``hm_client.HM_CATEGORY_IDS``.
+Prompt and response token counts of every call are recorded in the
+``gemini_tokens`` histogram.
+"""
+
+import asyncio
+import json
+import logging
 import os
+import sys
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Optional, Tuple
 from dotenv import load_dotenv
+from services.hm_client import HM_CATEGORY_IDS
+from services.rate_limit import RateLimitExceeded, RateLimiter
+from services.recommendation_cache import RecommendationCache, RecommendationStore, canonical_quiz
+from utils.metrics import GEMINI_ERRORS, GEMINI_REQUEST_DURATION, GEMINI_TOKENS, set_pool_limit, track_upstream
+
+if TYPE_CHECKING:
+    import google.generativeai as genai
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 api_key = os.getenv("GEMINI_API_KEY")
 
-if not api_key:
-    raise RuntimeError("GEMINI_API_KEY is missing. Add it in backend/.env")
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-lite")
+# Bump when the prompt changes so cached recommendations are regenerated
+PROMPT_VERSION = "2"
+
+# Bounds on the answer: generated tokens, words asked for, categories returned
+GEMINI_MAX_OUTPUT_TOKENS = int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", "400"))
+RECOMMENDATION_MAX_WORDS = 120
+MAX_CATEGORIES = 3
+
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "recommendation": {"type": "string"},
+        "categories": {
+            "type": "array",
+            "items": {"type": "string", "format": "enum", "enum": list(HM_CATEGORY_IDS)},
+            "min_items": 1,
+            "max_items": MAX_CATEGORIES,
+        },
+    },
+    "required": ["recommendation", "categories"],
+}
+
+GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": RESPONSE_SCHEMA,
+    "max_output_tokens": GEMINI_MAX_OUTPUT_TOKENS,
+}
+
+# Concurrency settings: at most GEMINI_MAX_IN_FLIGHT calls run at once, and a
+# call waiting longer than GEMINI_QUEUE_TIMEOUT for a slot gets the fallback
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "16"))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "10"))
+GEMINI_REQUEST_TIMEOUT = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "30"))
+
+# Client-side budget for the Gemini quota (requests per minute, 0 = unlimited).
+# A call waits up to GEMINI_RATE_MAX_WAIT seconds for a token, then gets the
+# fallback; a 429 from Gemini holds all calls back for GEMINI_QUOTA_BACKOFF seconds.
+GEMINI_RATE_PER_MINUTE = float(os.getenv("GEMINI_RATE_PER_MINUTE", "0"))
+GEMINI_RATE_BURST = float(os.getenv("GEMINI_RATE_BURST", "0"))
+GEMINI_RATE_MAX_WAIT = float(os.getenv("GEMINI_RATE_MAX_WAIT", "5"))
+GEMINI_QUOTA_BACKOFF = float(os.getenv("GEMINI_QUOTA_BACKOFF", "10"))
+
+# Recommendation cache settings (RECOMMENDATION_CACHE_TTL=0 disables caching)
+RECOMMENDATION_CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL", "86400"))
+RECOMMENDATION_CACHE_MAX_ENTRIES = int(os.getenv("RECOMMENDATION_CACHE_MAX_ENTRIES", "2048"))
+RECOMMENDATION_CACHE_PATH = os.getenv("RECOMMENDATION_CACHE_PATH", "")
+# Recommendations precomputed per style profile by ``python -m services.precompute``
+# (loaded at startup if the file exists; empty disables)
+RECOMMENDATION_PRECOMPUTED_PATH = os.getenv("RECOMMENDATION_PRECOMPUTED_PATH", "precomputed_recommendations.db")
+
+# Built by init_model (or on first use) and shared by every request
+_model: Optional["genai.GenerativeModel"] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+gemini_limiter = RateLimiter(
+    "gemini", GEMINI_RATE_PER_MINUTE / 60, GEMINI_RATE_BURST, max_wait=GEMINI_RATE_MAX_WAIT
+)
+
+
+class AIBusyError(RuntimeError):
+    """Raised when no Gemini slot frees up within GEMINI_QUEUE_TIMEOUT."""
+
+
+class AIUnavailableError(RuntimeError):
+    """Raised when Gemini is not configured (GEMINI_API_KEY is missing)."""
+
+
+class AIResponseError(ValueError):
+    """Raised when Gemini's answer isn't a recommendation in the ``RESPONSE_SCHEMA`` format."""
+
+
+def init_model(model: Optional[Any] = None) -> None:
+    """
+    Install the shared model.
+
+    Builds the Gemini model unless ``model`` is given (e.g. a local stand-in).
+    Without GEMINI_API_KEY no model is installed and callers get the fallback.
+    """
+    global _model
+    if model is not None:
+        _model = model
+        return
+    if not api_key:
+        logger.error("GEMINI_API_KEY is missing. Add it in backend/.env; serving fallback recommendations.")
+        return
+
+    import google.generativeai as genai
+
+    genai.configure(api_key=api_key)
+    _model = genai.GenerativeModel(MODEL_NAME)
+
+
+def get_model() -> "genai.GenerativeModel":
+    """Return the shared Gemini model instance, building it on first use."""
+    if _model is None and api_key:
+        init_model()
+    if _model is None:
+        raise AIUnavailableError("Gemini is not configured")
+    return _model
+
+
+def model_status() -> str:
+    """``"ok"`` when a model is installed, ``"fallback"`` when recommendations come from ``fallback_style``."""
+    return "ok" if _model is not None else "fallback"
+
+
+def is_fallback_error(exc: BaseException) -> bool:
+    """
+    Whether ``exc`` should be answered with ``fallback_style``: Gemini busy,
+    not configured, model missing, or an unusable answer.
+    """
+    if isinstance(exc, (AIBusyError, AIUnavailableError, AIResponseError)):
+        return True
+    return _is_api_error(exc, "NotFound") or _is_api_error(exc, "ResourceExhausted")
+
+
+def _is_api_error(exc: BaseException, name: str) -> bool:
+    """Whether ``exc`` is the ``google.api_core.exceptions`` class ``name``."""
+    # google.api_core is only loaded once the Gemini SDK is in use
+    exceptions = sys.modules.get("google.api_core.exceptions")
+    return exceptions is not None and isinstance(exc, getattr(exceptions, name))
+
+
+@asynccontextmanager
+async def generation_slot():
+    """
+    Take a token from the Gemini rate budget, then hold one of
+    GEMINI_MAX_IN_FLIGHT slots for the duration of a Gemini call.
+    """
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(GEMINI_MAX_IN_FLIGHT)
+        set_pool_limit("gemini", GEMINI_MAX_IN_FLIGHT)
+
+    try:
+        await gemini_limiter.acquire()
+    except RateLimitExceeded as e:
+        GEMINI_ERRORS.labels(operation="slot", error="rate_limited").inc()
+        raise AIBusyError(str(e))
+    try:
+        await asyncio.wait_for(_semaphore.acquire(), timeout=GEMINI_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        GEMINI_ERRORS.labels(operation="slot", error="busy").inc()
+        raise AIBusyError(f"No Gemini slot available after {GEMINI_QUEUE_TIMEOUT}s")
+    try:
+        yield
+    except Exception as e:
+        if _is_api_error(e, "ResourceExhausted"):
+            # Quota hit upstream: stop sending calls for a while
+            await gemini_limiter.penalize(GEMINI_QUOTA_BACKOFF)
+        raise
+    finally:
+        _semaphore.release()
+
+
+recommendation_cache = RecommendationCache(
+    version=f"{MODEL_NAME}:{PROMPT_VERSION}",
+    ttl=RECOMMENDATION_CACHE_TTL,
+    max_entries=RECOMMENDATION_CACHE_MAX_ENTRIES,
+)
+
+
+def open_recommendation_store(path: str = RECOMMENDATION_CACHE_PATH) -> None:
+    """Attach the persistent recommendation tier, if a path is configured."""
+    if not path or RECOMMENDATION_CACHE_TTL <= 0:
+        return
+    store = RecommendationStore(path)
+    purged = store.purge(recommendation_cache.version)
+    if purged:
+        logger.info("Purged %d outdated cached recommendations", purged)
+    recommendation_cache.store = store
+
+
+def load_precomputed_recommendations(path: str = RECOMMENDATION_PRECOMPUTED_PATH) -> int:
+    """Load precomputed recommendations for the current model and prompt into memory. Returns how many."""
+    if not path or RECOMMENDATION_CACHE_TTL <= 0 or not os.path.exists(path):
+        return 0
+    store = RecommendationStore(path)
+    try:
+        recommendation_cache.precomputed = store.load(recommendation_cache.version)
+    finally:
+        store.close()
+    logger.info("Loaded %d precomputed recommendations", len(recommendation_cache.precomputed))
+    return len(recommendation_cache.precomputed)
+
+
+def close_recommendation_store() -> None:
+    if recommendation_cache.store is not None:
+        recommendation_cache.store.close()
+        recommendation_cache.store = None
+
+
+def fallback_style(data: dict) -> dict:
+    """Deterministic recommendations used when the Gemini model is unavailable."""
+    occasions = data.get('occasion', [])
+    if 'Work' in occasions or 'Formal' in occasions:
+        categories = ['women_blazerssuits', 'men_blazerssuits', 'men_trousers']
+        recommendations = "Classic tailored outfit: blazer, crisp shirt, and tailored trousers. Colors: neutrals with a pop of color. Avoid overly casual items."
+    elif 'Casual' in occasions:
+        categories = ['women_jeans', 'men_jeans', 'women_tops']
+        recommendations = "Casual outfit: well-fitted jeans, comfortable top, and layered outerwear. Colors: denim and earth tones. Avoid formal fabrics."
+    else:
+        categories = ['women_clothing', 'men_clothing', 'women_tops']
+        recommendations = "Versatile outfit suggestion: mix basics with one statement piece. Stick to a coherent color palette and consider proportion."
+
+    return {
+        "text": recommendations,
+        "categories": categories[:3]
+    }
 
-genai.configure(api_key=api_key)
 
 async def generate_style(data: dict) -> dict:
     """
     Generate personalized style recommendations using Google's Gemini AI.
     Returns both text recommendations and product search terms.
-    
+
+    Equivalent quizzes (see ``recommendation_cache.canonical_quiz``) are
+    served from the recommendation cache instead of calling Gemini again.
+
     Args:
         data: Quiz input data containing user preferences
-        
+
     Returns:
         Dictionary with 'text' (recommendations) and 'categories' (product search terms)
     """
-    prompt = f"""
-    You are a professional fashion stylist.
-
-    Here are the user's quiz answers:
-    {data}
-
-    Based on this, generate:
-    1. A complete outfit suggestion for their occasion
-    2. 3 personalized styling tips
-    3. A color palette recommendation
-    4. Clothing items to avoid
-    
-    Then, list 3-5 specific H&M product categories to search for (like "men_trousers", "women_dresses", "men_shirts", "women_tops", etc.)
-    
-    Format your response as:
-    RECOMMENDATIONS:
-    [Your style recommendations here]
-    
-    CATEGORIES:
-    category1, category2, category3
-    
-    Make it short & practical.
+    try:
+        if RECOMMENDATION_CACHE_TTL <= 0:
+            return await _generate(canonical_quiz(data))
+        return await recommendation_cache.get_or_generate(data, _generate)
+    except Exception as e:
+        if is_fallback_error(e):
+            # Busy, not configured, or model not found for this API version
+            logger.warning("Gemini not available: %s. Returning fallback recommendations.", e)
+            return fallback_style(data)
+        logger.exception("AI generation error")
+        raise
+
+
+def describe_quiz(data: dict) -> str:
+    """Compact one-line form of a canonical quiz, leaving out unanswered questions."""
+    parts = []
+    for label, key in (("occasion", "occasion"), ("style", "style_vibe"), ("colors", "colors_like")):
+        if data.get(key):
+            parts.append(f"{label}: {', '.join(data[key])}")
+    if data.get("height"):
+        parts.append(f"height: {data['height']}")
+    sizes = data.get("sizes") or {}
+    if sizes.get("tops") or sizes.get("bottoms"):
+        parts.append(f"sizes: top {sizes.get('tops') or '-'}, bottom {sizes.get('bottoms') or '-'}")
+    if data.get("budget"):
+        parts.append(f"budget per item: {data['budget']}")
+    return "; ".join(parts)
+
+
+def build_prompt(data: dict) -> str:
+    """Build the stylist prompt for a canonical quiz; the answer format comes from RESPONSE_SCHEMA."""
+    return (
+        f"You are a fashion stylist. Quiz answers: {describe_quiz(data)}.\n"
+        "recommendation: an outfit for the occasion, 3 styling tips, a color palette and items to avoid, "
+        f"as plain text under {RECOMMENDATION_MAX_WORDS} words. "
+        f"categories: the {MAX_CATEGORIES} H&M categories to search, best first."
+    )
+
+
+def default_categories(data: dict) -> list:
+    """Categories for a canonical quiz when Gemini suggested no known one."""
+    occasions = data.get('occasion', [])
+    if 'work' in occasions or 'formal' in occasions:
+        return ['men_blazerssuits', 'women_blazerssuits', 'men_trousers']
+    if 'casual' in occasions:
+        return ['men_jeans', 'women_jeans', 'men_tshirtstanks']
+    return ['men_clothing', 'women_clothing']
+
+
+def valid_categories(categories) -> list:
+    """Known H&M category IDs among ``categories``, deduplicated, at most MAX_CATEGORIES."""
+    known = set(HM_CATEGORY_IDS)
+    valid = []
+    for category in categories if isinstance(categories, list) else []:
+        category = category.strip().lower() if isinstance(category, str) else ""
+        if category in known and category not in valid:
+            valid.append(category)
+        elif category not in known:
+            GEMINI_ERRORS.labels(operation="parse", error="unknown_category").inc()
+            logger.warning("Ignoring unknown category from Gemini: %r", category)
+    return valid[:MAX_CATEGORIES]
+
+
+def parse_response(text: str, data: dict) -> dict:
+    """
+    Decode Gemini's JSON answer into recommendation text and categories.
+
+    Raises:
+        AIResponseError: If the answer isn't JSON with a recommendation (e.g. cut off at max_output_tokens)
+    """
+    try:
+        payload = json.loads(text)
+        recommendation = payload["recommendation"].strip()
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        GEMINI_ERRORS.labels(operation="parse", error="invalid_response").inc()
+        raise AIResponseError(f"Unexpected Gemini response: {e}") from e
+    if not recommendation:
+        GEMINI_ERRORS.labels(operation="parse", error="invalid_response").inc()
+        raise AIResponseError("Gemini returned an empty recommendation")
+
+    return {
+        "text": recommendation,
+        "categories": valid_categories(payload.get("categories")) or default_categories(data),
+    }
+
+
+def record_usage(operation: str, response: Any) -> None:
+    """Record the prompt and response token counts of a Gemini call, when the SDK reports them."""
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    response_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    GEMINI_TOKENS.labels(operation, "prompt").observe(prompt_tokens)
+    GEMINI_TOKENS.labels(operation, "response").observe(response_tokens)
+    logger.debug("Gemini %s used %d prompt and %d response tokens", operation, prompt_tokens, response_tokens)
+
+
+async def generate_uncached(data: dict) -> dict:
+    """
+    Call Gemini for ``data`` without using the recommendation cache or the fallback.
+
+    Used by ``services.precompute``; errors propagate to the caller.
+    """
+    return await _generate(data)
+
+
+async def _generate(data: dict) -> dict:
+    """Call Gemini for a (canonical) quiz and parse the response."""
+    async with generation_slot():
+        with track_upstream("gemini", GEMINI_REQUEST_DURATION, GEMINI_ERRORS, operation="generate"):
+            response = await get_model().generate_content_async(
+                build_prompt(data),
+                generation_config=GENERATION_CONFIG,
+                request_options={"timeout": GEMINI_REQUEST_TIMEOUT},
+            )
+            try:
+                text = response.text
+            except ValueError as e:
+                # No text parts, e.g. blocked by safety filters
+                raise AIResponseError(f"Gemini returned no text: {e}") from e
+    record_usage("generate", response)
+    return parse_response(text, data)
+
+
+class _RecommendationExtractor:
+    """
+    Incrementally extracts the "recommendation" string from streamed JSON,
+    so only the recommendation text is streamed to the user.
+
+    Escape sequences split across chunks are held back until complete.
+    """
+
+    KEY = '"recommendation"'
+    ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self):
+        self._buffer = ""
+        self._state = "key"  # key -> value -> string -> done
+        self._high_surrogate = ""
+
+    def feed(self, text: str) -> str:
+        self._buffer += text
+        if self._state == "key":
+            index = self._buffer.find(self.KEY)
+            if index < 0:
+                # Keep a possible partial key
+                self._buffer = self._buffer[-(len(self.KEY) - 1):]
+                return ""
+            self._buffer = self._buffer[index + len(self.KEY):]
+            self._state = "value"
+        if self._state == "value":
+            index = self._buffer.find('"')
+            if index < 0:
+                return ""
+            self._buffer = self._buffer[index + 1:]
+            self._state = "string"
+        if self._state == "string":
+            return self._read_string()
+        return ""
+
+    def _read_string(self) -> str:
+        out = []
+        i = 0
+        buffer = self._buffer
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self._state = "done"
+                i = len(buffer)
+                break
+            if char != "\\":
+                out.append(char)
+                i += 1
+                continue
+            if i + 1 >= len(buffer):
+                break  # escape split across chunks
+            code = buffer[i + 1]
+            if code == "u":
+                if i + 6 > len(buffer):
+                    break
+                char = chr(int(buffer[i + 2:i + 6], 16))
+                i += 6
+                if "\ud800" <= char <= "\udbff":
+                    self._high_surrogate = char
+                    continue
+                if self._high_surrogate and "\udc00" <= char <= "\udfff":
+                    pair = self._high_surrogate + char
+                    char = pair.encode("utf-16", "surrogatepass").decode("utf-16")
+                self._high_surrogate = ""
+                out.append(char)
+                continue
+            out.append(self.ESCAPES.get(code, code))
+            i += 2
+        self._buffer = buffer[i:]
+        return "".join(out)
+
+
+async def stream_style(data: dict) -> AsyncIterator[Tuple[str, Any]]:
     """
+    Stream a recommendation as it is generated.
 
+    Yields ``("token", text)`` chunks of recommendation text followed by one
+    ``("result", {"text", "categories"})``. Cached recommendations are
+    yielded as a single token.
+    """
+    if RECOMMENDATION_CACHE_TTL > 0:
+        cached = await recommendation_cache.get(data)
+        if cached is not None:
+            yield ("token", cached["text"])
+            yield ("result", cached)
+            return
+
+    canonical = canonical_quiz(data)
+    chunks = []
+    streamed = []
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash-lite')
-        response = model.generate_content(prompt)
-        text = response.text
-
-        # Parse categories from response
-        categories = []
-        if "CATEGORIES:" in text:
-            parts = text.split("CATEGORIES:")
-            recommendations = parts[0].replace("RECOMMENDATIONS:", "").strip()
-            categories_text = parts[1].strip()
-            categories = [cat.strip() for cat in categories_text.split(",")]
-        else:
-            recommendations = text
-            # Default categories based on occasion
-            occasions = data.get('occasion', [])
-            if 'Work' in occasions or 'Formal' in occasions:
-                categories = ['men_blazerssuits', 'women_blazerssuits', 'men_trousers']
-            elif 'Casual' in occasions:
-                categories = ['men_jeans', 'women_jeans', 'men_tshirtstanks']
-            else:
-                categories = ['men_clothing', 'women_clothing']
-
-        return {
-            "text": recommendations,
-            "categories": categories[:3]  # Limit to 3 categories
-        }
-    except gcloud_exceptions.NotFound as e:
-        # Model not found for this API version — provide a safe deterministic fallback
-        print(f"⚠️ Gemini model not available: {e}. Returning fallback recommendations.")
-        occasions = data.get('occasion', [])
-        if 'Work' in occasions or 'Formal' in occasions:
-            categories = ['women_blazerssuits', 'men_blazerssuits', 'men_trousers']
-            recommendations = "Classic tailored outfit: blazer, crisp shirt, and tailored trousers. Colors: neutrals with a pop of color. Avoid overly casual items."
-        elif 'Casual' in occasions:
-            categories = ['women_jeans', 'men_jeans', 'women_tops']
-            recommendations = "Casual outfit: well-fitted jeans, comfortable top, and layered outerwear. Colors: denim and earth tones. Avoid formal fabrics."
-        else:
-            categories = ['women_clothing', 'men_clothing', 'women_tops']
-            recommendations = "Versatile outfit suggestion: mix basics with one statement piece. Stick to a coherent color palette and consider proportion."
-
-        return {
-            "text": recommendations,
-            "categories": categories[:3]
-        }
+        async with generation_slot():
+            # Timed until the last chunk arrives, including time the client takes to read tokens
+            with track_upstream("gemini", GEMINI_REQUEST_DURATION, GEMINI_ERRORS, operation="stream"):
+                response = await get_model().generate_content_async(
+                    build_prompt(canonical),
+                    stream=True,
+                    generation_config=GENERATION_CONFIG,
+                    request_options={"timeout": GEMINI_REQUEST_TIMEOUT},
+                )
+                extractor = _RecommendationExtractor()
+                last_chunk = None
+                async for chunk in response:
+                    last_chunk = chunk
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # Chunks without text parts (e.g. safety metadata)
+                        continue
+                    chunks.append(text)
+                    out = extractor.feed(text)
+                    if out:
+                        streamed.append(out)
+                        yield ("token", out)
+                # Usage metadata comes with the final chunk
+                record_usage("stream", last_chunk)
     except Exception as e:
-        print(f"❌ AI generation error: {e}")
-        raise
+        if chunks or not is_fallback_error(e):
+            raise
+        logger.warning("%s. Returning fallback recommendations.", e)
+        result = fallback_style(data)
+        yield ("token", result["text"])
+        yield ("result", result)
+        return
+
+    try:
+        result = parse_response("".join(chunks), canonical)
+    except AIResponseError as e:
+        if not streamed:
+            logger.warning("%s. Returning fallback recommendations.", e)
+            result = fallback_style(data)
+            yield ("token", result["text"])
+            yield ("result", result)
+            return
+        # Keep what the user already saw; not cached
+        logger.warning("%s. Keeping the streamed text.", e)
+        yield ("result", {"text": "".join(streamed).strip(), "categories": default_categories(canonical)})
+        return
+
+    if RECOMMENDATION_CACHE_TTL > 0:
+        await recommendation_cache.put(data, result)
+    yield ("result", result)
@@ -0,0 +1,245 @@
+"""
+In-process TTL + LRU cache with stale-while-revalidate and single-flight loading.
+
+Used in front of slow upstreams (H&M listings, AI recommendations). Values are
+shared between callers, so treat anything returned from the cache as read-only.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def json_sizeof(value: Any) -> int:
+    """Approximate the memory footprint of a JSON-like value by its encoded length."""
+    try:
+        return len(json.dumps(value, default=str, separators=(",", ":")))
+    except (TypeError, ValueError):
+        return 0
+
+
+class _Entry:
+    __slots__ = ("value", "size", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, size: int, fresh_until: float, stale_until: float):
+        self.value = value
+        self.size = size
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries expire after ``ttl`` seconds.
+
+    After ``ttl`` an entry is served stale for up to ``stale_ttl`` more seconds
+    while a single background refresh runs. Concurrent misses for the same key
+    share one loader call.
+
+    Args:
+        name: Label used in logs and stats
+        ttl: Seconds an entry is considered fresh
+        stale_ttl: Extra seconds a stale entry may be served while refreshing
+        max_entries: Maximum number of entries before LRU eviction
+        max_bytes: Optional bound on the summed ``sizeof`` of all entries
+        sizeof: Function estimating an entry's size in bytes
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        stale_ttl: float = 0,
+        max_entries: int = 1024,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = json_sizeof,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._bytes = 0
+        self._counters = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "load_errors": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a fresh value for ``key`` without loading, or ``default``."""
+        entry = self._entries.get(key)
+        if entry is None or entry.fresh_until <= time.monotonic():
+            return default
+        self._entries.move_to_end(key)
+        return entry.value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Return the value stored for ``key`` whatever its age, or ``default``.
+
+        For serving the last good copy when reloading it failed. Doesn't count
+        as a lookup or change the LRU order.
+        """
+        entry = self._entries.get(key)
+        return default if entry is None else entry.value
+
+    def get_many(self, keys: Iterable[Hashable]) -> Tuple[Dict[Hashable, Any], List[Hashable]]:
+        """
+        Look up several keys for callers that load the misses in one batch.
+
+        Returns the fresh values found and the keys that still need loading.
+        Hits and misses are counted like in ``get_or_load``.
+        """
+        found: Dict[Hashable, Any] = {}
+        missing: List[Hashable] = []
+        now = time.monotonic()
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None and entry.fresh_until > now:
+                self._counters["hits"] += 1
+                self._entries.move_to_end(key)
+                found[key] = entry.value
+            else:
+                self._counters["misses"] += 1
+                missing.append(key)
+        return found, missing
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store ``value`` under ``key``, evicting least recently used entries if needed."""
+        if not self.enabled:
+            return
+
+        size = self.sizeof(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            # Never cache a single value larger than the whole budget
+            self.invalidate(key)
+            return
+
+        now = time.monotonic()
+        self.invalidate(key)
+        self._entries[key] = _Entry(value, size, now + self.ttl, now + self.ttl + self.stale_ttl)
+        self._bytes += size
+        self._evict()
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop ``key`` from the cache if present."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def clear(self) -> None:
+        """Drop every entry. Counters are kept."""
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters and current occupancy."""
+        lookups = self._counters["hits"] + self._counters["stale_hits"] + self._counters["misses"]
+        served = self._counters["hits"] + self._counters["stale_hits"]
+        return {
+            "name": self.name,
+            **self._counters,
+            "hit_ratio": round(served / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "inflight": len(self._inflight),
+        }
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value for ``key``, calling ``loader`` on a miss.
+
+        Fresh entries are returned directly. Stale entries are returned
+        immediately and refreshed once in the background. Misses are
+        coalesced so concurrent callers await the same loader call. Loader
+        errors propagate to every waiting caller and are not cached.
+        """
+        if not self.enabled:
+            return await loader()
+
+        now = time.monotonic()
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            if entry.fresh_until > now:
+                self._counters["hits"] += 1
+                self._entries.move_to_end(key)
+                return entry.value
+
+            if entry.stale_until > now:
+                self._counters["stale_hits"] += 1
+                self._entries.move_to_end(key)
+                if key not in self._inflight:
+                    self._counters["refreshes"] += 1
+                    self._start_load(key, loader, background=True)
+                return entry.value
+
+            # Keep the expired value until the reload replaces it, so ``peek``
+            # can still offer it if the upstream is down
+            self._counters["expirations"] += 1
+
+        self._counters["misses"] += 1
+        future = self._inflight.get(key)
+        if future is not None:
+            self._counters["coalesced"] += 1
+        else:
+            future = self._start_load(key, loader, background=False)
+        return await asyncio.shield(future)
+
+    def _start_load(
+        self, key: Hashable, loader: Callable[[], Awaitable[Any]], background: bool
+    ) -> asyncio.Future:
+        future = asyncio.ensure_future(self._load(key, loader, background))
+        self._inflight[key] = future
+        return future
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], background: bool) -> Any:
+        try:
+            value = await loader()
+        except Exception as e:
+            if background:
+                self._counters["refresh_errors"] += 1
+                logger.warning("%s cache refresh failed for %s: %s", self.name, key, e)
+                return None
+            self._counters["load_errors"] += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        self.set(key, value)
+        return value
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes and self._bytes > self.max_bytes and self._entries
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self._counters["evictions"] += 1
@@ -0,0 +1,384 @@
+"""
+Local mirror of the H&M product catalog.
+
+A background job pages through the configured H&M categories via
+``hm_client``, normalizes every product once and stores it in SQLite with
+secondary indexes on category, numeric price, color and size. The quiz
+endpoint queries this mirror instead of calling H&M on every request.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+from services import hm_client
+from services.products import extract_product_list, normalize_product
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CATALOG_DB_PATH = os.getenv("CATALOG_DB_PATH", "catalog.db")
+CATALOG_CATEGORIES = [
+    c.strip() for c in os.getenv("CATALOG_CATEGORIES", "ladies_all").split(",") if c.strip()
+]
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "30"))
+CATALOG_MAX_PAGES = int(os.getenv("CATALOG_MAX_PAGES", "20"))
+CATALOG_SYNC_INTERVAL = float(os.getenv("CATALOG_SYNC_INTERVAL", "21600"))  # 0 disables the job
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    code TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    price_value REAL,
+    payload TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_products_price ON products (price_value);
+
+CREATE TABLE IF NOT EXISTS product_categories (
+    category TEXT NOT NULL,
+    code TEXT NOT NULL,
+    PRIMARY KEY (category, code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_product_categories_code ON product_categories (code);
+
+CREATE TABLE IF NOT EXISTS product_colors (
+    color TEXT NOT NULL,
+    code TEXT NOT NULL,
+    PRIMARY KEY (color, code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_product_colors_code ON product_colors (code);
+
+CREATE TABLE IF NOT EXISTS product_sizes (
+    size TEXT NOT NULL,
+    code TEXT NOT NULL,
+    PRIMARY KEY (size, code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_product_sizes_code ON product_sizes (code);
+"""
+
+_PRICE_RE = re.compile(r"\d+(?:[.,]\d+)?")
+_WORD_RE = re.compile(r"[a-z]+")
+# Spelling variants so quiz colors match H&M color names
+_COLOR_ALIASES = {"gray": "grey"}
+
+
+def parse_price(item: dict) -> Optional[float]:
+    """Extract a numeric price from a raw H&M item."""
+    prices = item.get('prices')
+    if isinstance(prices, list) and prices and isinstance(prices[0], dict):
+        value = prices[0].get('price')
+        if isinstance(value, (int, float)):
+            return float(value)
+        formatted = prices[0].get('formattedPrice')
+    elif isinstance(item.get('price'), dict):
+        value = item['price'].get('value')
+        if isinstance(value, (int, float)):
+            return float(value)
+        formatted = item['price'].get('formattedValue') or item['price'].get('formatted')
+    elif isinstance(item.get('articlePrice'), dict):
+        formatted = item['articlePrice'].get('formatted')
+    else:
+        formatted = item.get('price') or item.get('formattedPrice')
+
+    if isinstance(formatted, (int, float)):
+        return float(formatted)
+    if isinstance(formatted, str):
+        match = _PRICE_RE.search(formatted.replace(",", "") if "." in formatted else formatted)
+        if match:
+            return float(match.group(0).replace(",", "."))
+    return None
+
+
+def normalize_color(value: str) -> List[str]:
+    """Split a color name into lowercase tokens ('Dark Grey' -> ['dark', 'grey'])."""
+    return [_COLOR_ALIASES.get(word, word) for word in _WORD_RE.findall(value.lower())]
+
+
+def extract_colors(item: dict) -> List[str]:
+    """
+    Collect color tokens of the listed article itself.
+
+    Swatches and ``articleColorNames`` describe sibling variants with other
+    images, so they are not indexed: a color filter must match what is shown.
+    """
+    names = []
+    if isinstance(item.get('colorName'), str):
+        names.append(item['colorName'])
+    if isinstance(item.get('color'), dict) and isinstance(item['color'].get('text'), str):
+        names.append(item['color']['text'])
+
+    tokens = set()
+    for name in names:
+        tokens.update(normalize_color(name))
+    return sorted(tokens)
+
+
+def normalize_size(value: str) -> str:
+    return value.strip().upper()
+
+
+def extract_sizes(item: dict) -> List[str]:
+    """Collect available size labels, if the listing includes them."""
+    sizes = set()
+    for key in ('sizes', 'availableSizes', 'variantSizes'):
+        values = item.get(key)
+        if not isinstance(values, list):
+            continue
+        for value in values:
+            if isinstance(value, dict):
+                value = value.get('name') or value.get('sizeCode') or value.get('filterCode')
+            if isinstance(value, (str, int)) and str(value).strip():
+                sizes.add(normalize_size(str(value)))
+    return sorted(sizes)
+
+
+class ProductCatalog:
+    """
+    SQLite-backed product store with secondary indexes.
+
+    Reads and writes use separate connections so a sync running in a worker
+    thread never blocks queries made from the event loop (WAL mode). A
+    ':memory:' catalog has a single connection, so reads and writes take
+    turns on one lock.
+    """
+
+    def __init__(self, path: str = CATALOG_DB_PATH):
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        self._writer.executescript(SCHEMA)
+        self._writer.commit()
+        # ':memory:' databases are per-connection, so share the one we have
+        if path == ":memory:":
+            self._reader = self._writer
+            self._read_lock = self._write_lock
+        else:
+            self._reader = self._connect()
+            self._read_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        if self.path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def close(self) -> None:
+        if self._reader is not self._writer:
+            self._reader.close()
+        self._writer.close()
+
+    def _read(self, sql: str, params: Iterable = ()) -> list:
+        with self._read_lock:
+            return self._reader.execute(sql, tuple(params)).fetchall()
+
+    def count(self) -> int:
+        """Number of products in the catalog (a full scan; see ``is_empty``)."""
+        return self._read("SELECT COUNT(*) FROM products")[0][0]
+
+    def is_empty(self) -> bool:
+        """Whether no product has been synced yet."""
+        return not self._read("SELECT 1 FROM products LIMIT 1")
+
+    def has_category(self, category: str) -> bool:
+        """Whether ``category`` has been synced into the catalog."""
+        return bool(self._read("SELECT 1 FROM product_categories WHERE category = ? LIMIT 1", (category,)))
+
+    def replace_category(self, category: str, raw_items: Iterable) -> int:
+        """
+        Replace the contents of ``category`` with freshly fetched raw items.
+
+        Runs in a single transaction so readers see either the old or the new
+        listing. Returns the number of products stored.
+        """
+        now = time.time()
+        rows = []
+        for item in raw_items:
+            try:
+                product = normalize_product(item)
+            except Exception as e:
+                logger.debug("Skipping catalog item that failed to normalize: %s", e)
+                continue
+            if product is None:
+                continue
+            raw = item if isinstance(item, dict) else {}
+            rows.append((product, parse_price(raw), extract_colors(raw), extract_sizes(raw)))
+
+        with self._write_lock, self._writer:
+            conn = self._writer
+            conn.execute("DELETE FROM product_categories WHERE category = ?", (category,))
+            for product, price_value, colors, sizes in rows:
+                code = product['code']
+                conn.execute(
+                    "INSERT OR REPLACE INTO products (code, name, price_value, payload, synced_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (code, product['name'], price_value, json.dumps(product), now),
+                )
+                conn.execute(
+                    "INSERT OR IGNORE INTO product_categories (category, code) VALUES (?, ?)",
+                    (category, code),
+                )
+                conn.execute("DELETE FROM product_colors WHERE code = ?", (code,))
+                conn.executemany(
+                    "INSERT OR IGNORE INTO product_colors (color, code) VALUES (?, ?)",
+                    [(color, code) for color in colors],
+                )
+                conn.execute("DELETE FROM product_sizes WHERE code = ?", (code,))
+                conn.executemany(
+                    "INSERT OR IGNORE INTO product_sizes (size, code) VALUES (?, ?)",
+                    [(size, code) for size in sizes],
+                )
+            # Drop products no longer listed in any category
+            conn.execute(
+                "DELETE FROM products WHERE code NOT IN (SELECT code FROM product_categories)"
+            )
+            conn.execute("DELETE FROM product_colors WHERE code NOT IN (SELECT code FROM products)")
+            conn.execute("DELETE FROM product_sizes WHERE code NOT IN (SELECT code FROM products)")
+
+        return len(rows)
+
+    def query(
+        self,
+        categories: Optional[List[str]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        colors: Optional[List[str]] = None,
+        sizes: Optional[List[str]] = None,
+        limit: int = 12,
+    ) -> List[dict]:
+        """
+        Return normalized products matching every given filter.
+
+        Colors match any token of the product's color name. Products whose
+        listing carried no size data are kept when filtering by size.
+        """
+        clauses = []
+        params: list = []
+
+        if categories:
+            clauses.append(
+                f"p.code IN (SELECT code FROM product_categories WHERE category IN ({_placeholders(categories)}))"
+            )
+            params.extend(categories)
+        if min_price is not None:
+            clauses.append("p.price_value >= ?")
+            params.append(min_price)
+        if max_price is not None:
+            clauses.append("p.price_value <= ?")
+            params.append(max_price)
+        if colors:
+            tokens = sorted({token for color in colors for token in normalize_color(color)})
+            if tokens:
+                clauses.append(
+                    f"p.code IN (SELECT code FROM product_colors WHERE color IN ({_placeholders(tokens)}))"
+                )
+                params.extend(tokens)
+        if sizes:
+            labels = sorted({normalize_size(size) for size in sizes if size and size.strip()})
+            if labels:
+                clauses.append(
+                    f"(p.code IN (SELECT code FROM product_sizes WHERE size IN ({_placeholders(labels)}))"
+                    " OR NOT EXISTS (SELECT 1 FROM product_sizes s WHERE s.code = p.code))"
+                )
+                params.extend(labels)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT p.payload FROM products p {where} ORDER BY p.price_value LIMIT ?"
+        params.append(limit)
+
+        return [json.loads(row[0]) for row in self._read(sql, params)]
+
+
+def _placeholders(values: list) -> str:
+    return ", ".join("?" for _ in values)
+
+
+async def sync_catalog(
+    catalog: ProductCatalog,
+    categories: Optional[List[str]] = None,
+    page_size: int = CATALOG_PAGE_SIZE,
+    max_pages: int = CATALOG_MAX_PAGES,
+) -> dict:
+    """
+    Page through each category on H&M and store the results in ``catalog``.
+
+    A category that fails to fetch, returns an error payload or comes back
+    empty keeps its previous contents.
+
+    Returns:
+        Dictionary mapping category to the number of products stored
+    """
+    summary = {}
+    for category in categories or CATALOG_CATEGORIES:
+        raw_items = []
+        try:
+            for page in range(1, max_pages + 1):
+                data = await hm_client.hm_list_products(category, page=page, size=page_size, cache=False)
+                if isinstance(data, dict) and data.get('error'):
+                    raise ValueError(f"error payload: {data['error']}")
+                page_items = extract_product_list(data)
+                raw_items.extend(page_items)
+
+                total = None
+                if isinstance(data, dict) and isinstance(data.get('plpList'), dict):
+                    total = data['plpList'].get('numberOfHits')
+                if len(page_items) < page_size or (isinstance(total, int) and len(raw_items) >= total):
+                    break
+        except Exception as e:
+            logger.warning("Catalog sync failed for category=%s: %s", category, e)
+            continue
+        if not raw_items:
+            # An empty listing is far more likely an upstream hiccup than a
+            # category that really sold out, so don't wipe it
+            logger.warning("Catalog sync returned no products for category=%s; keeping previous contents", category)
+            continue
+
+        stored = await asyncio.to_thread(catalog.replace_category, category, raw_items)
+        summary[category] = stored
+        logger.info("Catalog synced category=%s: %d products", category, stored, extra={"category": category, "products": stored})
+
+    return summary
+
+
+async def run_sync_loop(catalog: ProductCatalog, interval: float = CATALOG_SYNC_INTERVAL) -> None:
+    """Sync the catalog immediately, then every ``interval`` seconds until cancelled."""
+    while True:
+        try:
+            await sync_catalog(catalog)
+        except Exception:
+            logger.exception("Catalog sync error")
+        await asyncio.sleep(interval)
+
+
+# Shared catalog, owned by the app lifespan
+_catalog: Optional[ProductCatalog] = None
+
+
+def open_catalog(path: str = CATALOG_DB_PATH) -> ProductCatalog:
+    """Open (creating if needed) the shared catalog."""
+    global _catalog
+    _catalog = ProductCatalog(path)
+    return _catalog
+
+
+def close_catalog() -> None:
+    global _catalog
+    if _catalog is not None:
+        _catalog.close()
+        _catalog = None
+
+
+def get_catalog() -> Optional[ProductCatalog]:
+    """Return the shared catalog, or None when it hasn't been opened."""
+    return _catalog
@@ -1,26 +1,112 @@
+"""
+MongoDB connection using PyMongo's async API.
+
+The client is created and closed by the FastAPI lifespan in ``main.py`` via
+``init_database`` / ``close_database``, so every DB call in a route handler
+is awaited instead of blocking the event loop. Creating the client does no
+I/O (connections are opened in the background), and each worker process
+builds its own after any fork.
+"""
+
+import asyncio
+import logging
 import os
 import certifi
-import ssl
-from pymongo.mongo_client import MongoClient
+from typing import Optional
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.database import AsyncDatabase
 from pymongo.server_api import ServerApi
 from dotenv import load_dotenv
+from utils.metrics import mongo_listeners
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 uri = os.getenv("MONGODB_URI")
+MONGODB_DB = os.getenv("MONGODB_DB", "dressly")
+
+# Pool, timeout and read preference settings
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "10000"))
+MONGODB_READ_PREFERENCE = os.getenv("MONGODB_READ_PREFERENCE", "primary")
+MONGODB_TLS = os.getenv("MONGODB_TLS", "true").lower() in ("1", "true", "yes")
+# Upper bound for startup and readiness pings, in seconds
+MONGODB_PING_TIMEOUT = float(os.getenv("MONGODB_PING_TIMEOUT", "2"))
+
+# Shared client, owned by the app lifespan
+client: Optional[AsyncMongoClient] = None
+
+
+class DatabaseUnavailable(RuntimeError):
+    """Raised when the database is used but no client is configured."""
+
+
+def create_client() -> AsyncMongoClient:
+    """Build an async client configured from the MONGODB_* environment settings."""
+    if not uri:
+        raise DatabaseUnavailable("MONGODB_URI is missing. Add it in backend/.env")
+
+    options = {}
+    if MONGODB_TLS:
+        # Use certifi's CA bundle so Atlas SSL certs verify correctly on macOS
+        options.update(tls=True, tlsCAFile=certifi.where())
+
+    return AsyncMongoClient(
+        uri,
+        server_api=ServerApi('1'),
+        maxPoolSize=MONGODB_MAX_POOL_SIZE,
+        minPoolSize=MONGODB_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+        readPreference=MONGODB_READ_PREFERENCE,
+        # Command latency/error and connection-pool metrics for /metrics
+        event_listeners=mongo_listeners(MONGODB_MAX_POOL_SIZE),
+        **options,
+    )
+
+
+async def init_database(mongo_client: Optional[AsyncMongoClient] = None) -> Optional[AsyncMongoClient]:
+    """
+    Install the shared client, building a default one unless given.
+
+    Without MONGODB_URI no client is installed and the app runs without a
+    database (``get_database`` raises ``DatabaseUnavailable``).
+    """
+    global client
+    try:
+        client = mongo_client or create_client()
+    except DatabaseUnavailable as e:
+        logger.error("%s; starting without a database.", e)
+    return client
+
+
+async def ping(timeout: float = MONGODB_PING_TIMEOUT) -> bool:
+    """Whether the server answers a ping within ``timeout`` seconds."""
+    if client is None:
+        return False
+    try:
+        await asyncio.wait_for(client.admin.command('ping'), timeout)
+        return True
+    except Exception as e:
+        logger.debug("MongoDB ping failed: %s", e)
+        return False
 
-if not uri:
-    raise RuntimeError("MONGODB_URI is missing. Add it in backend/.env")
 
-# Use certifi's CA bundle so Atlas SSL certs verify correctly on macOS
-tls_ca_file = certifi.where()
+async def close_database() -> None:
+    """Close the shared client and its connection pool."""
+    global client
+    if client is not None:
+        await client.close()
+        client = None
 
-# Create a new client and connect to the server (explicit TLS CA)
-client = MongoClient(uri, server_api=ServerApi('1'), tls=True, tlsCAFile=tls_ca_file)
 
-# Send a ping to confirm a successful connection
-try:
-    client.admin.command('ping')
-    print("✅ Successfully connected to MongoDB!")
-except Exception as e:
-    print(f"❌ MongoDB connection error: {e}")
\ No newline at end of file
+def get_database() -> AsyncDatabase:
+    """Return the application database."""
+    if client is None:
+        raise DatabaseUnavailable("MongoDB client is not initialized. Call init_database() first.")
+    return client[MONGODB_DB]
@@ -1,51 +1,248 @@
 """
 H&M API client using RapidAPI.
-Provides functions to fetch product listings from H&M.
+Provides functions to fetch product listings and details from H&M.
+
+A single pooled ``httpx.AsyncClient`` is shared by every request. It is
+created and closed by the FastAPI lifespan in ``main.py`` via
+``init_client`` / ``close_client``; tests can pass their own client (for
+example one built on ``httpx.MockTransport``) to ``init_client``.
+
+Every call goes through ``hm_breaker``, is retried with jittered backoff on
+transient errors (timeouts, connection errors, 5xx) and, with HM_HEDGE
+enabled, is duplicated once it runs longer than the endpoint's recent p95
+latency, keeping whichever answer arrives first. While the breaker is open,
+or when a listing can't be loaded at all, ``hm_list_products`` serves the
+last good copy from ``listing_cache`` if it has one.
 """
 
+import asyncio
+import logging
 import os
+import time
 import httpx
+from typing import Dict, Optional
 from dotenv import load_dotenv
+from services.cache import TTLCache
+from services.rate_limit import RateLimitExceeded, RateLimiter
+from services.resilience import CircuitBreaker, CircuitOpenError, LatencyWindow, backoff_delay
+from utils.metrics import (
+    HM_ERRORS,
+    HM_FALLBACKS,
+    HM_HEDGES,
+    HM_REQUEST_DURATION,
+    HM_RETRIES,
+    error_label,
+    set_pool_limit,
+    track_upstream,
+)
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Configuration
 RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY")
 RAPIDAPI_HOST = os.getenv("RAPIDAPI_HOST", "apidojo-hm-hennes-mauritz-v1.p.rapidapi.com")
 HM_COUNTRY = os.getenv("HM_COUNTRY", "us")
 HM_LANG = os.getenv("HM_LANG", "en")
 
-if not RAPIDAPI_KEY:
-    raise RuntimeError("RAPIDAPI_KEY is missing. Add it in backend/.env")
+# Connection pool and timeout settings
+HM_MAX_CONNECTIONS = int(os.getenv("HM_MAX_CONNECTIONS", "100"))
+HM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HM_KEEPALIVE_EXPIRY = float(os.getenv("HM_KEEPALIVE_EXPIRY", "30"))
+HM_HTTP2 = os.getenv("HM_HTTP2", "false").lower() in ("1", "true", "yes")
+HM_CONNECT_TIMEOUT = float(os.getenv("HM_CONNECT_TIMEOUT", "5"))
+HM_READ_TIMEOUT = float(os.getenv("HM_READ_TIMEOUT", "20"))
+HM_WRITE_TIMEOUT = float(os.getenv("HM_WRITE_TIMEOUT", "5"))
+HM_POOL_TIMEOUT = float(os.getenv("HM_POOL_TIMEOUT", "5"))
+
+# Listing cache settings (HM_CACHE_TTL=0 disables the cache)
+HM_CACHE_TTL = float(os.getenv("HM_CACHE_TTL", "300"))
+HM_CACHE_STALE_TTL = float(os.getenv("HM_CACHE_STALE_TTL", "600"))
+HM_CACHE_MAX_ENTRIES = int(os.getenv("HM_CACHE_MAX_ENTRIES", "256"))
+HM_CACHE_MAX_BYTES = int(os.getenv("HM_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Client-side budget for the RapidAPI quota (requests per second, 0 = unlimited).
+# Calls queue up to HM_RATE_MAX_WAIT seconds for a token, then fail with
+# RateLimitExceeded; a 429 holds calls back for its Retry-After (or HM_QUOTA_BACKOFF).
+HM_RATE_PER_SECOND = float(os.getenv("HM_RATE_PER_SECOND", "0"))
+HM_RATE_BURST = float(os.getenv("HM_RATE_BURST", "0"))
+HM_RATE_MAX_WAIT = float(os.getenv("HM_RATE_MAX_WAIT", "2"))
+HM_QUOTA_BACKOFF = float(os.getenv("HM_QUOTA_BACKOFF", "5"))
+
+# Retries after transient errors, waiting a random 0..min(max, base * 2^n) seconds
+HM_MAX_RETRIES = int(os.getenv("HM_MAX_RETRIES", "2"))
+HM_RETRY_BASE_DELAY = float(os.getenv("HM_RETRY_BASE_DELAY", "0.2"))
+HM_RETRY_MAX_DELAY = float(os.getenv("HM_RETRY_MAX_DELAY", "2"))
+
+# Hedged requests: send a second copy of a request that is still running after
+# the HM_HEDGE_PERCENTILE latency of its endpoint (known once HM_HEDGE_MIN_SAMPLES
+# calls succeeded), but never before HM_HEDGE_MIN_DELAY seconds. Costs quota.
+HM_HEDGE = os.getenv("HM_HEDGE", "false").lower() in ("1", "true", "yes")
+HM_HEDGE_PERCENTILE = float(os.getenv("HM_HEDGE_PERCENTILE", "95"))
+HM_HEDGE_MIN_DELAY = float(os.getenv("HM_HEDGE_MIN_DELAY", "0.1"))
+HM_HEDGE_MIN_SAMPLES = int(os.getenv("HM_HEDGE_MIN_SAMPLES", "20"))
+
+# Circuit breaker: open after HM_BREAKER_FAILURES consecutive failed calls
+# (0 disables it), try again after HM_BREAKER_RESET_TIMEOUT seconds
+HM_BREAKER_FAILURES = int(os.getenv("HM_BREAKER_FAILURES", "5"))
+HM_BREAKER_RESET_TIMEOUT = float(os.getenv("HM_BREAKER_RESET_TIMEOUT", "30"))
+
+# Status codes worth retrying; 429 is handled by holding back ``hm_limiter`` instead
+RETRYABLE_STATUS = {500, 502, 503, 504}
 
 HEADERS = {
-    "X-RapidAPI-Key": RAPIDAPI_KEY,
+    "X-RapidAPI-Key": RAPIDAPI_KEY or "",
     "X-RapidAPI-Host": RAPIDAPI_HOST,
     "Accept": "application/json",
 }
 
-BASE_URL = f"https://{RAPIDAPI_HOST}"
+# Listing category IDs Gemini may suggest for a quiz (see ai_model.RESPONSE_SCHEMA);
+# HM_CATEGORY_IDS replaces them with a comma-separated list
+DEFAULT_CATEGORY_IDS = (
+    "women_dresses", "women_tops", "women_jeans", "women_blazerssuits", "women_clothing",
+    "men_shirts", "men_tshirtstanks", "men_trousers", "men_jeans", "men_blazerssuits", "men_clothing",
+)
+HM_CATEGORY_IDS = tuple(
+    c.strip().lower() for c in os.getenv("HM_CATEGORY_IDS", "").split(",") if c.strip()
+) or DEFAULT_CATEGORY_IDS
+
+# Point HM_BASE_URL at a local fake server (see benchmarks/fake_hm.py) for testing
+BASE_URL = os.getenv("HM_BASE_URL", f"https://{RAPIDAPI_HOST}")
+
+# Shared client, owned by the app lifespan
+_client: Optional[httpx.AsyncClient] = None
+
+hm_limiter = RateLimiter("hm", HM_RATE_PER_SECOND, HM_RATE_BURST, max_wait=HM_RATE_MAX_WAIT)
+hm_breaker = CircuitBreaker("hm", HM_BREAKER_FAILURES, HM_BREAKER_RESET_TIMEOUT)
+
+# Recent latencies of successful requests per endpoint, for the hedging threshold
+_latencies: Dict[str, LatencyWindow] = {}
+
+# Listings keyed on (category, page, size, country, lang). Cached payloads are
+# shared between requests and must not be mutated by callers.
+listing_cache = TTLCache(
+    "hm_listings",
+    ttl=HM_CACHE_TTL,
+    stale_ttl=HM_CACHE_STALE_TTL,
+    max_entries=HM_CACHE_MAX_ENTRIES,
+    max_bytes=HM_CACHE_MAX_BYTES,
+)
+
+
+def create_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """
+    Build a pooled client configured from the HM_* environment settings.
+
+    Args:
+        transport: Optional transport override (e.g. ``httpx.MockTransport``)
+
+    Returns:
+        A new ``httpx.AsyncClient`` bound to the RapidAPI base URL
+    """
+    http2 = HM_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HM_HTTP2 is enabled but the 'h2' package is not installed. Falling back to HTTP/1.1.")
+            http2 = False
+
+    if not RAPIDAPI_KEY:
+        # Requests will be rejected; quiz routes fall back to the catalog mirror
+        logger.error("RAPIDAPI_KEY is missing. Add it in backend/.env")
+
+    set_pool_limit("hm", HM_MAX_CONNECTIONS)
+
+    return httpx.AsyncClient(
+        base_url=BASE_URL,
+        headers=HEADERS,
+        http2=http2,
+        transport=transport,
+        limits=httpx.Limits(
+            max_connections=HM_MAX_CONNECTIONS,
+            max_keepalive_connections=HM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=HM_CONNECT_TIMEOUT,
+            read=HM_READ_TIMEOUT,
+            write=HM_WRITE_TIMEOUT,
+            pool=HM_POOL_TIMEOUT,
+        ),
+    )
+
+
+def init_client(client: Optional[httpx.AsyncClient] = None) -> httpx.AsyncClient:
+    """Install the shared client. Builds a default one unless ``client`` is given."""
+    global _client
+    _client = client or create_client()
+    return _client
+
+
+async def close_client() -> None:
+    """Close the shared client and release its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def status() -> str:
+    """``"ok"``, ``"not configured"`` when no RapidAPI key is set, or ``"circuit open"``."""
+    if not RAPIDAPI_KEY:
+        return "not configured"
+    return "circuit open" if hm_breaker.current_state() == CircuitBreaker.OPEN else "ok"
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily outside the app (e.g. scripts)."""
+    if _client is None:
+        return init_client()
+    return _client
 
 
 async def hm_list_products(
-    categories: str, 
+    categories: str,
     page: int = 1,  # RapidAPI uses 1-indexed pages
-    size: int = 30
+    size: int = 30,
+    cache: bool = True,
 ) -> dict:
     """
-    Fetch product listings from H&M API.
-    
+    Fetch product listings from H&M API, served from ``listing_cache`` when possible.
+
     Args:
         categories: Category ID (e.g., 'men_trousers', 'women_dresses')
-        page: Page number for pagination (default: 0)
+        page: Page number for pagination (default: 1)
         size: Number of products per page (default: 30)
-        
+        cache: Set to False to bypass ``listing_cache`` (e.g. bulk catalog syncs)
+
     Returns:
-        Dictionary containing product results and metadata
-        
+        Dictionary containing product results and metadata (read-only)
+
     Raises:
-        httpx.HTTPStatusError: If the API request fails
+        httpx.HTTPError: If the API request fails and no earlier copy is cached
+        CircuitOpenError: If the circuit is open and no earlier copy is cached
+        RateLimitExceeded: If the H&M budget is exhausted and no earlier copy is cached
     """
+    if not cache:
+        return await _fetch_products(categories, page, size)
+
+    key = (categories, page, size, HM_COUNTRY, HM_LANG)
+    try:
+        return await listing_cache.get_or_load(key, lambda: _fetch_products(categories, page, size))
+    except (httpx.HTTPError, CircuitOpenError, RateLimitExceeded) as e:
+        last_good = listing_cache.peek(key)
+        if last_good is None:
+            raise
+        reason = {CircuitOpenError: "circuit_open", RateLimitExceeded: "rate_limited"}.get(type(e), "error")
+        HM_FALLBACKS.labels(reason).inc()
+        logger.warning("Serving the last good H&M listing for category=%s: %s", categories, e)
+        return last_good
+
+
+async def _fetch_products(categories: str, page: int, size: int) -> dict:
+    """Call the RapidAPI listing endpoint, bypassing the cache."""
     params = {
         "country": HM_COUNTRY,
         "lang": HM_LANG,
@@ -54,24 +251,171 @@ async def hm_list_products(
         "categoryId": categories,  # API requires 'categoryId'
     }
 
-    url = f"{BASE_URL}/products/v2/list"
-    print(f"Calling H&M API: {url}")
-    print(f"Parameters: {params}")
+    return await _get("/products/v2/list", params, f"category={categories}")
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        response = await client.get(url, headers=HEADERS, params=params)
+
+async def hm_product_detail(code: str) -> dict:
+    """
+    Fetch one product's details (all colour articles, prices, gallery) from H&M.
+
+    Not cached; used by the background wishlist refresh.
+
+    Args:
+        code: Article code as stored in the wishlist (e.g. '0839915011')
+
+    Returns:
+        Dictionary with a ``product`` object
+
+    Raises:
+        httpx.HTTPError: If the API request fails (404 for unknown codes)
+        CircuitOpenError: If the circuit breaker is open
+        RateLimitExceeded: If the H&M budget has no token within HM_RATE_MAX_WAIT
+    """
+    params = {
+        "country": HM_COUNTRY,
+        "lang": HM_LANG,
+        "productcode": code,
+    }
+    return await _get("/products/detail", params, f"product={code}")
+
+
+def retry_after(response: httpx.Response, default: float) -> float:
+    """Seconds from a ``Retry-After`` header (delta-seconds form), or ``default``."""
+    try:
+        return max(0.0, float(response.headers["retry-after"]))
+    except (KeyError, ValueError):
+        return default
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether a failed GET may succeed if repeated: network errors, timeouts and 5xx answers."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS
+    return isinstance(exc, httpx.TransportError)
+
+
+def hedge_delay(url: str) -> Optional[float]:
+    """Seconds after which a request to ``url`` is hedged, or None (disabled, or too few samples)."""
+    if not HM_HEDGE:
+        return None
+    window = _latencies.get(url)
+    threshold = window.percentile(HM_HEDGE_PERCENTILE) if window is not None else None
+    if threshold is None:
+        return None
+    return max(threshold, HM_HEDGE_MIN_DELAY)
+
+
+async def _get(url: str, params: dict, label: str) -> dict:
+    """
+    GET ``url`` through the circuit breaker, retrying transient errors.
+
+    Raises:
+        CircuitOpenError: If the circuit breaker is open
+        RateLimitExceeded: If the H&M budget has no token within HM_RATE_MAX_WAIT
+        httpx.HTTPError: If the request failed (after retries, for transient errors)
+    """
+    trial = hm_breaker.before_call()
+    try:
+        data = await _get_with_retries(url, params, label)
+    except BaseException as e:
+        if is_transient(e):
+            hm_breaker.record_failure(trial)
+        elif isinstance(e, httpx.HTTPStatusError):
+            # The API answered (404, 429...): it is up
+            hm_breaker.record_success(trial)
+        else:
+            # Rejected by the rate limit, cancelled...: says nothing about the API
+            hm_breaker.release(trial)
+        raise
+    hm_breaker.record_success(trial)
+    return data
+
+
+async def _get_with_retries(url: str, params: dict, label: str) -> dict:
+    for attempt in range(HM_MAX_RETRIES + 1):
+        try:
+            return await _hedged_get(url, params, label)
+        except httpx.HTTPError as e:
+            if attempt >= HM_MAX_RETRIES or not is_transient(e):
+                raise
+            delay = backoff_delay(attempt, HM_RETRY_BASE_DELAY, HM_RETRY_MAX_DELAY)
+            HM_RETRIES.labels(url, error_label(e)).inc()
+            logger.info("Retrying H&M API %s for %s in %.2fs after %s", url, label, delay, error_label(e))
+            await asyncio.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+async def _hedged_get(url: str, params: dict, label: str) -> dict:
+    """Send the request, and a second copy if the first is slower than the hedging threshold."""
+    await hm_limiter.acquire()
+    delay = hedge_delay(url)
+    if delay is None:
+        return await _request(url, params, label)
+
+    tasks = [asyncio.ensure_future(_request(url, params, label))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            try:
+                # Only hedge with quota to spare
+                await hm_limiter.acquire(max_wait=0)
+            except RateLimitExceeded:
+                return await tasks[0]
+            HM_HEDGES.labels(url, "sent").inc()
+            logger.debug("Hedging H&M API %s for %s after %.3fs", url, label, delay)
+            tasks.append(asyncio.ensure_future(_request(url, params, label)))
+
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not tasks[0]:
+                        HM_HEDGES.labels(url, "won").inc()
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # mark a losing attempt's error as retrieved
+
+
+async def _request(url: str, params: dict, label: str) -> dict:
+    """
+    One GET of ``url`` on the shared client, returning the decoded JSON body.
+
+    Raises:
+        httpx.HTTPError: If the API request fails
+    """
+    logger.debug("Calling H&M API %s", url, extra={"params": params})
+
+    client = get_client()
+    start = time.perf_counter()
+    with track_upstream("hm", HM_REQUEST_DURATION, HM_ERRORS, endpoint=url):
+        response = await client.get(url, params=params)
         try:
             response.raise_for_status()
-        except httpx.HTTPStatusError as exc:
-            # Print response body for debugging
-            text = None
+        except httpx.HTTPStatusError:
+            # Log (the start of) the response body for debugging
             try:
-                text = response.text
+                text = response.text[:500]
             except Exception:
                 text = '<unreadable response body>'
-            print(f"H&M API error {response.status_code} for category={categories}: {text}")
+            logger.warning("H&M API error %s for %s: %s", response.status_code, label, text)
+            if response.status_code == 429:
+                await hm_limiter.penalize(retry_after(response, HM_QUOTA_BACKOFF))
             raise
-
         data = response.json()
-        print(f"H&M API OK: returned keys={list(data.keys()) if isinstance(data, dict) else type(data)}")
-        return data
+
+    window = _latencies.get(url)
+    if window is None:
+        window = _latencies[url] = LatencyWindow(min_samples=HM_HEDGE_MIN_SAMPLES)
+    window.observe(time.perf_counter() - start)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("H&M API OK for %s: keys=%s", label, list(data) if isinstance(data, dict) else type(data).__name__)
+    return data
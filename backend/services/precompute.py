@@ -0,0 +1,214 @@
+"""
+Offline precomputation of style recommendations.
+
+Recommendations mostly depend on a quiz's style profile: the occasion, style
+vibe and colour answers, chosen from the fixed options of the front-end quiz
+(``front-end/src/lib/quizSteps.tsx``). This job enumerates profiles, asks
+Gemini for each through ``ai_model`` (bounded concurrency, rate limited) and
+writes the results to RECOMMENDATION_PRECOMPUTED_PATH, which the app loads
+into memory at startup (see ``recommendation_cache``).
+
+Profiles already in the file for the current model and prompt version are
+skipped, so an interrupted run continues where it stopped:
+
+    python -m services.precompute [--max-occasions 1] [--max-styles 1] [--max-colors 1]
+    python -m services.precompute --from-history 500   # most common profiles in quiz_results
+    python -m services.precompute --fake --output /tmp/precomputed.db   # local stand-in model
+
+Results from ``--fake`` are stored under a separate version, so the app never
+serves them.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter, deque
+from itertools import combinations
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+from services import ai_model
+from services.rate_limit import MemoryBackend, RateLimiter
+from services.recommendation_cache import RecommendationStore, cache_key, canonical_quiz, profile_quiz
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Concurrent Gemini calls and the overall call rate (per minute, 0 = unlimited)
+PRECOMPUTE_CONCURRENCY = int(os.getenv("PRECOMPUTE_CONCURRENCY", "4"))
+PRECOMPUTE_RATE_PER_MINUTE = float(os.getenv("PRECOMPUTE_RATE_PER_MINUTE", "60"))
+# Seconds a precomputed recommendation stays valid
+PRECOMPUTE_TTL = float(os.getenv("PRECOMPUTE_TTL", str(30 * 86400)))
+
+JOB_NAME = "precompute"
+
+# Options offered by the front-end quiz
+OCCASIONS = ("Work", "Casual", "Date", "Party", "Travel", "Formal")
+STYLE_VIBES = ("Minimal", "Street", "Smart-casual", "Athleisure", "Classic", "Trendy")
+COLORS = ("Black", "White", "Beige", "Navy", "Grey", "Olive", "Brown", "Denim")
+
+
+def _selections(options: Iterable[str], smallest: int, largest: int) -> List[Tuple[str, ...]]:
+    options = tuple(options)
+    return [
+        combo
+        for size in range(smallest, min(largest, len(options)) + 1)
+        for combo in combinations(options, size)
+    ]
+
+
+def enumerate_profiles(max_occasions: int = 1, max_styles: int = 1, max_colors: int = 1) -> Iterator[dict]:
+    """
+    Yield canonical style profiles, picking up to ``max_*`` options per question.
+
+    Occasion and style vibe need at least one answer; colours may be left empty.
+    """
+    for occasion in _selections(OCCASIONS, 1, max_occasions):
+        for style in _selections(STYLE_VIBES, 1, max_styles):
+            for colors in _selections(COLORS, 0, max_colors):
+                yield profile_quiz(
+                    canonical_quiz({"occasion": list(occasion), "style_vibe": list(style), "colors_like": list(colors)})
+                )
+
+
+async def profiles_from_history(limit: int, scan: int = 50000) -> List[dict]:
+    """The ``limit`` most common style profiles among the latest ``scan`` saved quiz results."""
+    from services import database
+
+    await database.init_database()
+    try:
+        counts: Counter = Counter()
+        profiles: Dict[str, dict] = {}
+        cursor = database.get_database()["quiz_results"].find({}, {"quiz_answers": 1}).sort("_id", -1).limit(scan)
+        async for result in cursor:
+            profile = profile_quiz(canonical_quiz(result.get("quiz_answers") or {}))
+            if not profile["occasion"] or not profile["style_vibe"]:
+                continue
+            key = cache_key(profile, "")
+            counts[key] += 1
+            profiles[key] = profile
+        return [profiles[key] for key, _ in counts.most_common(limit)]
+    finally:
+        await database.close_database()
+
+
+async def precompute(
+    profiles: Iterable[dict],
+    store: RecommendationStore,
+    version: str,
+    concurrency: int = PRECOMPUTE_CONCURRENCY,
+    rate_per_minute: float = PRECOMPUTE_RATE_PER_MINUTE,
+    ttl: float = PRECOMPUTE_TTL,
+    refresh: bool = False,
+) -> dict:
+    """
+    Generate and store a recommendation for every profile not stored yet.
+
+    Args:
+        profiles: Canonical style profiles (see ``enumerate_profiles``)
+        store: Store to write to; also the record of finished profiles
+        version: Model/prompt version the results are stored under
+        concurrency: Gemini calls in flight at most
+        rate_per_minute: Gemini calls started per minute at most (0 = unlimited)
+        ttl: Seconds the results stay valid
+        refresh: Regenerate profiles that are already stored
+
+    Returns:
+        Counters: ``generated``, ``skipped`` (already stored) and ``failed``
+    """
+    done = set() if refresh else set(await asyncio.to_thread(store.load, version))
+    counters = {"generated": 0, "skipped": 0, "failed": 0}
+    # Spaces this job's calls evenly; GEMINI_RATE_* in ai_model still applies on top
+    limiter = RateLimiter(JOB_NAME, rate_per_minute / 60, burst=1, max_wait=float("inf"), backend=MemoryBackend())
+    started = time.monotonic()
+
+    pending = deque()
+    seen = set()
+    for profile in profiles:
+        key = cache_key(profile, version)
+        if key in seen:
+            continue
+        seen.add(key)
+        if key in done:
+            counters["skipped"] += 1
+            continue
+        pending.append((key, profile))
+
+    async def worker() -> None:
+        # A fixed pool drains the queue, so a large run never holds more than
+        # ``concurrency`` calls (or tasks) at once
+        while pending:
+            key, profile = pending.popleft()
+            await limiter.acquire()
+            try:
+                result = await ai_model.generate_uncached(profile)
+                await asyncio.to_thread(store.set, key, version, result, ttl)
+            except Exception as e:
+                # Nothing is stored, so the next run retries this profile
+                counters["failed"] += 1
+                logger.warning("Precompute failed for %s: %s", profile, e)
+                continue
+            counters["generated"] += 1
+            if counters["generated"] % 50 == 0:
+                logger.info("Precomputed %d recommendations", counters["generated"], extra=counters)
+
+    await asyncio.gather(*(worker() for _ in range(min(max(concurrency, 1), len(pending)))))
+
+    logger.info("Precompute finished in %.1fs", time.monotonic() - started, extra=counters)
+    return counters
+
+
+async def main(argv: Optional[List[str]] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-occasions", type=int, default=1, help="Most occasions picked together")
+    parser.add_argument("--max-styles", type=int, default=1, help="Most style vibes picked together")
+    parser.add_argument("--max-colors", type=int, default=1, help="Most colours picked together")
+    parser.add_argument("--from-history", type=int, metavar="N", help="Use the N most common profiles in quiz_results")
+    parser.add_argument("--output", default=ai_model.RECOMMENDATION_PRECOMPUTED_PATH)
+    parser.add_argument("--concurrency", type=int, default=PRECOMPUTE_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=PRECOMPUTE_RATE_PER_MINUTE, help="Gemini calls per minute")
+    parser.add_argument("--refresh", action="store_true", help="Regenerate profiles that are already stored")
+    parser.add_argument("--fake", action="store_true", help="Use the local stand-in model (benchmarks.fake_gemini)")
+    parser.add_argument("--fake-latency-ms", type=float, default=200)
+    parser.add_argument("--dry-run", action="store_true", help="Only count the profiles")
+    args = parser.parse_args(argv)
+
+    from utils.log import setup_logging
+
+    setup_logging()
+
+    if args.from_history:
+        profiles = await profiles_from_history(args.from_history)
+    else:
+        profiles = list(enumerate_profiles(args.max_occasions, args.max_styles, args.max_colors))
+    if args.dry_run:
+        return {"profiles": len(profiles)}
+    if not args.output:
+        parser.error("--output (or RECOMMENDATION_PRECOMPUTED_PATH) is required")
+
+    version = ai_model.recommendation_cache.version
+    if args.fake:
+        from benchmarks.fake_gemini import FakeGeminiModel
+
+        ai_model.init_model(FakeGeminiModel(latency_ms=args.fake_latency_ms))
+        version = f"fake:{version}"
+    else:
+        ai_model.init_model()
+        if ai_model.model_status() != "ok":
+            parser.error("GEMINI_API_KEY is not set (use --fake to run against the local stand-in)")
+
+    try:
+        store = RecommendationStore(args.output)
+    except sqlite3.Error as e:
+        parser.error(f"can't open {args.output}: {e}")
+    try:
+        return await precompute(profiles, store, version, args.concurrency, args.rate, refresh=args.refresh)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    print(asyncio.run(main()))
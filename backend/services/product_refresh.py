@@ -0,0 +1,184 @@
+"""
+Background refresh of wishlisted product data.
+
+Wishlist entries reference the shared ``products`` collection, which is
+written when users save items. This job walks that collection in code order,
+fetches fresh details from H&M in batches (bounded concurrency, rate
+limited), and bulk-writes only the fields that changed. Progress is
+checkpointed after each batch in ``job_state`` so a restarted process
+resumes where it stopped.
+
+It runs on a schedule from the FastAPI lifespan in ``main.py``. A single
+pass can be run by hand, e.g. against the local fake H&M server:
+
+    HM_BASE_URL=http://127.0.0.1:8099 python -m services.product_refresh
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+from pymongo.asynchronous.database import AsyncDatabase
+from dotenv import load_dotenv
+from services import hm_client
+from services.products import extract_detail_item, normalize_record
+from services.rate_limit import MemoryBackend, RateLimiter
+from services.repositories import JobStateRepository, ProductRepository
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Seconds between full passes (0 disables the scheduled job)
+PRODUCT_REFRESH_INTERVAL = float(os.getenv("PRODUCT_REFRESH_INTERVAL", "86400"))
+# Products per batch (one bulk write and one checkpoint each)
+PRODUCT_REFRESH_BATCH_SIZE = int(os.getenv("PRODUCT_REFRESH_BATCH_SIZE", "50"))
+# Concurrent H&M detail requests and the overall request rate (per second, 0 = unlimited)
+PRODUCT_REFRESH_CONCURRENCY = int(os.getenv("PRODUCT_REFRESH_CONCURRENCY", "4"))
+PRODUCT_REFRESH_RATE = float(os.getenv("PRODUCT_REFRESH_RATE", "5"))
+# Wait before retrying a pass that failed (e.g. database unavailable)
+PRODUCT_REFRESH_RETRY_DELAY = float(os.getenv("PRODUCT_REFRESH_RETRY_DELAY", "60"))
+
+JOB_NAME = "product_refresh"
+
+# Fields refreshed from H&M; the product code never changes
+REFRESH_FIELDS = ("name", "price", "images")
+
+
+def fresh_fields(detail: dict, code: str) -> Optional[dict]:
+    """Refreshable fields of ``code`` from a detail response, omitting ones H&M left empty."""
+    record = normalize_record(extract_detail_item(detail, code) or {})
+    if record is None:
+        return None
+
+    fields = {}
+    if record.name:
+        fields["name"] = record.name
+    if record.price.get("formattedValue"):
+        fields["price"] = record.price
+    if record.images and record.images[0].get("url"):
+        fields["images"] = record.images
+    return fields
+
+
+def changed_fields(stored: dict, fresh: dict) -> dict:
+    """The subset of ``fresh`` that differs from the stored product."""
+    return {field: fresh[field] for field in REFRESH_FIELDS if field in fresh and fresh[field] != stored.get(field)}
+
+
+async def refresh_products(
+    db: AsyncDatabase,
+    fetch_detail: Callable[[str], Awaitable[dict]] = hm_client.hm_product_detail,
+    batch_size: int = PRODUCT_REFRESH_BATCH_SIZE,
+    concurrency: int = PRODUCT_REFRESH_CONCURRENCY,
+    rate: float = PRODUCT_REFRESH_RATE,
+) -> dict:
+    """
+    Run one refresh pass, resuming from the last checkpoint if a pass was interrupted.
+
+    Args:
+        db: Application database
+        fetch_detail: Coroutine returning the H&M detail response for a code
+        batch_size: Products fetched and written per batch
+        concurrency: Maximum detail requests in flight
+        rate: Maximum detail requests per second (0 = unlimited)
+
+    Returns:
+        Counters for the pass: scanned, changed, unchanged and failed products
+    """
+    products = ProductRepository(db)
+    jobs = JobStateRepository(db)
+
+    state = await jobs.get(JOB_NAME)
+    last_code = state.get("last_code")
+    counters = {"scanned": 0, "changed": 0, "unchanged": 0, "failed": 0}
+    if last_code:
+        counters.update({name: state.get(name, 0) for name in counters})
+        logger.info("Resuming product refresh after code=%s", last_code)
+    else:
+        await jobs.save(JOB_NAME, last_code=None, started_at=datetime.utcnow(), finished_at=None, **counters)
+
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    # A private bucket of one token spaces this pass's calls evenly; the shared
+    # H&M budget in hm_client still applies on top
+    limiter = RateLimiter(JOB_NAME, rate, burst=1, max_wait=float("inf"), backend=MemoryBackend())
+
+    async def fetch(code: str) -> Optional[dict]:
+        async with semaphore:
+            await limiter.acquire()
+            try:
+                return fresh_fields(await fetch_detail(code), code)
+            except Exception as e:
+                logger.warning("Product refresh failed for code=%s: %s", code, e)
+                return None
+
+    while True:
+        batch = await products.list_after(last_code, batch_size)
+        if not batch:
+            break
+
+        results = await asyncio.gather(*(fetch(product["code"]) for product in batch))
+        changes = {}
+        for stored, fresh in zip(batch, results):
+            if fresh is None:
+                counters["failed"] += 1
+                continue
+            diff = changed_fields(stored, fresh)
+            if diff:
+                changes[stored["code"]] = diff
+            else:
+                counters["unchanged"] += 1
+
+        counters["changed"] += await products.update_fields(changes)
+        counters["scanned"] += len(batch)
+        last_code = batch[-1]["code"]
+        await jobs.save(JOB_NAME, last_code=last_code, **counters)
+
+    await jobs.save(JOB_NAME, last_code=None, finished_at=datetime.utcnow(), **counters)
+    logger.info("Product refresh finished", extra=counters)
+    return counters
+
+
+async def seconds_until_due(db: AsyncDatabase, interval: float) -> float:
+    """Seconds until the next pass should start; 0 if one is due or was interrupted."""
+    state = await JobStateRepository(db).get(JOB_NAME)
+    finished_at = state.get("finished_at")
+    if state.get("last_code") or not finished_at:
+        return 0.0
+    return max(interval - (datetime.utcnow() - finished_at).total_seconds(), 0.0)
+
+
+async def run_refresh_loop(db: AsyncDatabase, interval: float = PRODUCT_REFRESH_INTERVAL) -> None:
+    """Refresh products every ``interval`` seconds until cancelled."""
+    while True:
+        try:
+            delay = await seconds_until_due(db, interval)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            await refresh_products(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Product refresh error")
+            await asyncio.sleep(PRODUCT_REFRESH_RETRY_DELAY)
+
+
+async def main() -> None:
+    """Run a single pass outside the app."""
+    from services import database
+    from utils.log import setup_logging
+
+    setup_logging()
+    await database.init_database()
+    hm_client.init_client()
+    try:
+        await refresh_products(database.get_database())
+    finally:
+        await hm_client.close_client()
+        await database.close_database()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
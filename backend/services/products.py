@@ -0,0 +1,359 @@
+"""
+Product normalization.
+
+Turns raw H&M listing payloads into the product shape expected by the
+frontend. Field fallbacks are declared once in ``PRODUCT_SPEC`` and turned
+into precomputed getter closures at import time; listings are normalized in
+one batch pass into ``__slots__`` records.
+"""
+
+import logging
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, Query
+
+logger = logging.getLogger(__name__)
+
+# A path walks dict keys and list indexes, e.g. ("prices", 0, "formattedPrice")
+Path = Tuple[Any, ...]
+
+PRODUCT_SPEC = {
+    # Common H&M fields: 'articleCode' or 'productCode'
+    "code": [("articleCode",), ("productCode",), ("code",), ("id",)],
+    # Name fields may vary
+    "name": [("productName",), ("name",), ("articleName",)],
+    # Price may be in 'prices' array, 'price' object, or 'articlePrice'.
+    # Each source is (object path, formatted value keys, currency keys, default currency);
+    # the first source whose object exists wins.
+    "price": {
+        "sources": [
+            (("prices", 0), ("formattedPrice",), (), "USD"),
+            (("price",), ("formattedValue", "formatted", "formattedPrice"), ("currency", "currencyIso"), ""),
+            (("articlePrice",), ("formatted",), ("currency",), ""),
+        ],
+        "scalar": [("price",), ("formattedPrice",)],
+    },
+    "images": {
+        # H&M API has productImage as main image
+        "primary": [("productImage",)],
+        # Image arrays, with the keys that may hold the URL
+        "lists": [(("images",), ("url", "imageUrl", "src"))],
+        # Used only when nothing above produced an image
+        "fallbacks": [("image",), ("mainImage",), ("plpImage", "url"), ("plpImage", "src")],
+    },
+}
+
+
+class ProductRecord:
+    """A normalized product. ``raw`` keeps the upstream item for debugging."""
+
+    __slots__ = ("code", "name", "price", "images", "raw")
+
+    def __init__(self, code: str, name: str, price: dict, images: List[dict], raw: Any = None):
+        self.code = code
+        self.name = name
+        self.price = price
+        self.images = images
+        self.raw = raw
+
+    def to_dict(self, include_raw: bool = True) -> dict:
+        product = {
+            'code': self.code,
+            'name': self.name,
+            'price': self.price,
+            'images': self.images,
+        }
+        if include_raw and self.raw is not None:
+            product['raw'] = self.raw
+        return product
+
+
+def _path_getter(path: Path) -> Callable[[dict], Any]:
+    """Build a function returning the value at ``path`` in an item dict (or None)."""
+    first, rest = path[0], path[1:]
+    if not rest and isinstance(first, str):
+        # Most paths are a single top-level key
+        return lambda item: item.get(first)
+
+    def get(item: dict) -> Any:
+        obj = item.get(first) if isinstance(first, str) else None
+        for step in rest:
+            if isinstance(step, int):
+                obj = obj[step] if type(obj) is list and len(obj) > step else None
+            else:
+                obj = obj.get(step) if type(obj) is dict else None
+        return obj
+
+    return get
+
+
+def _first_getter(paths: Sequence[Path]) -> Callable[[dict], Any]:
+    """Build a function returning the first truthy value among ``paths`` (or None)."""
+    if all(len(path) == 1 and isinstance(path[0], str) for path in paths):
+        keys = tuple(path[0] for path in paths)
+        return lambda item: _first_key(item, keys, None)
+
+    getters = tuple(_path_getter(path) for path in paths)
+
+    def first(item: dict) -> Any:
+        for get in getters:
+            value = get(item)
+            if value:
+                return value
+        return None
+
+    return first
+
+
+def _first_key(obj: dict, keys: Sequence[str], default: str) -> Any:
+    for key in keys:
+        value = obj.get(key)
+        if value:
+            return value
+    return default
+
+
+def compile_normalizer(spec: dict, as_dict: bool = False) -> Callable[[Any], Any]:
+    """
+    Build a normalizer for a field-mapping spec (see ``PRODUCT_SPEC``).
+
+    Every path in the spec is turned into a getter once, so normalizing an
+    item only calls the precomputed getters instead of walking the spec.
+
+    Args:
+        spec: Field fallbacks, shaped like ``PRODUCT_SPEC``
+        as_dict: Build frontend dicts directly instead of ``ProductRecord`` objects
+
+    Returns:
+        A function mapping one raw item to a record (or dict), or None when
+        the item has no usable product code
+    """
+    get_code = _first_getter(spec["code"])
+    get_name = _first_getter(spec["name"])
+    price_sources = tuple(
+        (_path_getter(path), tuple(formatted_keys), tuple(currency_keys), default_currency)
+        for path, formatted_keys, currency_keys, default_currency in spec["price"]["sources"]
+    )
+    get_scalar_price = _first_getter(spec["price"]["scalar"])
+    images = spec["images"]
+    primary_images = tuple(_path_getter(path) for path in images["primary"])
+    image_lists = tuple((_path_getter(path), tuple(url_keys)) for path, url_keys in images["lists"])
+    get_fallback_image = _first_getter(images["fallbacks"])
+
+    def normalize(item):
+        if type(item) is not dict:
+            return fallback(item)
+        code = get_code(item)
+        if not code:
+            return None
+        name = get_name(item)
+
+        # Values are coerced to str: some listings carry numeric prices, and the
+        # Product response model only accepts strings
+        for get_obj, formatted_keys, currency_keys, default_currency in price_sources:
+            obj = get_obj(item)
+            if type(obj) is dict:
+                price = {
+                    'formattedValue': str(_first_key(obj, formatted_keys, '')),
+                    'currencyIso': str(_first_key(obj, currency_keys, default_currency)),
+                }
+                break
+        else:
+            # Fallbacks
+            price = {'formattedValue': str(get_scalar_price(item) or ''), 'currencyIso': ''}
+
+        urls = []
+        for get_url in primary_images:
+            url = get_url(item)
+            if url and url not in urls:
+                urls.append(url)
+        for get_entries, url_keys in image_lists:
+            entries = get_entries(item)
+            if type(entries) is list:
+                for entry in entries:
+                    if type(entry) is dict:
+                        url = _first_key(entry, url_keys, '')
+                        # Lists are short, so a membership test beats building a set
+                        if url and url not in urls:
+                            urls.append(url)
+        if not urls:
+            url = get_fallback_image(item)
+            if url:
+                urls.append(url)
+        images = [{'url': str(u)} for u in urls] if urls else [{'url': ''}]
+
+        if as_dict:
+            return {'code': str(code), 'name': str(name or ''), 'price': price, 'images': images, 'raw': item}
+        return ProductRecord(str(code), str(name or ''), price, images, item)
+
+    def fallback(item):
+        # A bare string is treated as the product code
+        if isinstance(item, str):
+            record = ProductRecord(
+                item,
+                f'Product {item}',
+                {'formattedValue': 'See H&M', 'currencyIso': 'USD'},
+                [{'url': f'https://image.hm.com/assets/hm/productpage/{item}.jpg'}],
+            )
+            return record.to_dict() if as_dict else record
+        if isinstance(item, dict):
+            # dict subclasses are copied so the getters only ever see plain dicts
+            return normalize(dict(item))
+        return None
+
+    return normalize
+
+
+normalize_record = compile_normalizer(PRODUCT_SPEC)
+_normalize_product_dict = compile_normalizer(PRODUCT_SPEC, as_dict=True)
+
+
+def extract_product_list(products_data) -> list:
+    """
+    Pull the raw product array out of an H&M listing response.
+
+    The API returns ``{ plpList: { productList: [...] } }`` but older shapes
+    put ``productList`` or ``results`` at the root.
+    """
+    if not isinstance(products_data, dict):
+        return []
+
+    if 'plpList' in products_data:
+        plp_data = products_data['plpList']
+        if isinstance(plp_data, dict):
+            return plp_data.get('productList') or []
+        logger.warning("plpList is not a dict")
+        return []
+
+    # Fallback: check for productList at root level
+    if 'productList' in products_data:
+        return products_data['productList'] or []
+
+    # Fallback: check for results array
+    if 'results' in products_data:
+        return products_data['results'] or []
+
+    return []
+
+
+def format_price(value, currency: str = "") -> str:
+    """Format a numeric price the way H&M listings display it (``$24.99``)."""
+    if isinstance(value, str):
+        return value
+    if not isinstance(value, (int, float)):
+        return ""
+    if currency in ("", "USD"):
+        return f"${value:.2f}"
+    return f"{value:.2f} {currency}"
+
+
+def extract_detail_item(detail, code: str) -> Optional[dict]:
+    """
+    Flatten a ``products/detail`` response into a listing-shaped item for ``normalize_record``.
+
+    The detail endpoint returns the product with one entry per colour in
+    ``articlesList``; the entry matching ``code`` supplies name, price and
+    images, falling back to the product-level values.
+    """
+    product = detail.get('product') if isinstance(detail, dict) else None
+    if not isinstance(product, dict):
+        return None
+
+    article = next(
+        (a for a in product.get('articlesList') or [] if isinstance(a, dict) and a.get('code') == code),
+        {},
+    )
+    # A sale price (redPrice) takes precedence over the regular one
+    price = (
+        article.get('redPrice') or article.get('whitePrice')
+        or product.get('redPrice') or product.get('whitePrice') or {}
+    )
+    currency = price.get('currency') or ''
+    gallery = article.get('galleryDetails') or product.get('galleryDetails') or []
+
+    return {
+        'code': code,
+        'name': article.get('name') or product.get('name'),
+        'price': {
+            'formattedValue': price.get('formattedValue') or format_price(price.get('price'), currency),
+            'currencyIso': currency,
+        },
+        'images': [
+            {'url': image.get('baseUrl') or image.get('url')} for image in gallery if isinstance(image, dict)
+        ],
+    }
+
+
+def _normalize_all(raw_list: Optional[Iterable], normalize: Callable[[Any], Any]) -> list:
+    """Run ``normalize`` over a raw product array in one pass, skipping unusable items."""
+    records = []
+    append = records.append
+    skipped_count = 0
+    for item in raw_list or ():
+        try:
+            record = normalize(item)
+        except Exception:
+            record = None
+        if record is None:
+            skipped_count += 1
+        else:
+            append(record)
+
+    if skipped_count:
+        logger.debug("Normalized %d products, skipped %d", len(records), skipped_count)
+    return records
+
+
+def normalize_listing(raw_list: Optional[Iterable]) -> List[ProductRecord]:
+    """Normalize a raw product array into ``ProductRecord`` objects."""
+    return _normalize_all(raw_list, normalize_record)
+
+
+def normalize_product(item) -> Optional[dict]:
+    """Normalize a single H&M item to ``{code, name, price, images, raw}``, or None."""
+    return _normalize_product_dict(item)
+
+
+def normalize_products(raw_list) -> List[dict]:
+    """Normalize a raw product array to frontend product dicts."""
+    return _normalize_all(raw_list, _normalize_product_dict)
+
+
+# Fields a client may request with ``?fields=``; ``raw`` is opt-in
+PRODUCT_FIELDS = ("code", "name", "price", "images", "raw")
+DEFAULT_PRODUCT_FIELDS = ("code", "name", "price", "images")
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """
+    Parse a comma-separated ``fields`` parameter into product field names.
+
+    Returns ``DEFAULT_PRODUCT_FIELDS`` when ``fields`` is empty and raises
+    ValueError for unknown names.
+    """
+    if not fields:
+        return DEFAULT_PRODUCT_FIELDS
+
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in PRODUCT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown product fields: {', '.join(unknown)}. Allowed: {', '.join(PRODUCT_FIELDS)}")
+    return names or DEFAULT_PRODUCT_FIELDS
+
+
+FIELDS_DESCRIPTION = (
+    "Comma-separated product fields to return "
+    f"(default: {','.join(DEFAULT_PRODUCT_FIELDS)}; add 'raw' for the upstream H&M item)"
+)
+
+
+def product_fields(fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)) -> Tuple[str, ...]:
+    """Route dependency parsing the ``fields`` projection parameter; unknown names are a 400."""
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def project_products(products: List[dict], fields: Sequence[str] = DEFAULT_PRODUCT_FIELDS) -> List[dict]:
+    """Keep only ``fields`` of each product dict (missing fields are left out)."""
+    return [{name: product[name] for name in fields if name in product} for product in products]
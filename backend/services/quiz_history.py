@@ -0,0 +1,188 @@
+"""
+Write-behind persistence of quiz results.
+
+``record`` turns a quiz outcome into a ``quiz_results`` document (the shape
+of ``models.database.QuizResultModel``) and appends it to an in-process
+buffer without waiting for MongoDB, so saving history adds no latency to
+``/quiz/submit``. A background task started by the FastAPI lifespan writes
+the buffer with ``insert_many`` as soon as QUIZ_HISTORY_BATCH_SIZE results
+are waiting, or every QUIZ_HISTORY_FLUSH_INTERVAL seconds, and once more on
+shutdown.
+
+A failed write leaves its batch buffered for the next flush. At most
+QUIZ_HISTORY_MAX_PENDING results are held; while MongoDB is down, newer
+results are dropped (and counted) instead of growing memory. Results still
+buffered when a worker is killed are lost.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+from bson.objectid import ObjectId
+from dotenv import load_dotenv
+from services import database
+from services.products import DEFAULT_PRODUCT_FIELDS, project_products
+from services.repositories import QuizResultRepository
+from utils.metrics import WRITE_BUFFER_DOCUMENTS, WRITE_BUFFER_FLUSHES, WRITE_BUFFER_PENDING
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Results written per insert_many, and the longest a result waits to be written
+QUIZ_HISTORY_BATCH_SIZE = int(os.getenv("QUIZ_HISTORY_BATCH_SIZE", "100"))
+QUIZ_HISTORY_FLUSH_INTERVAL = float(os.getenv("QUIZ_HISTORY_FLUSH_INTERVAL", "1"))
+# Results buffered at most (e.g. while MongoDB is unreachable) before new ones are dropped
+QUIZ_HISTORY_MAX_PENDING = int(os.getenv("QUIZ_HISTORY_MAX_PENDING", "10000"))
+
+
+class WriteBehindBuffer:
+    """
+    Documents queued in memory and written in batches by a background task.
+
+    Args:
+        name: Buffer name, used in logs and metrics
+        write: Coroutine function writing one batch (raises on failure)
+        batch_size: Most documents per write; a full batch triggers a flush
+        flush_interval: Seconds between flushes of partial batches
+        max_pending: Documents held at most before ``add`` drops new ones
+    """
+
+    def __init__(
+        self,
+        name: str,
+        write: Callable[[List[dict]], Awaitable[int]],
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_pending: int = 10000,
+    ):
+        self.name = name
+        self.write = write
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: List[dict] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._dropping = False
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, document: dict) -> bool:
+        """Queue ``document`` for writing. Returns False if the buffer is full and it was dropped."""
+        if len(self._pending) >= self.max_pending:
+            WRITE_BUFFER_DOCUMENTS.labels(self.name, "dropped").inc()
+            if not self._dropping:
+                logger.error("%s buffer is full (%d pending); dropping new documents", self.name, len(self._pending))
+                self._dropping = True
+            return False
+
+        self._pending.append(document)
+        WRITE_BUFFER_PENDING.labels(self.name).set(len(self._pending))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def flush(self) -> bool:
+        """Write everything pending, batch by batch. Returns False if a write failed."""
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            try:
+                await self.write(batch)
+            except Exception as e:
+                WRITE_BUFFER_FLUSHES.labels(self.name, "failed").inc()
+                logger.warning("Failed to write %d %s documents, will retry: %s", len(batch), self.name, e)
+                return False
+
+            # Documents added during the write sit after the batch
+            del self._pending[:len(batch)]
+            self._dropping = False
+            WRITE_BUFFER_FLUSHES.labels(self.name, "ok").inc()
+            WRITE_BUFFER_DOCUMENTS.labels(self.name, "written").inc(len(batch))
+            WRITE_BUFFER_PENDING.labels(self.name).set(len(self._pending))
+        return True
+
+    def start(self) -> None:
+        """Start the background flush task (in the running event loop)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the background task and write what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if not await self.flush():
+            logger.error("Lost %d unwritten %s documents at shutdown", len(self._pending), self.name)
+            self._pending.clear()
+            WRITE_BUFFER_PENDING.labels(self.name).set(0)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not await self.flush():
+                # Don't hammer an unavailable database on every full batch
+                await asyncio.sleep(self.flush_interval)
+
+
+async def _write_results(results: List[dict]) -> int:
+    return await QuizResultRepository(database.get_database()).insert_many(results)
+
+
+result_buffer = WriteBehindBuffer(
+    "quiz_results",
+    _write_results,
+    batch_size=QUIZ_HISTORY_BATCH_SIZE,
+    flush_interval=QUIZ_HISTORY_FLUSH_INTERVAL,
+    max_pending=QUIZ_HISTORY_MAX_PENDING,
+)
+
+
+def build_result(user_id: Optional[str], answers: dict, ai_result: dict, products: List[dict]) -> dict:
+    """A ``quiz_results`` document; the ``_id`` is assigned now so history keeps submission order."""
+    return {
+        "_id": ObjectId(),
+        "user_id": user_id,
+        "quiz_answers": answers,
+        "recommendation": ai_result.get("text", ""),
+        "categories_searched": list(ai_result.get("categories") or []),
+        "products": project_products(products, DEFAULT_PRODUCT_FIELDS),
+        "created_at": datetime.utcnow(),
+    }
+
+
+def record(user_id: Optional[str], answers: dict, ai_result: dict, products: List[dict]) -> None:
+    """
+    Queue a quiz outcome for saving. Never blocks or raises.
+
+    Args:
+        user_id: Id of the signed-in user, or None for anonymous quizzes
+        answers: The submitted quiz (``QuizInput.model_dump()``)
+        ai_result: Recommendation from ``generate_style`` (``text`` and ``categories``)
+        products: Products shown to the user
+    """
+    if database.client is None:
+        return
+    try:
+        result_buffer.add(build_result(user_id, answers, ai_result, products))
+    except Exception:
+        logger.exception("Failed to queue quiz result")
+
+
+def start() -> None:
+    result_buffer.start()
+
+
+async def stop() -> None:
+    await result_buffer.close()
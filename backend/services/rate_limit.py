@@ -0,0 +1,247 @@
+"""
+Token-bucket rate limiting for upstream quotas and per-client admission.
+
+A ``RateLimiter`` has a rate (tokens per second) and a burst size. Its
+buckets, one per client key, live in a pluggable backend:
+
+- ``MemoryBackend`` (default): per process, fine for a single worker.
+- ``RedisBackend``: shared by every worker through a Redis-compatible server
+  (RATE_LIMIT_BACKEND=redis, RATE_LIMIT_REDIS_URL), updated atomically by a
+  Lua script using the server's clock.
+
+``acquire`` reserves a token, sleeping until it is available when that is
+within ``max_wait`` seconds (queueing with a deadline), and otherwise raises
+``RateLimitExceeded`` straight away so the caller can degrade to cached or
+fallback content. The backend is chosen by ``init_backend`` from the FastAPI
+lifespan, so the Redis connection is opened after any worker fork.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+from utils.metrics import RATE_LIMIT_DECISIONS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# "memory" (per process) or "redis" (shared across workers)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://127.0.0.1:6379/0")
+# Buckets kept by the in-memory backend before the least recently used are dropped
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a token is not available within the allowed wait."""
+
+    def __init__(self, limiter: str, retry_after: float):
+        super().__init__(f"Rate limit '{limiter}' exceeded, retry after {retry_after:.1f}s")
+        self.limiter = limiter
+        self.retry_after = retry_after
+
+
+class MemoryBackend:
+    """Buckets in a per-process LRU dict."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> (tokens, last update); tokens go negative for queued reservations
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def reserve(self, key: str, rate: float, burst: float, max_wait: float) -> Tuple[bool, float]:
+        """
+        Take one token if it is available within ``max_wait`` seconds.
+
+        Returns:
+            ``(True, wait)`` with the seconds to wait before using the token,
+            or ``(False, retry_after)`` without taking one
+        """
+        now = time.monotonic()
+        tokens = self._refill(key, rate, burst, now)
+        wait = max(0.0, (1 - tokens) / rate)
+        if wait > max_wait:
+            self._store(key, tokens, now)
+            return False, wait
+        self._store(key, tokens - 1, now)
+        return True, wait
+
+    async def penalize(self, key: str, rate: float, burst: float, seconds: float) -> None:
+        """Empty the bucket so no token is available for ``seconds``."""
+        now = time.monotonic()
+        self._store(key, min(self._refill(key, rate, burst, now), 1 - seconds * rate), now)
+
+    async def close(self) -> None:
+        self._buckets.clear()
+
+    def _refill(self, key: str, rate: float, burst: float, now: float) -> float:
+        tokens, updated = self._buckets.get(key, (burst, now))
+        return min(burst, tokens + (now - updated) * rate)
+
+    def _store(self, key: str, tokens: float, now: float) -> None:
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+
+# KEYS[1] = bucket; ARGV = rate, burst, max_wait, penalty seconds (0 = reserve)
+_REDIS_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local penalty = tonumber(ARGV[4])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+
+local granted = 1
+local wait = math.max(0, (1 - tokens) / rate)
+if penalty > 0 then
+    tokens = math.min(tokens, 1 - penalty * rate)
+    granted = 0
+elseif wait > max_wait then
+    granted = 0
+else
+    tokens = tokens - 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(((burst - tokens) / rate + 1) * 1000))
+return {granted, tostring(wait)}
+"""
+
+
+class RedisBackend:
+    """
+    Buckets shared through a Redis-compatible server.
+
+    Errors talking to the server are logged and the request is let through,
+    so an outage of the limiter store doesn't take the API down with it.
+    """
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, prefix: str = "ratelimit:"):
+        import redis.asyncio as redis
+
+        self.prefix = prefix
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(_REDIS_SCRIPT)
+
+    async def ping(self) -> None:
+        await self._client.ping()
+
+    async def _run(self, key: str, rate: float, burst: float, max_wait: float, penalty: float) -> Tuple[bool, float]:
+        granted, wait = await self._script(keys=[self.prefix + key], args=[rate, burst, max_wait, penalty])
+        return bool(int(granted)), float(wait)
+
+    async def reserve(self, key: str, rate: float, burst: float, max_wait: float) -> Tuple[bool, float]:
+        try:
+            return await self._run(key, rate, burst, max_wait, 0)
+        except Exception as e:
+            logger.warning("Rate limit store error, allowing request: %s", e)
+            return True, 0.0
+
+    async def penalize(self, key: str, rate: float, burst: float, seconds: float) -> None:
+        try:
+            await self._run(key, rate, burst, 0, seconds)
+        except Exception as e:
+            logger.warning("Rate limit store error: %s", e)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+_backend = MemoryBackend()
+
+
+def get_backend():
+    """The backend used by limiters that weren't given their own."""
+    return _backend
+
+
+async def init_backend(kind: str = RATE_LIMIT_BACKEND, url: str = RATE_LIMIT_REDIS_URL) -> None:
+    """Select the shared backend. Falls back to per-process buckets if Redis is unusable."""
+    global _backend
+    if kind != "redis":
+        return
+    try:
+        backend = RedisBackend(url)
+        await backend.ping()
+    except Exception as e:
+        logger.error("Rate limit store at %s is unavailable (%s); using per-process limits", url, e)
+        return
+    _backend = backend
+    logger.info("Rate limits shared through %s", url)
+
+
+async def close_backend() -> None:
+    """Close the shared backend and return to per-process buckets."""
+    global _backend
+    await _backend.close()
+    _backend = MemoryBackend()
+
+
+class RateLimiter:
+    """
+    A named token bucket per client key.
+
+    Args:
+        name: Limiter name, used in bucket keys and metrics
+        rate: Tokens added per second (0 disables the limiter)
+        burst: Bucket size, i.e. requests allowed at once (default: one second's worth, at least 1)
+        max_wait: Default seconds ``acquire`` may queue for a token
+        backend: Bucket store (default: the shared one from ``init_backend``)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: Optional[float] = None,
+        max_wait: float = 0.0,
+        backend=None,
+    ):
+        self.name = name
+        self.rate = rate
+        self.burst = burst if burst and burst >= 1 else max(1.0, rate)
+        self.max_wait = max_wait
+        self.backend = backend
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _backend(self):
+        return self.backend or get_backend()
+
+    async def acquire(self, key: str = "", max_wait: Optional[float] = None) -> None:
+        """
+        Take a token for ``key``, waiting for it up to ``max_wait`` seconds.
+
+        Raises:
+            RateLimitExceeded: If no token is available in time
+        """
+        if not self.enabled:
+            return
+        max_wait = self.max_wait if max_wait is None else max_wait
+        granted, wait = await self._backend().reserve(f"{self.name}:{key}", self.rate, self.burst, max_wait)
+        if not granted:
+            RATE_LIMIT_DECISIONS.labels(self.name, "rejected").inc()
+            raise RateLimitExceeded(self.name, wait)
+        if wait > 0:
+            RATE_LIMIT_DECISIONS.labels(self.name, "queued").inc()
+            await asyncio.sleep(wait)
+        else:
+            RATE_LIMIT_DECISIONS.labels(self.name, "allowed").inc()
+
+    async def penalize(self, seconds: float, key: str = "") -> None:
+        """Hold back all tokens for ``seconds``, e.g. after the upstream answered 429."""
+        if self.enabled and seconds > 0:
+            await self._backend().penalize(f"{self.name}:{key}", self.rate, self.burst, seconds)
@@ -0,0 +1,242 @@
+"""
+Recommendation cache for AI style results.
+
+Quiz answers are reduced to a canonical form (sorted lists, bucketed budget
+and height) so equivalent quizzes share one cached recommendation. Results
+live in an in-memory TTL/LRU tier with single-flight loading, optionally
+backed by a persistent SQLite tier that survives restarts.
+
+A third, read-only tier holds recommendations precomputed offline (see
+``services.precompute``) for style profiles: the occasion, style vibe and
+colour answers alone. It is loaded into memory at startup and answers any
+quiz with that profile that neither of the other tiers knows, so common
+quizzes are served without calling Gemini.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Budget bucket edges (per item, user currency)
+BUDGET_EDGES = [0, 25, 50, 75, 100, 150, 200, 300, 500]
+# Height bucket width in inches
+HEIGHT_BUCKET_INCHES = 3
+# Answers that make up a style profile, the key of precomputed recommendations
+PROFILE_FIELDS = ("occasion", "style_vibe", "colors_like")
+
+
+def _canonical_list(values: Optional[List[str]]) -> List[str]:
+    """Strip, lowercase, dedupe and sort a list of answers."""
+    return sorted({value.strip().lower() for value in values or [] if isinstance(value, str) and value.strip()})
+
+
+def budget_bucket(budget: Optional[dict]) -> Optional[str]:
+    """Widen a budget to bucket edges, e.g. {min: 30, max: 60} -> '25-75'."""
+    if not budget:
+        return None
+    low, high = budget.get('min') or 0, budget.get('max') or 0
+    lo = max((e for e in BUDGET_EDGES if e <= low), default=0)
+    hi = next((e for e in BUDGET_EDGES if e >= high), None)
+    return f"{lo}-{hi}" if hi is not None else f"{lo}+"
+
+
+def height_bucket(height: Optional[dict]) -> Optional[str]:
+    """Bucket a height into HEIGHT_BUCKET_INCHES ranges, e.g. 5'7" -> '5ft6-5ft8'."""
+    if not height or height.get('ft') is None:
+        return None
+    inches = height['ft'] * 12 + (height.get('in_') or 0)
+    start = inches - inches % HEIGHT_BUCKET_INCHES
+    end = start + HEIGHT_BUCKET_INCHES - 1
+    return f"{start // 12}ft{start % 12}-{end // 12}ft{end % 12}"
+
+
+def canonical_quiz(data: dict) -> dict:
+    """Reduce quiz answers to the fields and granularity that drive recommendations."""
+    sizes = data.get('sizes') or {}
+    return {
+        "occasion": _canonical_list(data.get('occasion')),
+        "style_vibe": _canonical_list(data.get('style_vibe')),
+        "colors_like": _canonical_list(data.get('colors_like')),
+        "height": height_bucket(data.get('height')),
+        "sizes": {
+            "tops": str(sizes.get('tops') or '').strip().upper(),
+            "bottoms": str(sizes.get('bottoms') or '').strip().upper(),
+        },
+        "budget": budget_bucket(data.get('budget')),
+    }
+
+
+def profile_quiz(canonical: dict) -> dict:
+    """The style profile (PROFILE_FIELDS) of a canonical quiz."""
+    return {field: canonical.get(field) or [] for field in PROFILE_FIELDS}
+
+
+def cache_key(canonical: dict, version: str) -> str:
+    """Stable key for a canonical quiz under a prompt/model version."""
+    encoded = json.dumps([version, canonical], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class RecommendationStore:
+    """SQLite persistent tier. Calls are blocking; run them in a worker thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS recommendations ("
+                " key TEXT PRIMARY KEY,"
+                " version TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM recommendations WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, version: str, value: dict, ttl: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO recommendations (key, version, value, expires_at) VALUES (?, ?, ?, ?)",
+                (key, version, json.dumps(value), time.time() + ttl),
+            )
+
+    def load(self, version: str) -> Dict[str, dict]:
+        """All unexpired entries of ``version``, keyed like ``get``."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM recommendations WHERE version = ? AND expires_at > ?",
+                (version, time.time()),
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def purge(self, version: str) -> int:
+        """Delete expired rows and rows from other prompt/model versions."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM recommendations WHERE version != ? OR expires_at <= ?",
+                (version, time.time()),
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class RecommendationCache:
+    """
+    Two-tier cache for generated recommendations.
+
+    Args:
+        version: Prompt/model version; changing it invalidates every entry
+        ttl: Seconds a recommendation stays valid in either tier
+        max_entries: In-memory LRU bound
+        store: Optional persistent tier
+    """
+
+    def __init__(self, version: str, ttl: float, max_entries: int, store: Optional[RecommendationStore] = None):
+        self.version = version
+        self.ttl = ttl
+        self.store = store
+        self.memory = TTLCache("recommendations", ttl=ttl, max_entries=max_entries)
+        # Precomputed recommendations keyed by ``profile_key``
+        self.precomputed: Dict[str, dict] = {}
+        self._counters: Dict[str, int] = {"store_hits": 0, "precomputed_hits": 0, "generated": 0}
+
+    def stats(self) -> dict:
+        return {
+            **self.memory.stats(),
+            **self._counters,
+            "persistent": self.store is not None,
+            "precomputed": len(self.precomputed),
+        }
+
+    def key_for(self, data: dict) -> str:
+        return cache_key(canonical_quiz(data), self.version)
+
+    def profile_key(self, canonical: dict) -> str:
+        """Key of the precomputed recommendation for a canonical quiz's style profile."""
+        return cache_key(profile_quiz(canonical), self.version)
+
+    def _precomputed_for(self, canonical: dict) -> Optional[dict]:
+        if not self.precomputed:
+            return None
+        value = self.precomputed.get(self.profile_key(canonical))
+        if value is not None:
+            self._counters["precomputed_hits"] += 1
+        return value
+
+    async def get(self, data: dict) -> Optional[dict]:
+        """Return a cached recommendation for ``data`` from any tier, without generating."""
+        canonical = canonical_quiz(data)
+        key = cache_key(canonical, self.version)
+        value = self.memory.get(key)
+        if value is None and self.store is not None:
+            value = await asyncio.to_thread(self.store.get, key)
+            if value is not None:
+                self._counters["store_hits"] += 1
+                self.memory.set(key, value)
+        if value is None:
+            value = self._precomputed_for(canonical)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    async def put(self, data: dict, result: dict) -> None:
+        """Store a recommendation generated outside ``get_or_generate`` (e.g. streamed)."""
+        key = self.key_for(data)
+        self._counters["generated"] += 1
+        self.memory.set(key, result)
+        await self._persist(key, result)
+
+    async def _persist(self, key: str, result: dict) -> None:
+        if self.store is None:
+            return
+        try:
+            await asyncio.to_thread(self.store.set, key, self.version, result, self.ttl)
+        except sqlite3.Error as e:
+            logger.warning("Failed to persist recommendation: %s", e)
+
+    async def get_or_generate(self, data: dict, generate: Callable[[dict], Awaitable[Any]]) -> Any:
+        """
+        Return a cached recommendation for ``data`` or call ``generate``.
+
+        ``generate`` receives the canonical quiz. Identical concurrent quizzes
+        share one call; errors are not cached.
+        """
+        canonical = canonical_quiz(data)
+        key = cache_key(canonical, self.version)
+
+        async def load():
+            if self.store is not None:
+                stored = await asyncio.to_thread(self.store.get, key)
+                if stored is not None:
+                    self._counters["store_hits"] += 1
+                    return stored
+
+            precomputed = self._precomputed_for(canonical)
+            if precomputed is not None:
+                return precomputed
+
+            result = await generate(canonical)
+            self._counters["generated"] += 1
+            await self._persist(key, result)
+            return result
+
+        return await self.memory.get_or_load(key, load)
@@ -0,0 +1,409 @@
+"""
+Async repositories for the MongoDB collections used by the API routes.
+
+Route handlers receive these through FastAPI dependencies
+(``get_user_repository``, ``get_wishlist_repository``, ``get_product_repository``,
+``get_quiz_result_repository``), so tests can override them with ``app.dependency_overrides``.
+"""
+
+import logging
+import os
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from services.cache import TTLCache
+from services.database import get_database
+
+logger = logging.getLogger(__name__)
+
+# Fields loaded for authenticated requests
+PRINCIPAL_PROJECTION = {"name": 1, "email": 1}
+
+# Wishlist order: oldest first, ties broken by _id so pages are stable
+WISHLIST_SORT = [("added_at", ASCENDING), ("_id", ASCENDING)]
+# Wishlist rows only reference products; product data lives in ``products``
+WISHLIST_ROW_PROJECTION = {"product_code": 1, "added_at": 1}
+PRODUCT_STORE_FIELDS = ("code", "name", "price", "images")
+PRODUCT_PROJECTION = {"_id": 0, **{field: 1 for field in PRODUCT_STORE_FIELDS}}
+
+# Quiz history order: newest first. ObjectIds are created when the result is
+# recorded, so _id alone gives a stable order and pagination cursor.
+QUIZ_RESULT_SORT = [("_id", DESCENDING)]
+
+# Hot products shared by every user's wishlist (PRODUCT_CACHE_TTL=0 disables it)
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "300"))
+PRODUCT_CACHE_MAX_ENTRIES = int(os.getenv("PRODUCT_CACHE_MAX_ENTRIES", "5000"))
+
+product_cache = TTLCache("products", ttl=PRODUCT_CACHE_TTL, max_entries=PRODUCT_CACHE_MAX_ENTRIES)
+
+# Legacy wishlist fields moved into ``products`` by ``migrate_wishlist_products``
+LEGACY_WISHLIST_FIELDS = ("product_payload", "product_name", "product_price", "product_image")
+MIGRATION_BATCH_SIZE = 500
+
+
+async def ensure_indexes(db: AsyncDatabase) -> None:
+    """
+    Create the indexes the routes rely on. Safe to run on every startup.
+
+    The unique indexes also back the single-round-trip writes below: signup
+    inserts and catches duplicates, and wishlist adds are upserts.
+    """
+    specs = [
+        ("users", [("email", ASCENDING)], {"unique": True, "name": "email_unique"}),
+        (
+            "wishlist",
+            [("user_id", ASCENDING), ("product_code", ASCENDING)],
+            {"unique": True, "name": "user_product_unique"},
+        ),
+        (
+            "wishlist",
+            [("user_id", ASCENDING), ("added_at", ASCENDING), ("_id", ASCENDING)],
+            {"name": "user_added_at"},
+        ),
+        ("quiz_results", [("user_id", ASCENDING), ("_id", DESCENDING)], {"name": "user_newest"}),
+    ]
+    for collection, keys, options in specs:
+        try:
+            await db[collection].create_index(keys, **options)
+        except PyMongoError as e:
+            # e.g. existing duplicates; the app still works, just without the index
+            logger.error("Failed to create index %s on %s: %s", options['name'], collection, e)
+
+    # Items saved before added_at existed get their ObjectId creation time
+    try:
+        await db["wishlist"].update_many(
+            {"added_at": {"$exists": False}},
+            [{"$set": {"added_at": {"$toDate": "$_id"}}}],
+        )
+    except PyMongoError as e:
+        logger.error("Failed to backfill wishlist added_at: %s", e)
+
+
+async def migrate_wishlist_products(db: AsyncDatabase) -> int:
+    """
+    Move product copies embedded in old wishlist rows into ``products``.
+
+    Products already in the store are left as they are. Each batch is
+    idempotent, so an interrupted run simply continues on the next startup.
+    Returns the number of rows migrated.
+    """
+    try:
+        return await _migrate_wishlist_batches(db)
+    except PyMongoError as e:
+        logger.error("Wishlist product migration failed, will retry on next startup: %s", e)
+        return 0
+
+
+async def _migrate_wishlist_batches(db: AsyncDatabase) -> int:
+    wishlist = db["wishlist"]
+    products = ProductRepository(db)
+    migrated = 0
+
+    while True:
+        rows = await wishlist.find(
+            {"$or": [{field: {"$exists": True}} for field in LEGACY_WISHLIST_FIELDS]},
+            {"product_code": 1, **{field: 1 for field in LEGACY_WISHLIST_FIELDS}},
+        ).limit(MIGRATION_BATCH_SIZE).to_list(length=MIGRATION_BATCH_SIZE)
+        if not rows:
+            return migrated
+
+        legacy = {}
+        for row in rows:
+            payload = row.get("product_payload") or {}
+            legacy[row["product_code"]] = {
+                "code": row["product_code"],
+                "name": payload.get("name") or row.get("product_name", ""),
+                "price": payload.get("price") or {"formattedValue": row.get("product_price", "")},
+                "images": payload.get("images") or [{"url": row.get("product_image", "")}],
+            }
+        await products.save_many(legacy.values(), overwrite=False)
+        await wishlist.update_many(
+            {"_id": {"$in": [row["_id"] for row in rows]}},
+            {"$unset": {field: "" for field in LEGACY_WISHLIST_FIELDS}},
+        )
+        migrated += len(rows)
+        logger.info("Moved %d wishlist product copies into products", migrated)
+
+
+class UserRepository:
+    """Data access for the ``users`` collection."""
+
+    def __init__(self, db: AsyncDatabase):
+        self.collection = db["users"]
+
+    async def find_by_email(self, email: str) -> Optional[dict]:
+        return await self.collection.find_one({"email": email})
+
+    async def find_principal(self, user_id: str) -> Optional[dict]:
+        """
+        Find the public profile (``_id``, name, email) of a user by id.
+
+        Some flows store ids as ObjectId, others as string, so both forms are
+        matched in one ``_id`` index lookup. ``password_hash`` is never fetched.
+        """
+        if not user_id:
+            return None
+
+        ids = [user_id, ObjectId(user_id)] if ObjectId.is_valid(user_id) else [user_id]
+        return await self.collection.find_one({"_id": {"$in": ids}}, PRINCIPAL_PROJECTION)
+
+    async def update_password_hash(self, user_id, password_hash: str) -> None:
+        """Replace a user's password hash (``user_id`` as stored in ``_id``)."""
+        await self.collection.update_one({"_id": user_id}, {"$set": {"password_hash": password_hash}})
+
+    async def create(self, user_data: dict) -> Optional[str]:
+        """Insert a user and return its id as a string, or None if the email is taken."""
+        try:
+            result = await self.collection.insert_one(user_data)
+        except DuplicateKeyError:
+            return None
+        return str(result.inserted_id)
+
+
+class WishlistRepository:
+    """Data access for the ``wishlist`` collection."""
+
+    def __init__(self, db: AsyncDatabase):
+        self.collection = db["wishlist"]
+
+    async def add(self, wishlist_item: dict) -> bool:
+        """
+        Insert an item unless the user already saved that product.
+
+        Returns True if it was inserted, False if it was already there.
+        """
+        query = {"user_id": wishlist_item["user_id"], "product_code": wishlist_item["product_code"]}
+        try:
+            result = await self.collection.update_one(query, {"$setOnInsert": wishlist_item}, upsert=True)
+        except DuplicateKeyError:
+            # Lost a race with a concurrent upsert of the same item
+            return False
+        return result.upserted_id is not None
+
+    async def add_many(self, wishlist_items: List[dict]) -> int:
+        """
+        Insert several items in one ``bulk_write``, skipping ones already saved.
+
+        Returns the number of items inserted.
+        """
+        if not wishlist_items:
+            return 0
+
+        requests = [
+            UpdateOne(
+                {"user_id": item["user_id"], "product_code": item["product_code"]},
+                {"$setOnInsert": item},
+                upsert=True,
+            )
+            for item in wishlist_items
+        ]
+        try:
+            result = await self.collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate key races with concurrent adds; everything else still ran
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            return e.details.get("nUpserted", 0)
+        return result.upserted_count
+
+    def iter_for_user(self, user_id: str) -> AsyncIterator[dict]:
+        """Stream a user's rows in wishlist order without loading them all at once."""
+        return self.collection.find({"user_id": user_id}, WISHLIST_ROW_PROJECTION).sort(WISHLIST_SORT)
+
+    async def list_page(
+        self,
+        user_id: str,
+        limit: int,
+        after: Optional[Tuple[datetime, ObjectId]] = None,
+    ) -> Tuple[List[dict], bool]:
+        """
+        Return up to ``limit`` rows following the ``(added_at, _id)`` position ``after``.
+
+        The second value tells whether more items follow.
+        """
+        query: dict = {"user_id": user_id}
+        if after is not None:
+            added_at, last_id = after
+            query["$or"] = [
+                {"added_at": {"$gt": added_at}},
+                {"added_at": added_at, "_id": {"$gt": last_id}},
+            ]
+
+        cursor = self.collection.find(query, WISHLIST_ROW_PROJECTION).sort(WISHLIST_SORT).limit(limit + 1)
+        items = await cursor.to_list(length=limit + 1)
+        return items[:limit], len(items) > limit
+
+    async def remove(self, user_id: str, product_code: str) -> bool:
+        """Delete one item. Returns False if it wasn't in the wishlist."""
+        result = await self.collection.delete_one({"user_id": user_id, "product_code": product_code})
+        return result.deleted_count > 0
+
+    async def remove_many(self, user_id: str, product_codes: List[str]) -> int:
+        """Delete several items in one round trip. Returns how many were removed."""
+        if not product_codes:
+            return 0
+        result = await self.collection.delete_many({"user_id": user_id, "product_code": {"$in": product_codes}})
+        return result.deleted_count
+
+
+class ProductRepository:
+    """
+    Data access for the shared ``products`` collection, keyed by product code.
+
+    Reads go through ``product_cache``; writes update it, so a saved product
+    is immediately visible to every wishlist that references it.
+    """
+
+    def __init__(self, db: AsyncDatabase):
+        self.collection = db["products"]
+
+    async def save_many(self, products: Iterable[dict], overwrite: bool = True) -> None:
+        """
+        Upsert products in one ``bulk_write``. Writing the same product twice is a no-op.
+
+        With ``overwrite=False`` existing products are kept unchanged.
+        """
+        now = datetime.utcnow()
+        requests = []
+        saved = []
+        for product in products:
+            document = {field: product.get(field) for field in PRODUCT_STORE_FIELDS}
+            update = {"$set" if overwrite else "$setOnInsert": {**document, "updated_at": now}}
+            requests.append(UpdateOne({"_id": document["code"]}, update, upsert=True))
+            saved.append(document)
+        if not requests:
+            return
+
+        try:
+            await self.collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            # Concurrent upserts of the same new product; the other write won
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+        for document in saved:
+            if overwrite:
+                product_cache.set(document["code"], document)
+            else:
+                # The stored copy may differ; let the next read load it
+                product_cache.invalidate(document["code"])
+
+    async def save(self, product: dict, overwrite: bool = True) -> None:
+        await self.save_many([product], overwrite)
+
+    async def get_many(self, codes: Iterable[str]) -> Dict[str, dict]:
+        """Return the known products among ``codes``, with one ``$in`` query for cache misses."""
+        found, missing = product_cache.get_many(dict.fromkeys(codes))
+        if missing:
+            async for product in self.collection.find({"_id": {"$in": missing}}, PRODUCT_PROJECTION):
+                product_cache.set(product["code"], product)
+                found[product["code"]] = product
+        return found
+
+    async def list_after(self, last_code: Optional[str], limit: int) -> List[dict]:
+        """Return up to ``limit`` stored products with codes after ``last_code``, in code order."""
+        query = {"_id": {"$gt": last_code}} if last_code else {}
+        cursor = self.collection.find(query, PRODUCT_PROJECTION).sort("_id", ASCENDING).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def update_fields(self, changes: Dict[str, dict]) -> int:
+        """
+        Set only the given fields on each product (``{code: {field: value}}``) in one ``bulk_write``.
+
+        Returns the number of products modified.
+        """
+        if not changes:
+            return 0
+
+        now = datetime.utcnow()
+        result = await self.collection.bulk_write(
+            [UpdateOne({"_id": code}, {"$set": {**fields, "updated_at": now}}) for code, fields in changes.items()],
+            ordered=False,
+        )
+        for code in changes:
+            product_cache.invalidate(code)
+        return result.modified_count
+
+
+class QuizResultRepository:
+    """Data access for the ``quiz_results`` collection (see ``models.database.QuizResultModel``)."""
+
+    def __init__(self, db: AsyncDatabase):
+        self.collection = db["quiz_results"]
+
+    async def insert_many(self, results: List[dict]) -> int:
+        """
+        Insert results in one unordered ``insert_many``.
+
+        Results carry their own ``_id``, so re-inserting a batch after a
+        partial failure skips the ones already written. Returns how many were
+        inserted.
+        """
+        if not results:
+            return 0
+        try:
+            result = await self.collection.insert_many(results, ordered=False)
+        except BulkWriteError as e:
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            return e.details.get("nInserted", 0)
+        return len(result.inserted_ids)
+
+    async def list_page(
+        self,
+        user_id: str,
+        limit: int,
+        before: Optional[ObjectId] = None,
+    ) -> Tuple[List[dict], bool]:
+        """
+        Return up to ``limit`` of a user's results, newest first, older than ``before``.
+
+        The second value tells whether more results follow.
+        """
+        query: dict = {"user_id": user_id}
+        if before is not None:
+            query["_id"] = {"$lt": before}
+
+        cursor = self.collection.find(query, {"user_id": 0}).sort(QUIZ_RESULT_SORT).limit(limit + 1)
+        results = await cursor.to_list(length=limit + 1)
+        return results[:limit], len(results) > limit
+
+
+class JobStateRepository:
+    """Checkpoints of background jobs (``job_state`` collection), keyed by job name."""
+
+    def __init__(self, db: AsyncDatabase):
+        self.collection = db["job_state"]
+
+    async def get(self, name: str) -> dict:
+        return await self.collection.find_one({"_id": name}) or {}
+
+    async def save(self, name: str, **fields) -> None:
+        await self.collection.update_one(
+            {"_id": name},
+            {"$set": {**fields, "updated_at": datetime.utcnow()}},
+            upsert=True,
+        )
+
+
+def get_user_repository() -> UserRepository:
+    """FastAPI dependency returning the users repository."""
+    return UserRepository(get_database())
+
+
+def get_wishlist_repository() -> WishlistRepository:
+    """FastAPI dependency returning the wishlist repository."""
+    return WishlistRepository(get_database())
+
+
+def get_product_repository() -> ProductRepository:
+    """FastAPI dependency returning the shared products repository."""
+    return ProductRepository(get_database())
+
+
+def get_quiz_result_repository() -> QuizResultRepository:
+    """FastAPI dependency returning the quiz results repository."""
+    return QuizResultRepository(get_database())
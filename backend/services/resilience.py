@@ -0,0 +1,197 @@
+"""
+Failure handling for slow or flaky upstreams.
+
+- ``backoff_delay``: exponential backoff with full jitter between retries, so
+  callers that failed together don't retry in lockstep.
+- ``LatencyWindow``: recent latencies of successful calls, giving the
+  percentile after which a hedged (duplicate) request is sent.
+- ``CircuitBreaker``: stops calling an upstream after repeated failures and
+  lets a single trial call through once ``reset_timeout`` has passed.
+  Callers get ``CircuitOpenError`` straight away while it is open and can
+  serve cached or fallback content instead of waiting for timeouts.
+"""
+
+import logging
+import random
+import time
+from collections import deque
+from typing import Optional
+from utils.metrics import CIRCUIT_BREAKER_STATE
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    Seconds to wait before retry number ``attempt`` (0-based).
+
+    Uniform between 0 and ``min(cap, base * 2**attempt)`` ("full jitter").
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class LatencyWindow:
+    """
+    The last ``size`` latencies of an operation.
+
+    Args:
+        size: Number of samples kept
+        min_samples: Samples needed before ``percentile`` returns a value
+    """
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """The ``pct`` percentile (0-100) of the window, or None until ``min_samples`` were seen."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+        return ordered[index]
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open, retry after {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker for one upstream.
+
+    ``failure_threshold`` consecutive failures open the circuit. After
+    ``reset_timeout`` seconds it is half-open: one trial call is let through,
+    and its outcome closes or re-opens the circuit. A threshold of 0
+    disables the breaker.
+
+    ``before_call`` tells a call whether it is that trial; the call passes
+    this on to ``record_success``/``record_failure``/``release`` so that only
+    the trial itself frees the slot, not calls admitted before the circuit
+    opened that finish late.
+
+    Args:
+        name: Breaker name, used in logs and metrics
+        failure_threshold: Consecutive failures that open the circuit
+        reset_timeout: Seconds the circuit stays open before a trial call
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    # Gauge values per state
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        CIRCUIT_BREAKER_STATE.labels(name).set(0)
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    def current_state(self) -> str:
+        """The state, moving from open to half-open once ``reset_timeout`` has passed."""
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._set_state(self.HALF_OPEN)
+        return self.state
+
+    def before_call(self) -> bool:
+        """
+        Admit a call, or refuse it while the circuit is open.
+
+        Returns:
+            Whether the call is the half-open trial
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with its trial call in progress
+        """
+        if not self.enabled:
+            return False
+        state = self.current_state()
+        if state == self.CLOSED:
+            return False
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+        raise CircuitOpenError(self.name, max(0.0, remaining))
+
+    def record_success(self, trial: bool = False) -> None:
+        """
+        Record a successful call.
+
+        Only the half-open trial closes the circuit; a call admitted before
+        it opened that succeeds late just finishes.
+        """
+        self.release(trial)
+        if self.state == self.CLOSED:
+            self.failures = 0
+        elif self.state == self.HALF_OPEN and trial:
+            self.failures = 0
+            logger.info("Circuit '%s' closed", self.name)
+            self._set_state(self.CLOSED)
+
+    def record_failure(self, trial: bool = False) -> None:
+        """
+        Record a failed call.
+
+        Failures count while closed, and a failed trial re-opens the circuit.
+        Late failures while it is already open don't push back ``reset_timeout``.
+        """
+        if not self.enabled:
+            return
+        self.release(trial)
+        if self.state == self.CLOSED:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self._open()
+        elif self.state == self.HALF_OPEN and trial:
+            self.failures += 1
+            self._open()
+
+    def release(self, trial: bool = False) -> None:
+        """End an admitted call that neither succeeded nor failed (e.g. cancelled)."""
+        if trial:
+            self._trial_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "state": self.current_state(),
+            "consecutive_failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+        }
+
+    def _open(self) -> None:
+        logger.warning(
+            "Circuit '%s' opened after %d failures; retrying in %.0fs",
+            self.name,
+            self.failures,
+            self.reset_timeout,
+        )
+        self._opened_at = time.monotonic()
+        self._set_state(self.OPEN)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        CIRCUIT_BREAKER_STATE.labels(self.name).set(self._STATE_VALUES[state])
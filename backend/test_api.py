@@ -1,24 +1,28 @@
 """
 Test script for H&M API integration.
-Run with: python test_api.py
+Calls the live RapidAPI endpoints (needs RAPIDAPI_KEY in backend/.env).
+Run from the backend directory with: python test_api.py
+
+For offline performance testing use ``python -m benchmarks.load`` instead.
 """
 
 import asyncio
-from hm_client import hm_list_products
+from services.hm_client import close_client, hm_list_products
+from services.products import extract_product_list, normalize_products
 
 
 async def test_hm_api():
     """Test H&M API connectivity and product fetching."""
     print("🧪 Testing H&M API...\n")
-    
+
     try:
         # Test 1: Fetch men's trousers
         print("1️⃣ Fetching men's trousers...")
-        result = await hm_list_products("men_trousers", page=0, size=5)
-        
-        products = result.get('results', [])
+        result = await hm_list_products("men_trousers", page=1, size=5)
+
+        products = normalize_products(extract_product_list(result))
         print(f"✅ Found {len(products)} products")
-        
+
         # Display first product
         if products:
             product = products[0]
@@ -28,18 +32,20 @@ async def test_hm_api():
             print(f"  Code: {product.get('code')}")
             image_url = product.get('images', [{}])[0].get('url', 'N/A')
             print(f"  Image: {image_url[:80]}...")
-        
+
         # Test 2: Different category
         print("\n2️⃣ Fetching men's shirts...")
-        result2 = await hm_list_products("men_shirts", page=0, size=3)
-        print(f"✅ Found {len(result2.get('results', []))} products")
-        
+        result2 = await hm_list_products("men_shirts", page=1, size=3)
+        print(f"✅ Found {len(extract_product_list(result2))} products")
+
         print("\n🎉 All tests passed!")
-        
+
     except Exception as e:
         print(f"❌ Error: {e}")
         raise
+    finally:
+        await close_client()
 
 
 if __name__ == "__main__":
-    asyncio.run(test_hm_api())
\ No newline at end of file
+    asyncio.run(test_hm_api())
@@ -0,0 +1,91 @@
+"""
+Shared fixtures: the app wired to the in-process stand-ins from ``benchmarks``
+(MongoDB via mongomock, H&M via ``fake_hm``, Gemini via ``fake_gemini``).
+
+Async tests run on asyncio through the anyio pytest plugin (``pytest.mark.anyio``).
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings the app reads at import time; nothing here is ever sent anywhere
+os.environ.setdefault("GEMINI_API_KEY", "offline")
+os.environ.setdefault("RAPIDAPI_KEY", "offline")
+os.environ.setdefault("MONGODB_URI", "mongodb://127.0.0.1:27017")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("CATALOG_SYNC_INTERVAL", "0")
+os.environ.setdefault("CATALOG_DB_PATH", ":memory:")
+os.environ.setdefault("PRODUCT_REFRESH_INTERVAL", "0")
+os.environ.setdefault("RECOMMENDATION_CACHE_PATH", "")
+os.environ.setdefault("RECOMMENDATION_PRECOMPUTED_PATH", "")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# Hash in a thread, with few rounds, to keep signups fast
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+os.environ.setdefault("PASSWORD_HASH_ROUNDS", "1000")
+# Tests share one client address; rate limits get their own tests
+os.environ.setdefault("QUIZ_RATE_PER_MINUTE", "0")
+os.environ.setdefault("LOGIN_RATE_PER_MINUTE", "0")
+
+import httpx
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db():
+    """A fresh in-memory database, with the app's indexes."""
+    from benchmarks.fake_mongo import AsyncMockClient
+    from services import database
+    from services.repositories import ensure_indexes, product_cache
+
+    await database.init_database(AsyncMockClient())
+    await ensure_indexes(database.get_database())
+    product_cache.clear()
+    yield database.get_database()
+    await database.close_database()
+    product_cache.clear()
+
+
+@pytest.fixture
+async def upstreams():
+    """H&M served by ``benchmarks.fake_hm`` and Gemini by ``FakeGeminiModel``, with empty caches."""
+    from benchmarks.fake_gemini import FakeGeminiModel
+    from benchmarks.fake_hm import create_app as create_fake_hm
+    from services import ai_model, hm_client
+
+    hm_client.listing_cache.clear()
+    ai_model.recommendation_cache.memory.clear()
+    hm_client.init_client(hm_client.create_client(transport=httpx.ASGITransport(app=create_fake_hm())))
+    model = FakeGeminiModel()
+    ai_model.init_model(model)
+    yield model
+    await hm_client.close_client()
+    hm_client.listing_cache.clear()
+    ai_model.recommendation_cache.memory.clear()
+
+
+@pytest.fixture
+async def client(db):
+    """HTTP client for the app, without running its lifespan."""
+    import main
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://dressly.test") as c:
+        yield c
+
+
+@pytest.fixture
+def signup(client):
+    """Create an account and return its Authorization headers."""
+
+    async def create(email: str) -> dict:
+        r = await client.post("/auth/signup", json={"name": email, "email": email, "password": "test-password"})
+        r.raise_for_status()
+        return {"Authorization": f"Bearer {r.json()['token']}"}
+
+    return create
@@ -0,0 +1,58 @@
+"""Password hashing pool and auth routes."""
+
+import pytest
+
+from api import auth as auth_api
+from services.rate_limit import MemoryBackend
+from utils import auth
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_hash_pool_workers_are_not_forked(monkeypatch):
+    monkeypatch.setattr(auth, "PASSWORD_HASH_WORKERS", 1)
+    auth.start_hash_pool()
+    try:
+        assert auth._hash_executor._mp_context.get_start_method() in ("forkserver", "spawn")
+        hashed = await auth.hash_password_async("secret")
+        valid, _ = await auth.verify_and_update_password_async("secret", hashed)
+        assert valid
+    finally:
+        auth.shutdown_hash_pool()
+
+
+async def test_rehash_on_login_drops_the_cached_principal(client, signup, monkeypatch):
+    auth_api.principal_cache.clear()
+    headers = await signup("rehash@example.com")
+    assert (await client.get("/auth/me", headers=headers)).status_code == 200
+    assert len(auth_api.principal_cache) == 1
+
+    async def verify_and_update(password, password_hash):
+        return True, "upgraded-hash"
+
+    monkeypatch.setattr(auth_api, "verify_and_update_password_async", verify_and_update)
+    r = await client.post("/auth/login", json={"email": "rehash@example.com", "password": "test-password"})
+    assert r.status_code == 200
+    assert auth_api.principal_cache.peek(r.json()["user"]["id"]) is None
+
+
+async def test_duplicate_signup_is_rejected_before_hashing(client, signup, monkeypatch):
+    await signup("taken@example.com")
+
+    async def hash_password(password):
+        raise AssertionError("hashed a password for a taken email")
+
+    monkeypatch.setattr(auth_api, "hash_password_async", hash_password)
+    r = await client.post("/auth/signup", json={"name": "x", "email": "taken@example.com", "password": "pw"})
+    assert r.status_code == 400
+
+
+async def test_signup_shares_the_per_ip_login_budget(client, monkeypatch):
+    monkeypatch.setattr(auth_api.login_limiter, "rate", 1 / 60)
+    monkeypatch.setattr(auth_api.login_limiter, "burst", 1)
+    monkeypatch.setattr(auth_api.login_limiter, "backend", MemoryBackend())
+
+    first = {"name": "a", "email": "a@example.com", "password": "pw"}
+    assert (await client.post("/auth/signup", json=first)).status_code == 200
+    second = {"name": "b", "email": "b@example.com", "password": "pw"}
+    assert (await client.post("/auth/signup", json=second)).status_code == 429
@@ -0,0 +1,60 @@
+"""Local catalog mirror."""
+
+import pytest
+
+from services import catalog as catalog_module
+from services.catalog import ProductCatalog, extract_colors, sync_catalog
+
+
+def listing_item(code: str, color: str, price: float, swatches=()) -> dict:
+    return {
+        "id": code,
+        "productName": f"Item {code}",
+        "prices": [{"price": price, "formattedPrice": f"${price:.2f}"}],
+        "colorName": color,
+        "swatches": [{"colorName": name} for name in swatches],
+        "productImage": f"http://img/{code}",
+    }
+
+
+def test_only_the_article_color_is_indexed():
+    item = listing_item("1", "Dark Grey", 10, swatches=["Black", "Beige"])
+    assert extract_colors(item) == ["dark", "grey"]
+
+
+def test_query_filters_by_own_color_and_price():
+    catalog = ProductCatalog(":memory:")
+    try:
+        assert catalog.is_empty()
+        catalog.replace_category("ladies_all", [
+            listing_item("1", "Black", 20, swatches=["White"]),
+            listing_item("2", "White", 30),
+            listing_item("3", "White", 90),
+        ])
+        assert not catalog.is_empty()
+        assert catalog.has_category("ladies_all")
+
+        white = catalog.query(colors=["White"], max_price=50)
+        assert [p["code"] for p in white] == ["2"]
+        assert [p["code"] for p in catalog.query(colors=["Black"])] == ["1"]
+    finally:
+        catalog.close()
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("payload", [
+    {"error": "Too many requests"},
+    {"plpList": {"productList": [], "numberOfHits": 0}},
+])
+async def test_sync_keeps_category_on_error_or_empty_payload(monkeypatch, payload):
+    async def hm_list_products(category, page=1, size=30, cache=True):
+        return payload
+
+    monkeypatch.setattr(catalog_module.hm_client, "hm_list_products", hm_list_products)
+    catalog = ProductCatalog(":memory:")
+    try:
+        catalog.replace_category("ladies_all", [listing_item("1", "Black", 20)])
+        assert await sync_catalog(catalog, ["ladies_all"]) == {}
+        assert [p["code"] for p in catalog.query(categories=["ladies_all"])] == ["1"]
+    finally:
+        catalog.close()
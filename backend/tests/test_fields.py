@@ -0,0 +1,17 @@
+"""Sparse product fieldsets (``?fields=``)."""
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_wishlist_fields(client, signup):
+    headers = await signup("fields@example.com")
+    item = {"code": "0001", "name": "Shirt", "price": {"formattedValue": "$10.00"}, "images": [{"url": "http://img/1"}]}
+    await client.post("/wishlist", json=item, headers=headers)
+
+    r = await client.get("/wishlist", params={"fields": "code,name", "limit": 10}, headers=headers)
+    assert r.json()["items"] == [{"code": "0001", "name": "Shirt"}]
+
+    r = await client.get("/wishlist", params={"fields": "code,nope"}, headers=headers)
+    assert r.status_code == 400
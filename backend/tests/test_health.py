@@ -0,0 +1,21 @@
+"""Health probes."""
+
+import inspect
+
+import pytest
+
+from api import health
+
+pytestmark = pytest.mark.anyio
+
+
+def test_liveness_runs_on_the_event_loop():
+    # A sync endpoint would run in the threadpool and answer while the loop is blocked
+    assert inspect.iscoroutinefunction(health.liveness)
+
+
+async def test_probes(client):
+    assert (await client.get("/health/live")).json() == {"status": "alive"}
+    r = await client.get("/health/ready")
+    assert r.status_code == 200
+    assert r.json()["checks"]["mongodb"] == "ok"
@@ -0,0 +1,157 @@
+"""H&M client: shared pool, listing cache, retries, hedging and the circuit breaker."""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from services import hm_client
+from services.resilience import CircuitBreaker, CircuitOpenError
+
+pytestmark = pytest.mark.anyio
+
+
+def listing(name: str) -> dict:
+    return {"plpList": {"productList": [{"id": "1", "productName": name}], "numberOfHits": 1}}
+
+
+class FakeHM:
+    """``httpx.MockTransport`` handler answering from a list of queued responses."""
+
+    def __init__(self):
+        self.responses = []
+        self.requests = []
+        self.delay = 0.0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        response = self.responses.pop(0) if self.responses else httpx.Response(200, json=listing("default"))
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Shift time.monotonic (cache entries, breaker, event loop) forward with ``clock[0] += seconds``."""
+    offset = [0.0]
+    monotonic = time.monotonic
+    monkeypatch.setattr(time, "monotonic", lambda: monotonic() + offset[0])
+    return offset
+
+
+@pytest.fixture
+async def fake_hm(monkeypatch):
+    fake = FakeHM()
+    monkeypatch.setattr(hm_client, "HM_RETRY_BASE_DELAY", 0)
+    monkeypatch.setattr(hm_client, "hm_breaker", CircuitBreaker("hm-test", failure_threshold=2, reset_timeout=30))
+    monkeypatch.setattr(hm_client, "_latencies", {})
+    hm_client.listing_cache.clear()
+    hm_client.init_client(hm_client.create_client(transport=httpx.MockTransport(fake)))
+    yield fake
+    await hm_client.close_client()
+    hm_client.listing_cache.clear()
+
+
+async def test_requests_share_one_pooled_client(fake_hm):
+    client = hm_client.get_client()
+    await hm_client.hm_list_products("men_jeans", cache=False)
+    await hm_client.hm_product_detail("0001")
+
+    assert hm_client.get_client() is client
+    assert [r.url.path for r in fake_hm.requests] == ["/products/v2/list", "/products/detail"]
+    assert fake_hm.requests[0].url.params["categoryId"] == "men_jeans"
+    assert fake_hm.requests[0].headers["X-RapidAPI-Host"] == hm_client.RAPIDAPI_HOST
+
+
+async def test_listing_cache_hit_and_miss(fake_hm):
+    first = await hm_client.hm_list_products("men_jeans")
+    second = await hm_client.hm_list_products("men_jeans")
+    await hm_client.hm_list_products("men_shirts")
+
+    assert first is second
+    assert len(fake_hm.requests) == 2
+
+
+async def test_concurrent_misses_share_one_request(fake_hm):
+    fake_hm.delay = 0.05
+    results = await asyncio.gather(*(hm_client.hm_list_products("men_jeans") for _ in range(5)))
+
+    assert len(fake_hm.requests) == 1
+    assert all(result is results[0] for result in results)
+
+
+async def test_stale_listing_is_served_while_refreshing(fake_hm, clock):
+    fake_hm.responses = [httpx.Response(200, json=listing("old")), httpx.Response(200, json=listing("new"))]
+    await hm_client.hm_list_products("men_jeans")
+
+    clock[0] += hm_client.listing_cache.ttl + 1
+    stale = await hm_client.hm_list_products("men_jeans")
+    assert stale["plpList"]["productList"][0]["productName"] == "old"
+
+    await asyncio.sleep(0.01)  # let the background refresh finish
+    fresh = await hm_client.hm_list_products("men_jeans")
+    assert fresh["plpList"]["productList"][0]["productName"] == "new"
+    assert len(fake_hm.requests) == 2
+
+
+async def test_transient_errors_are_retried(fake_hm):
+    fake_hm.responses = [httpx.Response(503), httpx.ConnectError("reset"), httpx.Response(200, json=listing("ok"))]
+    data = await hm_client.hm_list_products("men_jeans", cache=False)
+
+    assert data["plpList"]["productList"][0]["productName"] == "ok"
+    assert len(fake_hm.requests) == 3
+
+
+async def test_client_errors_are_not_retried(fake_hm):
+    fake_hm.responses = [httpx.Response(404)]
+    with pytest.raises(httpx.HTTPStatusError):
+        await hm_client.hm_product_detail("missing")
+    assert len(fake_hm.requests) == 1
+    assert hm_client.hm_breaker.failures == 0
+
+
+async def test_slow_request_is_hedged(fake_hm, monkeypatch):
+    monkeypatch.setattr(hm_client, "hedge_delay", lambda url: 0.01)
+    calls = 0
+
+    async def handler(request):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            await asyncio.sleep(1)
+            return httpx.Response(200, json=listing("slow"))
+        return httpx.Response(200, json=listing("hedge"))
+
+    hm_client.init_client(hm_client.create_client(transport=httpx.MockTransport(handler)))
+    data = await hm_client.hm_list_products("men_jeans", cache=False)
+
+    assert data["plpList"]["productList"][0]["productName"] == "hedge"
+    assert calls == 2
+
+
+async def test_open_circuit_serves_last_good_listing(fake_hm, clock, monkeypatch):
+    monkeypatch.setattr(hm_client, "HM_MAX_RETRIES", 0)
+    await hm_client.hm_list_products("men_jeans")
+    clock[0] += hm_client.listing_cache.ttl + hm_client.listing_cache.stale_ttl + 1
+
+    # Two failed calls open the circuit (threshold 2); the expired copy is served meanwhile
+    fake_hm.responses = [httpx.Response(503), httpx.Response(503)]
+    for _ in range(2):
+        data = await hm_client.hm_list_products("men_jeans")
+        assert data["plpList"]["productList"][0]["productName"] == "default"
+    assert hm_client.hm_breaker.current_state() == CircuitBreaker.OPEN
+
+    requests = len(fake_hm.requests)
+    await hm_client.hm_list_products("men_jeans")
+    assert len(fake_hm.requests) == requests  # refused without calling H&M
+    with pytest.raises(CircuitOpenError):
+        await hm_client.hm_list_products("men_shirts")
+
+    # Half-open after the reset timeout: one successful trial closes it
+    clock[0] += 30
+    await hm_client.hm_list_products("men_shirts")
+    assert hm_client.hm_breaker.current_state() == CircuitBreaker.CLOSED
@@ -0,0 +1,67 @@
+"""App startup and shutdown."""
+
+import asyncio
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_shutdown_cleans_up_after_failed_background_task(monkeypatch):
+    import main
+    from benchmarks.fake_mongo import AsyncMockClient
+    from services import database, quiz_history
+
+    async def broken_sync_loop(catalog):
+        raise RuntimeError("sync loop crashed")
+
+    stopped = []
+    closed = []
+    real_init = database.init_database
+
+    async def init_database():
+        return await real_init(AsyncMockClient())
+
+    async def stop():
+        stopped.append(True)
+
+    async def close_backend():
+        closed.append(True)
+
+    monkeypatch.setattr(database, "init_database", init_database)
+    monkeypatch.setattr(main.catalog, "CATALOG_SYNC_INTERVAL", 60)
+    monkeypatch.setattr(main.catalog, "run_sync_loop", broken_sync_loop)
+    monkeypatch.setattr(quiz_history, "stop", stop)
+    monkeypatch.setattr(main.rate_limit, "close_backend", close_backend)
+
+    async with main.lifespan(main.app):
+        await asyncio.sleep(0)
+
+    assert stopped and closed
+    assert database.client is None
+
+
+async def test_lifespan_owns_the_log_listener(monkeypatch):
+    import main
+    from benchmarks.fake_mongo import AsyncMockClient
+    from services import database
+    from services import quiz_history
+    from utils import log
+
+    real_init = database.init_database
+
+    async def init_database():
+        return await real_init(AsyncMockClient())
+
+    async def stop():
+        pass
+
+    monkeypatch.setattr(database, "init_database", init_database)
+    monkeypatch.setattr(quiz_history, "start", lambda: None)
+    monkeypatch.setattr(quiz_history, "stop", stop)
+    log.shutdown_logging()
+
+    async with main.lifespan(main.app):
+        listener = log._listener
+        assert listener is not None and listener._thread is not None
+    assert log._listener is None and listener._thread is None
@@ -0,0 +1,38 @@
+"""Queued logging setup and shutdown."""
+
+import json
+import logging
+
+import pytest
+
+from utils import log
+
+
+@pytest.fixture
+def fresh_logging():
+    handlers = logging.getLogger().handlers[:]
+    log.shutdown_logging()
+    yield
+    log.shutdown_logging()
+    logging.getLogger().handlers[:] = handlers
+
+
+def test_shutdown_flushes_queued_records(fresh_logging, capsys):
+    listener = log.setup_logging(level="INFO", fmt="json")
+    assert log.setup_logging() is listener
+
+    logging.getLogger("tests.log").info("hello", extra={"answer": 42})
+    log.shutdown_logging()
+
+    (line,) = capsys.readouterr().out.splitlines()
+    entry = json.loads(line)
+    assert entry["message"] == "hello" and entry["answer"] == 42
+
+
+def test_forked_process_starts_its_own_listener(fresh_logging, monkeypatch):
+    parent = log.setup_logging()
+    monkeypatch.setattr(log, "_listener_pid", -1)  # as seen from a forked child
+
+    child = log.setup_logging()
+    assert child is not parent
+    parent.stop()
@@ -0,0 +1,41 @@
+"""Offline recommendation precompute job."""
+
+import asyncio
+
+import pytest
+
+from services import ai_model, precompute
+from services.recommendation_cache import RecommendationStore
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_failed_profiles_are_retried_on_the_next_run(monkeypatch, tmp_path):
+    profiles = list(precompute.enumerate_profiles())
+    failing = profiles[0]
+    in_flight = [0]
+    peak = [0]
+
+    async def generate_uncached(profile):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        try:
+            await asyncio.sleep(0)
+            if profile is failing:
+                raise RuntimeError("quota exceeded")
+            return {"recommended_categories": ["ladies_all"], "profile": profile}
+        finally:
+            in_flight[0] -= 1
+
+    monkeypatch.setattr(ai_model, "generate_uncached", generate_uncached)
+    store = RecommendationStore(str(tmp_path / "precomputed.db"))
+    try:
+        first = await precompute.precompute(profiles, store, "v1", concurrency=3, rate_per_minute=0)
+        assert first == {"generated": len(profiles) - 1, "skipped": 0, "failed": 1}
+        assert peak[0] == 3
+
+        failing = None
+        second = await precompute.precompute(profiles, store, "v1", concurrency=3, rate_per_minute=0)
+        assert second == {"generated": 1, "skipped": len(profiles) - 1, "failed": 0}
+    finally:
+        store.close()
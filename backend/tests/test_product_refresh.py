@@ -0,0 +1,50 @@
+"""Background refresh of stored products from H&M (the fake H&M app)."""
+
+import pytest
+
+from services.product_refresh import JOB_NAME, refresh_products
+from services.repositories import JobStateRepository, ProductRepository
+
+pytestmark = pytest.mark.anyio
+
+
+def stored(code: str, name: str = "Old name") -> dict:
+    return {
+        "code": code,
+        "name": name,
+        "price": {"formattedValue": "$1.00", "currencyIso": "USD"},
+        "images": [{"url": f"https://image.hm.com/assets/hm/{code}.jpg"}],
+    }
+
+
+async def test_refresh_updates_changed_fields_in_batches(db, upstreams):
+    products = ProductRepository(db)
+    await products.save_many([stored("0000001"), stored("0000002"), stored("0000003"), stored("missing1")])
+
+    counters = await refresh_products(db, batch_size=2, rate=0)
+
+    assert counters == {"scanned": 4, "changed": 3, "unchanged": 0, "failed": 1}
+    found = await products.get_many(["0000001", "missing1"])
+    assert found["0000001"]["name"] == "Product 0000001"
+    assert found["0000001"]["price"]["formattedValue"] != "$1.00"
+    assert found["missing1"]["name"] == "Old name"
+
+    state = await JobStateRepository(db).get(JOB_NAME)
+    assert state["last_code"] is None and state["finished_at"] is not None
+
+    # A second pass finds nothing to change
+    counters = await refresh_products(db, batch_size=2, rate=0)
+    assert counters["changed"] == 0 and counters["unchanged"] == 3
+
+
+async def test_interrupted_pass_resumes_after_checkpoint(db, upstreams):
+    products = ProductRepository(db)
+    await products.save_many([stored("0000001"), stored("0000002"), stored("0000003")])
+    await JobStateRepository(db).save(JOB_NAME, last_code="0000001", scanned=1, changed=1, unchanged=0, failed=0)
+
+    counters = await refresh_products(db, batch_size=10, rate=0)
+
+    assert counters["scanned"] == 3
+    found = await products.get_many(["0000001", "0000002"])
+    assert found["0000001"]["name"] == "Old name"  # before the checkpoint, not refetched
+    assert found["0000002"]["name"] == "Product 0000002"
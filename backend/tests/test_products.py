@@ -0,0 +1,26 @@
+"""Product normalization."""
+
+from models.product import Product
+from services.products import normalize_products, normalize_record
+
+
+def test_numeric_values_are_coerced_to_strings():
+    items = [
+        {"code": "1", "name": 42, "price": 12.5},
+        {"code": "2", "prices": [{"formattedPrice": 9.99}]},
+        {"code": "3", "price": {"formattedValue": 20, "currency": 840}},
+    ]
+    products = normalize_products(items)
+
+    assert [p["price"]["formattedValue"] for p in products] == ["12.5", "9.99", "20"]
+    assert products[0]["name"] == "42"
+    assert products[2]["price"]["currencyIso"] == "840"
+    for product in products:
+        Product.model_validate(product)
+
+
+def test_record_matches_dict_normalizer():
+    item = {"articleCode": 7, "productName": "Tee", "price": 5, "images": [{"url": "http://img/7"}]}
+    record = normalize_record(item)
+    (product,) = normalize_products([item])
+    assert record.to_dict() == product
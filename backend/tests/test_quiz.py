@@ -0,0 +1,68 @@
+"""Quiz submission, plain and streamed (Server-Sent Events)."""
+
+import json
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+QUIZ = {
+    "occasion": ["Work"],
+    "style_vibe": ["Minimal"],
+    "colors_like": ["Black"],
+    "sizes": {"tops": "M", "bottoms": "30"},
+    "budget": {"min": 10, "max": 100},
+}
+
+
+def parse_events(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def test_submit(client, upstreams):
+    r = await client.post("/quiz/submit", json=QUIZ)
+    assert r.status_code == 200
+    body = r.json()
+    assert body["recommendation"]
+    assert body["products"]
+    assert 1 <= len(body["categories_searched"]) <= 3
+
+
+async def test_stream_sends_tokens_products_then_done(client, upstreams):
+    r = await client.post("/quiz/submit/stream", json=QUIZ, params={"fields": "code,name"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_events(r.text)
+    kinds = [kind for kind, _ in events]
+    assert kinds[-1] == "done"
+    assert "token" in kinds and "products" in kinds
+
+    text = "".join(payload["text"] for kind, payload in events if kind == "token")
+    assert text.startswith("Outfit:")
+    products = [p for kind, payload in events if kind == "products" for p in payload["products"]]
+    assert products and all(set(p) == {"code", "name"} for p in products)
+    assert len({p["code"] for p in products}) == len(products)
+    assert events[-1][1]["categories_searched"]
+
+    # The same quiz is answered from the recommendation cache without calling Gemini again
+    calls = upstreams.calls
+    r = await client.post("/quiz/submit/stream", json=QUIZ)
+    assert upstreams.calls == calls
+    assert "".join(p["text"] for kind, p in parse_events(r.text) if kind == "token") == text
+
+
+async def test_stream_reports_ai_failure(client, upstreams):
+    upstreams.error_rate = 1
+    r = await client.post("/quiz/submit/stream", json=QUIZ)
+    events = parse_events(r.text)
+
+    kinds = [kind for kind, _ in events]
+    assert "error" in kinds
+    assert kinds[-1] == "done"
+    # Products of the base listing are still sent
+    assert "products" in kinds
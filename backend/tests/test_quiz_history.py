@@ -0,0 +1,73 @@
+"""Write-behind saving of quiz results."""
+
+import pytest
+
+from services import quiz_history
+from services.quiz_history import WriteBehindBuffer
+from tests.test_quiz import QUIZ
+
+pytestmark = pytest.mark.anyio
+
+
+class Sink:
+    """A batch writer that can be made to fail."""
+
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+
+    async def __call__(self, batch):
+        if self.fail:
+            raise ConnectionError("database down")
+        self.batches.append(list(batch))
+        return len(batch)
+
+
+async def test_close_flushes_pending_documents():
+    sink = Sink()
+    buffer = WriteBehindBuffer("test", sink, batch_size=2, flush_interval=60)
+    buffer.start()
+    for i in range(5):
+        buffer.add({"n": i})
+
+    await buffer.close()
+
+    assert [[d["n"] for d in batch] for batch in sink.batches] == [[0, 1], [2, 3], [4]]
+    assert len(buffer) == 0
+
+
+async def test_failed_write_keeps_the_batch():
+    sink = Sink()
+    buffer = WriteBehindBuffer("test", sink, batch_size=10)
+    buffer.add({"n": 1})
+
+    sink.fail = True
+    assert not await buffer.flush()
+    assert len(buffer) == 1
+
+    sink.fail = False
+    assert await buffer.flush()
+    assert sink.batches == [[{"n": 1}]]
+
+
+async def test_full_buffer_drops_new_documents():
+    buffer = WriteBehindBuffer("test", Sink(), max_pending=2)
+    assert buffer.add({"n": 1}) and buffer.add({"n": 2})
+    assert not buffer.add({"n": 3})
+    assert len(buffer) == 2
+
+
+async def test_submitted_quiz_appears_in_history_after_stop(client, upstreams, signup):
+    headers = await signup("history@example.com")
+    quiz_history.start()
+    try:
+        submitted = (await client.post("/quiz/submit", json=QUIZ, headers=headers)).json()
+    finally:
+        await quiz_history.stop()
+
+    r = await client.get("/quiz/history", headers=headers)
+    (item,) = r.json()["items"]
+    assert item["quiz_answers"]["occasion"] == ["Work"]
+    assert item["recommendation"] == submitted["recommendation"]
+    assert item["categories_searched"] == submitted["categories_searched"]
+    assert [p["code"] for p in item["products"]] == [p["code"] for p in submitted["products"]]
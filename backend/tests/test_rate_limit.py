@@ -0,0 +1,49 @@
+"""Token buckets and the 429 admission dependency."""
+
+import pytest
+
+from api import quiz
+from services.rate_limit import MemoryBackend, RateLimiter, RateLimitExceeded
+from tests.test_quiz import QUIZ
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_exhausted_bucket_rejects_until_refilled():
+    limiter = RateLimiter("test", rate=1, burst=2, backend=MemoryBackend())
+    await limiter.acquire("a")
+    await limiter.acquire("a")
+    with pytest.raises(RateLimitExceeded) as e:
+        await limiter.acquire("a")
+    assert 0 < e.value.retry_after <= 1
+
+    # Buckets are per key
+    await limiter.acquire("b")
+
+
+async def test_acquire_queues_within_max_wait():
+    limiter = RateLimiter("test", rate=100, burst=1, max_wait=1, backend=MemoryBackend())
+    await limiter.acquire()
+    await limiter.acquire()  # waits about 10 ms for the next token
+
+
+async def test_disabled_limiter_admits_everything():
+    limiter = RateLimiter("test", rate=0, backend=MemoryBackend())
+    for _ in range(100):
+        await limiter.acquire()
+
+
+async def test_quiz_answers_429_when_client_is_over_budget(client, upstreams, signup, monkeypatch):
+    monkeypatch.setattr(quiz.quiz_limiter, "rate", 1 / 60)
+    monkeypatch.setattr(quiz.quiz_limiter, "burst", 1)
+    monkeypatch.setattr(quiz.quiz_limiter, "backend", MemoryBackend())
+
+    assert (await client.post("/quiz/submit", json=QUIZ)).status_code == 200
+    r = await client.post("/quiz/submit", json=QUIZ)
+    assert r.status_code == 429
+    assert 1 <= int(r.headers["Retry-After"]) <= 60
+
+    # Signed-in users have their own budget
+    headers = await signup("limits@example.com")
+    assert (await client.post("/quiz/submit", json=QUIZ, headers=headers)).status_code == 200
+    assert (await client.post("/quiz/submit/stream", json=QUIZ, headers=headers)).status_code == 429
@@ -0,0 +1,119 @@
+"""Circuit breaker and latency window."""
+
+import pytest
+
+from services import resilience
+from services.resilience import CircuitBreaker, CircuitOpenError, LatencyWindow, backoff_delay
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for the breaker."""
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.current_state() == CircuitBreaker.CLOSED
+
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.current_state() == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError) as e:
+        breaker.before_call()
+    assert e.value.retry_after == pytest.approx(10)
+
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10)
+    breaker.before_call()
+    breaker.record_failure()
+
+    clock[0] += 10
+    assert breaker.current_state() == CircuitBreaker.HALF_OPEN
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # A failed trial re-opens the circuit for another reset_timeout
+    breaker.record_failure(trial=True)
+    assert breaker.current_state() == CircuitBreaker.OPEN
+
+    clock[0] += 10
+    trial = breaker.before_call()
+    breaker.record_success(trial)
+    assert breaker.current_state() == CircuitBreaker.CLOSED
+    assert breaker.before_call() is False
+
+
+def test_late_call_does_not_free_the_trial_slot(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10)
+    late = breaker.before_call()  # admitted while closed, still running
+    breaker.before_call()
+    breaker.record_failure()
+
+    clock[0] += 10
+    assert breaker.before_call() is True
+    breaker.release(late)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_late_success_does_not_close_the_circuit(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10)
+    late = breaker.before_call()
+    breaker.before_call()
+    breaker.record_failure()
+
+    breaker.record_success(late)
+    assert breaker.current_state() == CircuitBreaker.OPEN
+
+    clock[0] += 10
+    assert breaker.before_call() is True
+    breaker.record_success(late)
+    assert breaker.current_state() == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_late_failure_does_not_extend_the_open_window(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10)
+    late = breaker.before_call()
+    breaker.before_call()
+    breaker.record_failure()
+
+    clock[0] += 6
+    breaker.record_failure(late)
+    clock[0] += 4
+    assert breaker.current_state() == CircuitBreaker.HALF_OPEN
+
+
+def test_disabled_breaker_never_opens():
+    breaker = CircuitBreaker("test", failure_threshold=0)
+    for _ in range(10):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.current_state() == CircuitBreaker.CLOSED
+
+
+def test_latency_window_percentile():
+    window = LatencyWindow(size=100, min_samples=10)
+    for i in range(9):
+        window.observe(i / 100)
+    assert window.percentile(95) is None
+    for i in range(9, 100):
+        window.observe(i / 100)
+    assert window.percentile(95) == pytest.approx(0.95)
+
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base=0.1, cap=1) <= min(1, 0.1 * 2 ** attempt)
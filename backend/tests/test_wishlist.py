@@ -0,0 +1,56 @@
+"""Wishlist routes against the in-memory database."""
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def item(code: str, name: str, price: str, image: str) -> dict:
+    return {"code": code, "name": name, "price": {"formattedValue": price}, "images": [{"url": image}]}
+
+
+async def test_add_and_list(client, signup):
+    headers = await signup("a@example.com")
+
+    r = await client.post("/wishlist", json=item("0001", "Shirt", "$10.00", "http://img/1"), headers=headers)
+    assert r.json() == {"message": "Item added to wishlist"}
+    r = await client.post("/wishlist", json=item("0001", "Shirt", "$10.00", "http://img/1"), headers=headers)
+    assert r.json() == {"message": "Item already in wishlist"}
+
+    r = await client.get("/wishlist", headers=headers)
+    assert [product["code"] for product in r.json()["items"]] == ["0001"]
+
+
+async def test_client_cannot_overwrite_shared_product(client, signup):
+    alice = await signup("alice@example.com")
+    bob = await signup("bob@example.com")
+    original = item("0002", "Linen blazer", "$79.99", "http://img/2")
+    forged = item("0002", "HACKED", "$0.01", "http://evil.example/x.png")
+
+    await client.post("/wishlist", json=original, headers=alice)
+    await client.post("/wishlist", json=forged, headers=bob)
+    await client.post("/wishlist/bulk", json={"items": [forged]}, headers=bob)
+
+    for headers in (alice, bob):
+        (product,) = (await client.get("/wishlist", headers=headers)).json()["items"]
+        assert product["name"] == "Linen blazer"
+        assert product["price"]["formattedValue"] == "$79.99"
+        assert product["images"][0]["url"] == "http://img/2"
+
+
+async def test_db_error_mid_cursor_is_an_error_response(client, signup, monkeypatch):
+    from pymongo.errors import ConnectionFailure
+    from services.repositories import WishlistRepository
+
+    headers = await signup("c@example.com")
+    await client.post("/wishlist", json=item("0003", "Skirt", "$20.00", "http://img/3"), headers=headers)
+
+    def iter_for_user(self, user_id):
+        async def rows():
+            yield {"product_code": "0003"}
+            raise ConnectionFailure("connection reset")
+        return rows()
+
+    monkeypatch.setattr(WishlistRepository, "iter_for_user", iter_for_user)
+    r = await client.get("/wishlist", headers=headers)
+    assert r.status_code == 503
@@ -2,9 +2,12 @@
 Authentication utilities: password hashing, JWT tokens, etc.
 """
 
+import asyncio
+import multiprocessing
 import os
+from concurrent.futures import Executor, ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from dotenv import load_dotenv
@@ -14,7 +17,27 @@ load_dotenv()
 # Password hashing
 # Use PBKDF2-SHA256 to avoid native bcrypt backend issues in some environments.
 # This provides secure hashing and does not require the optional `bcrypt` package.
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Hashes made with a different number of rounds are upgraded on the next login.
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "29000"))
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__min_rounds=PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__max_rounds=PASSWORD_HASH_ROUNDS,
+)
+
+# Hashing runs on a process pool so it neither holds the GIL nor blocks the
+# event loop. Set PASSWORD_HASH_WORKERS=0 to hash in a thread instead.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+# Hash jobs allowed in flight (running + queued) before new ones are shed
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+# Workers are started from a clean server process (or spawned where forkserver
+# is unavailable), never forked from the app: by then it runs the logging
+# thread and holds pool locks a forked child could inherit mid-use
+PASSWORD_HASH_START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
 
 # JWT settings
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -22,33 +45,90 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
 
-def hash_password(password: str) -> str:
-    """Hash a password."""
+def _truncate_password(password: Optional[str]) -> str:
+    """Truncate to 72 UTF-8 bytes, matching hashes created with the old bcrypt limit."""
     # bcrypt has a 72-byte input limit. Truncate the UTF-8 bytes to avoid errors
     # while preserving as much of the user's password as possible.
     if password is None:
         password = ""
     encoded = password.encode("utf-8")
     if len(encoded) > 72:
-        encoded = encoded[:72]
         # decode with ignore to avoid cutting a multi-byte char in half
-        safe_password = encoded.decode("utf-8", "ignore")
-    else:
-        safe_password = password
+        return encoded[:72].decode("utf-8", "ignore")
+    return password
 
-    return pwd_context.hash(safe_password)
+
+def hash_password(password: str) -> str:
+    """Hash a password."""
+    return pwd_context.hash(_truncate_password(password))
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash."""
-    if plain_password is None:
-        plain_password = ""
-    encoded = plain_password.encode("utf-8")
-    if len(encoded) > 72:
-        encoded = encoded[:72]
-        plain_password = encoded.decode("utf-8", "ignore")
+    return pwd_context.verify(_truncate_password(plain_password), hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password and rehash it if it was hashed with outdated settings.
+
+    Returns:
+        Tuple of (valid, new_hash); new_hash is None unless a rehash is needed
+    """
+    return pwd_context.verify_and_update(_truncate_password(plain_password), hashed_password)
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised when PASSWORD_HASH_MAX_PENDING hash jobs are already in flight."""
+
+
+_hash_executor: Optional[Executor] = None
+_hash_pending = 0
+
+
+def start_hash_pool() -> None:
+    """Start the password hashing process pool (no-op when workers are disabled)."""
+    global _hash_executor
+    if _hash_executor is None and PASSWORD_HASH_WORKERS > 0:
+        _hash_executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context(PASSWORD_HASH_START_METHOD),
+        )
+
+
+def shutdown_hash_pool() -> None:
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False, cancel_futures=True)
+        _hash_executor = None
+
+
+async def _run_hash_job(func, *args):
+    """Run a hashing function off the event loop, shedding load when saturated."""
+    global _hash_pending
+    if _hash_pending >= PASSWORD_HASH_MAX_PENDING:
+        raise PasswordHasherBusy("Too many password hashing jobs in flight")
+
+    _hash_pending += 1
+    try:
+        if PASSWORD_HASH_WORKERS <= 0:
+            return await asyncio.to_thread(func, *args)
+        start_hash_pool()
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the hashing pool."""
+    return await _run_hash_job(hash_password, password)
+
 
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """``verify_and_update_password`` on the hashing pool."""
+    return await _run_hash_job(verify_and_update_password, plain_password, hashed_password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
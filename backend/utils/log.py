@@ -0,0 +1,181 @@
+"""
+Logging setup: structured (JSON) records, request IDs and non-blocking output.
+
+Modules log through ``logging.getLogger(__name__)``. ``setup_logging`` puts a
+``QueueHandler`` on the root logger, so callers only format the record and
+enqueue it; a ``QueueListener`` thread writes to stdout, keeping stream I/O
+off the event loop. Threads don't survive a fork, so the app calls it from
+its lifespan (once per worker process) and stops it with
+``shutdown_logging`` on shutdown.
+
+``RequestIdMiddleware`` tags every record logged while handling a request
+with its ``X-Request-ID`` (generated when the client doesn't send one).
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Root level, output format ("json" or "text") and per-module overrides,
+# e.g. LOG_LEVELS="services.hm_client=DEBUG,api.quiz=WARNING"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# Fraction of DEBUG payload dumps (quiz input, AI results) that are actually logged
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+
+REQUEST_ID_HEADER = "x-request-id"
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed via ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[QueueListener] = None
+# Process that started ``_listener``; a forked child must start its own
+_listener_pid: Optional[int] = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Attach the current request ID to each record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including request ID and ``extra`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def parse_levels(spec: str) -> dict:
+    """Parse ``"module=LEVEL,module=LEVEL"`` into a dict, ignoring malformed parts."""
+    levels = {}
+    for part in spec.split(","):
+        name, _, level = part.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, module_levels: str = LOG_LEVELS) -> QueueListener:
+    """
+    Route all logging through a queue to a background stdout writer.
+
+    Safe to call more than once per process; later calls return the running
+    listener. In a process forked after setup, the inherited listener has no
+    thread, so handlers and listener are installed afresh.
+
+    Returns:
+        The started listener (stop it with ``shutdown_logging``)
+    """
+    global _listener, _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        return _listener
+
+    if fmt == "json":
+        formatter: logging.Formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    # Records are formatted by the caller (request ID and extras are
+    # captured in context) and only written by the listener thread
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.setFormatter(formatter)
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+    for name, module_level in parse_levels(module_levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    _listener_pid = os.getpid()
+    # Scripts that never call shutdown_logging still get their last records written
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread (no-op if this process didn't start it)."""
+    global _listener, _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None
+    _listener_pid = None
+
+
+def log_payload(logger: logging.Logger, message: str, payload: Any, sample_rate: float = LOG_PAYLOAD_SAMPLE_RATE) -> None:
+    """Log a large payload at DEBUG for a random ``sample_rate`` share of calls."""
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < sample_rate:
+        logger.debug(message, extra={"payload": payload})
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware binding a request ID to the logging context.
+
+    Uses the incoming ``X-Request-ID`` header when present and echoes the ID
+    back on the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (REQUEST_ID_HEADER.encode(), request_id.encode())]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,257 @@
+"""
+Prometheus metrics for the API and its upstreams.
+
+``MetricsMiddleware`` records request duration per route template, method
+and status, plus the number of requests in flight. Upstream calls are timed
+with ``track_upstream`` (Gemini, H&M) or, for MongoDB, by the driver event
+listeners in ``mongo_listeners``, which also maintain connection-pool gauges.
+
+Everything is exported in the Prometheus text format by ``render_metrics``
+(served on ``/metrics``). Metrics live in the process, so with several
+uvicorn workers each worker is scraped separately.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+
+# Buckets in seconds: sub-millisecond cache hits up to Gemini's slowest answers
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle an HTTP request, including streamed bodies",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being handled")
+
+GEMINI_REQUEST_DURATION = Histogram(
+    "gemini_request_duration_seconds",
+    "Duration of Gemini calls (after a generation slot was acquired)",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+GEMINI_ERRORS = Counter("gemini_errors_total", "Failed Gemini calls", ["operation", "error"])
+GEMINI_TOKENS = Histogram(
+    "gemini_tokens",
+    "Tokens per Gemini call, by kind (prompt, response)",
+    ["operation", "kind"],
+    buckets=(16, 32, 64, 128, 256, 512, 1024, 2048, 4096),
+)
+
+HM_REQUEST_DURATION = Histogram(
+    "hm_request_duration_seconds",
+    "Duration of H&M API requests",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+HM_ERRORS = Counter("hm_errors_total", "Failed H&M API requests", ["endpoint", "error"])
+HM_RETRIES = Counter("hm_retries_total", "H&M API requests retried after a transient error", ["endpoint", "error"])
+HM_HEDGES = Counter(
+    "hm_hedged_requests_total",
+    "Hedged H&M API requests: sent (duplicate of a slow request), won (answered first)",
+    ["endpoint", "outcome"],
+)
+HM_FALLBACKS = Counter(
+    "hm_fallbacks_total",
+    "H&M listings served from the last good cached copy because the API failed",
+    ["reason"],
+)
+
+CIRCUIT_BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state: 0 closed, 1 half-open, 2 open",
+    ["breaker"],
+)
+
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds",
+    "Duration of MongoDB commands",
+    ["command", "collection"],
+    buckets=MONGO_BUCKETS,
+)
+MONGO_ERRORS = Counter("mongo_errors_total", "Failed MongoDB commands", ["command", "collection", "error"])
+
+UPSTREAM_IN_FLIGHT = Gauge("upstream_requests_in_flight", "Upstream calls currently in progress", ["upstream"])
+POOL_CONNECTIONS = Gauge(
+    "pool_connections",
+    "Connection pool usage: open and in-use connections, and the configured maximum",
+    ["pool", "state"],
+)
+
+RATE_LIMIT_DECISIONS = Counter(
+    "rate_limit_decisions_total",
+    "Rate limiter decisions: allowed at once, queued until a token was free, or rejected",
+    ["limiter", "outcome"],
+)
+
+WRITE_BUFFER_PENDING = Gauge("write_buffer_pending", "Documents waiting in a write-behind buffer", ["buffer"])
+WRITE_BUFFER_FLUSHES = Counter(
+    "write_buffer_flushes_total",
+    "Write-behind buffer flushes by outcome (ok, failed)",
+    ["buffer", "outcome"],
+)
+WRITE_BUFFER_DOCUMENTS = Counter(
+    "write_buffer_documents_total",
+    "Documents leaving a write-behind buffer: written, or dropped because the buffer was full",
+    ["buffer", "outcome"],
+)
+
+# Label for requests that matched no route, so unknown paths can't blow up cardinality
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def error_label(exc: BaseException) -> str:
+    """``http_<status>`` for HTTP errors, otherwise the exception class name."""
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return f"http_{status}"
+    return type(exc).__name__
+
+
+@contextmanager
+def track_upstream(upstream: str, histogram: Histogram, errors: Counter, **labels: str) -> Iterator[None]:
+    """
+    Time the enclosed upstream call and count it as an error if it raises.
+
+    Args:
+        upstream: Upstream name for the in-flight gauge ("gemini", "hm")
+        histogram: Duration histogram, labelled with ``labels``
+        errors: Error counter, labelled with ``labels`` plus ``error``
+    """
+    in_flight = UPSTREAM_IN_FLIGHT.labels(upstream)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as exc:
+        errors.labels(**labels, error=error_label(exc)).inc()
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+        in_flight.dec()
+
+
+def set_pool_limit(pool: str, max_connections: int) -> None:
+    """Publish a pool's configured maximum next to its usage."""
+    POOL_CONNECTIONS.labels(pool, "max").set(max_connections)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """The current metrics in the Prometheus text format, with its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing each HTTP request.
+
+    Requests are labelled with the matched route template (``/wishlist/{code}``),
+    not the raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"], getattr(route, "path", UNMATCHED_ROUTE), str(status)
+            ).observe(time.perf_counter() - start)
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+
+
+class _CommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command, labelled by command and collection."""
+
+    def __init__(self):
+        # (connection, request id) -> collection name, between started and finished events
+        self._collections = {}
+
+    def _finish(self, event) -> Tuple[str, str]:
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_DURATION.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+        return event.command_name, collection
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        target = event.command.get(event.command_name)
+        collection = target if isinstance(target, str) else ""
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        command, collection = self._finish(event)
+        code = event.failure.get("codeName") or event.failure.get("code") or "error"
+        MONGO_ERRORS.labels(command, collection, str(code)).inc()
+
+
+class _PoolMetrics(monitoring.ConnectionPoolListener):
+    """Tracks open and checked-out connections across the Mongo pools."""
+
+    def __init__(self):
+        self.open = POOL_CONNECTIONS.labels("mongo", "open")
+        self.in_use = POOL_CONNECTIONS.labels("mongo", "in_use")
+
+    def connection_created(self, event) -> None:
+        self.open.inc()
+
+    def connection_closed(self, event) -> None:
+        self.open.dec()
+
+    def connection_checked_out(self, event) -> None:
+        self.in_use.inc()
+
+    def connection_checked_in(self, event) -> None:
+        self.in_use.dec()
+
+    # Remaining events don't change the gauges
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_check_out_started(self, event) -> None:
+        pass
+
+    def connection_check_out_failed(self, event) -> None:
+        pass
+
+
+def mongo_listeners(max_pool_size: Optional[int] = None) -> list:
+    """Event listeners to pass to ``AsyncMongoClient(event_listeners=...)``."""
+    if max_pool_size is not None:
+        set_pool_limit("mongo", max_pool_size)
+    return [_CommandMetrics(), _PoolMetrics()]